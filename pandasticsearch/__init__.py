@@ -3,6 +3,6 @@ from __future__ import absolute_import
 from pandasticsearch.dataframe import DataFrame, Column
 from pandasticsearch.client import RestClient
 from pandasticsearch.queries import Select, Agg
-from pandasticsearch.types import Row
+from pandasticsearch.types import Row, RowSet
 
 col = Column
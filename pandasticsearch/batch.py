@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+
+import collections
+import json
+
+import six
+
+from pandasticsearch.errors import DataFrameException
+from pandasticsearch.queries import Agg
+from pandasticsearch.types import RowSet
+
+
+class Batch(object):
+    """
+    Defers the aggregations of a :class:`DataFrame <pandasticsearch.DataFrame>` so that they are executed
+    together: the aggregations sent to the same indexes with the same query are merged into a single request.
+    The batch is executed when the ``with`` block exits, or when :meth:`execute` is called.
+
+    >>> with df.filter(df.age > 10).batch() as b:
+    ...     avg = b.agg(df.age.avg)
+    ...     counts = b.groupby(df.gender).count()
+    ...     ranges = b.add(df.filter(df.age > 10).groupby(df.age.ranges([10, 15, 20])).count())
+    >>> avg.collect()
+    [Row(avg(age)=12)]
+    """
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def agg(self, *aggs):
+        """
+        Defers the aggregation of the whole DataFrame of the batch, see :meth:`DataFrame.agg`.
+
+        :return: :class:`BatchResult`
+        """
+        return self.add(self._frame.agg(*aggs))
+
+    def groupby(self, *cols):
+        """
+        Groups the DataFrame of the batch, see :meth:`DataFrame.groupby`.
+        The aggregation or count of the groups is deferred.
+
+        >>> counts = b.groupby(df.gender).count()
+        """
+        return _GroupedBatch(self, self._frame.groupby(*cols))
+
+    def add(self, frame):
+        """
+        Defers the aggregation of any DataFrame.
+
+        :param frame: A :class:`DataFrame <pandasticsearch.DataFrame>` holding an aggregation or groups
+        :return: :class:`BatchResult`
+        """
+        if not frame._aggregation and not frame._groupby:
+            raise DataFrameException('Only aggregations can be batched')
+        result = BatchResult(frame)
+        self._results.append(result)
+        return result
+
+    def execute(self):
+        """
+        Executes the deferred aggregations, merging those sharing indexes and query into one request.
+        """
+        requests = collections.OrderedDict()
+        for result in self._results:
+            frame = result._frame
+            if frame._fanout:
+                # the results of each index are merged on the client
+                result._agg = frame._execute()
+                continue
+            query = frame._build_query()
+            aggregations = query.pop('aggregations')
+            key = (frame._search_client().endpoint,
+                   json.dumps(frame._search_params(), sort_keys=True),
+                   json.dumps(query, sort_keys=True))
+            requests.setdefault(key, (frame, query, []))[2].append((result, aggregations))
+
+        for frame, query, members in six.itervalues(requests):
+            merged = {}
+            for i, (_, aggregations) in enumerate(members):
+                for name, agg in six.iteritems(aggregations):
+                    merged[Batch._name(i, name)] = agg
+            res_dict = frame._search(dict(query, aggregations=merged))
+            for i, (result, aggregations) in enumerate(members):
+                result._agg = Agg.from_dict({
+                    'took': res_dict['took'],
+                    'aggregations': dict((name, res_dict['aggregations'][Batch._name(i, name)])
+                                         for name in aggregations)
+                })
+        self._results = []
+
+    @staticmethod
+    def _name(i, name):
+        return '_batch{0}_{1}'.format(i, name)
+
+
+class _GroupedBatch(object):
+    def __init__(self, batch, frame):
+        self._batch = batch
+        self._frame = frame
+
+    def agg(self, *aggs):
+        return self._batch.add(self._frame.agg(*aggs))
+
+    def count(self):
+        return self._batch.add(self._frame.count())
+
+
+class BatchResult(object):
+    """
+    The result of an aggregation deferred by a :class:`Batch`, available once the batch is executed.
+    """
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._agg = None
+
+    @property
+    def result(self):
+        """
+        Returns the :class:`Agg <pandasticsearch.queries.Agg>` result.
+        """
+        if self._agg is None:
+            raise DataFrameException('The batch has not been executed yet')
+        return self._agg
+
+    def collect(self):
+        """
+        Returns the rows of the aggregation, see :meth:`DataFrame.collect`.
+
+        :return: :class:`RowSet <pandasticsearch.types.RowSet>`
+        """
+        return RowSet.from_dicts(self.result.result)
+
+    def to_pandas(self):
+        """
+        Exports the aggregation to a Pandas DataFrame object.
+        """
+        return self.result.to_pandas()
@@ -0,0 +1,685 @@
+# -*- coding: UTF-8 -*-
+
+import collections
+import datetime
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+
+import six
+
+from pandasticsearch.errors import NoSuchDependencyException
+from pandasticsearch.indices import parse_date
+from pandasticsearch.operators import _bool_occurs
+
+_suffix = '.arrow'
+# field types whose values are matched by their analyzed tokens, which the local backend cannot do
+_analyzed_types = ('text', 'match_only_text', 'annotated_text', 'search_as_you_type', 'completion')
+
+
+class ResultCache(object):
+    """
+    A persistent cache of query results in a local directory, shared by the DataFrames given it
+    and by the processes using the same directory.
+
+    Each result is stored as a Pandas DataFrame in an Arrow IPC file, read back through memory mapping.
+    Once the files take more than ``max_bytes``, the least recently read ones are evicted.
+
+    >>> from pandasticsearch.cache import ResultCache
+    >>> df = DataFrame.from_es('http://localhost:9200', index='people', cache=ResultCache('/tmp/es-cache'))
+    >>> df.to_pandas()  # hits the cluster
+    >>> df.to_pandas()  # read from the cache, unless the index changed in the meantime
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        """
+        :param str directory: The directory of the cache files, created if it does not exist
+        :param int max_bytes: The maximum total size of the cache files
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pyarrow library')
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def fingerprint(obj):
+        """
+        Returns the key of a JSON-like object, e.g. a query along with the state it depends on.
+        """
+        dumped = json.dumps(obj, sort_keys=True, default=str)
+        return hashlib.sha1(dumped.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _suffix)
+
+    def get(self, key):
+        """
+        Returns the Pandas DataFrame cached under ``key``, or ``None``.
+        """
+        import pyarrow
+
+        path = self._path(key)
+        try:
+            # the columns read may still point into the map, which is released along with them
+            source = pyarrow.memory_map(path, 'r')
+            frame = pyarrow.ipc.open_file(source).read_all().to_pandas()
+        except (IOError, OSError, pyarrow.ArrowException):
+            return None
+        try:
+            # the modification time orders the files for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return frame
+
+    def put(self, key, frame):
+        """
+        Caches a Pandas DataFrame under ``key``, then evicts the least recently used results beyond the size limit.
+
+        :return: whether the DataFrame could be stored, the columns of arbitrary objects being rejected by Arrow
+        """
+        import pyarrow
+
+        try:
+            table = pyarrow.Table.from_pandas(frame)
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            return False
+
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as sink:
+                writer = pyarrow.ipc.new_file(sink, table.schema)
+                writer.write_table(table)
+                writer.close()
+            # readers never see a partial file
+            os.rename(tmp, self._path(key))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self._evict()
+        return True
+
+    def clear(self):
+        """
+        Removes all the cached results.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(_suffix):
+                os.remove(os.path.join(self.directory, name))
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class ContainmentCache(object):
+    """
+    An in-memory cache of the complete results of searches, answering the narrower searches locally:
+    when the filter of a DataFrame implies the filter of a cached result which holds all the columns it needs,
+    the remaining filter, projection, sort and limit are evaluated on the cached documents by a
+    :class:`LocalClient <pandasticsearch.local.LocalClient>` instead of the cluster.
+
+    A filter implies a cached one when each clause in AND position of the cached filter is implied by a clause
+    of the new one: the same clause, a narrower range on the same field, a ``term`` among the values of a
+    ``terms``, or a longer prefix. Only the results holding all the matching documents are cached, and only
+    for ``ttl`` seconds, since the documents indexed meanwhile are not seen.
+
+    >>> from pandasticsearch.cache import ContainmentCache
+    >>> df = DataFrame.from_es('http://localhost:9200', index='logs', containment_cache=ContainmentCache())
+    >>> df.filter(df.day == '2026-10-15').limit(10000).collect()                 # hits the cluster
+    >>> df.filter((df.day == '2026-10-15') & (df.status == 500)).collect()      # evaluated on the documents of the day
+    """
+
+    def __init__(self, max_entries=16, ttl=300):
+        """
+        :param int max_entries: The maximum number of results kept, the least recently used ones being evicted
+        :param float ttl: The number of seconds a result is used for
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+
+    def clear(self):
+        """
+        Removes all the cached results.
+        """
+        self._entries.clear()
+
+    @staticmethod
+    def _scope(frame):
+        if frame._fanout or frame._sample or frame._derived or frame._aggregation or frame._groupby:
+            return None
+        # the routing and the indexes searched only depend on the filter
+        return frame._client.url, frame._client.endpoint
+
+    def put(self, frame, query, res_dict):
+        """
+        Caches the result of the search of a DataFrame if it holds all the documents matching its filter.
+        """
+        scope = ContainmentCache._scope(frame)
+        if scope is None or 'collapse' in query or _relative(frame._filter):
+            # date math relative to now matches other documents as time goes by
+            return
+        hits = res_dict['hits']['hits']
+        total = res_dict['hits'].get('total', None)
+        if isinstance(total, dict):
+            complete = total.get('relation', 'eq') == 'eq' and len(hits) >= total['value']
+        elif total is not None:
+            complete = len(hits) >= total
+        else:
+            complete = len(hits) < query.get('size', 10)
+        if not complete:
+            return
+
+        clauses = list(_conjuncts(frame._filter)) if frame._filter else []
+        entry = {'scope': scope,
+                 'clauses': clauses,
+                 'columns': frame._projected_columns(),
+                 'types': frame._get_field_types(frame._mapping),
+                 'analyzed': _analyzed_fields(frame._mapping),
+                 'hits': hits,
+                 'client': None,
+                 'time': time.time()}
+        key = json.dumps([scope, clauses, entry['columns']], sort_keys=True, default=str)
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def answer(self, frame, query):
+        """
+        Returns the result of the search of a DataFrame evaluated on a cached result which contains it,
+        or ``None``.
+
+        :return: the search result as a dictionary
+        """
+        scope = ContainmentCache._scope(frame)
+        if scope is None:
+            return None
+        clauses = list(_conjuncts(frame._filter)) if frame._filter else []
+        needed = set(frame._projected_columns())
+        for spec in query.get('sort', []):
+            field = spec if isinstance(spec, six.string_types) else list(spec)[0]
+            if field not in ('_score', '_doc'):
+                needed.add(field)
+
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry['time'] > self.ttl:
+                del self._entries[key]
+                continue
+            if entry['scope'] != scope or not needed <= set(entry['columns']):
+                continue
+            if not all(any(_implies(c, cached) for c in clauses) for cached in entry['clauses']):
+                continue
+            residual = [c for c in clauses if c not in entry['clauses']]
+            fields = set()
+            if not all(_fields(c, fields) for c in residual) or not fields <= set(entry['columns']) | {'_id'}:
+                continue
+            if fields & entry['analyzed']:
+                # the cluster matches the analyzed tokens, not the values
+                continue
+
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self.hits += 1
+            local = dict((k, v) for k, v in six.iteritems(query) if k != 'query')
+            if residual:
+                local['query'] = {'bool': {'filter': residual}}
+            return ContainmentCache._evaluate(entry, local)
+        return None
+
+    @staticmethod
+    def _evaluate(entry, query):
+        import pandas
+        from pandasticsearch.local import LocalClient
+
+        if entry['client'] is None:
+            hits = entry['hits']
+            documents = pandas.DataFrame([hit.get('_source', {}) for hit in hits], columns=entry['columns'],
+                                         index=[hit.get('_id') for hit in hits])
+            mapping = dict((c, {'type': entry['types'].get(c, 'object')}) for c in entry['columns'])
+            entry['client'] = LocalClient(documents, mapping)
+            entry['indexes'] = dict((hit.get('_id'), hit.get('_index')) for hit in hits)
+
+        res_dict = entry['client'].post(query)
+        for hit in res_dict['hits']['hits']:
+            hit['_index'] = entry['indexes'].get(hit['_id'])
+        return res_dict
+
+
+def _conjuncts(filter):
+    """
+    Yields the clauses whose conjunction is equivalent to ``filter``: the clauses in AND position,
+    and the ``should`` or ``must_not`` parts of the bool queries as clauses of their own.
+    """
+    if 'bool' in filter:
+        body = filter['bool']
+    elif set(filter) <= set(_bool_occurs + ('minimum_should_match',)):
+        body = filter
+    else:
+        yield filter
+        return
+    rest = dict((k, v) for k, v in six.iteritems(body) if k in ('should', 'must_not', 'minimum_should_match'))
+    if rest:
+        yield {'bool': rest}
+    for occur in ('must', 'filter'):
+        clauses = body.get(occur, [])
+        for clause in clauses if isinstance(clauses, list) else [clauses]:
+            for leaf in _conjuncts(clause):
+                yield leaf
+
+
+def _relative(node):
+    if isinstance(node, dict):
+        return any(_relative(v) for v in six.itervalues(node))
+    if isinstance(node, list):
+        return any(_relative(v) for v in node)
+    return isinstance(node, six.string_types) and node.startswith('now')
+
+
+def _analyzed_fields(mapping):
+    """
+    Returns the fields of a mapping whose values are analyzed or normalized before being matched.
+    """
+    analyzed = set()
+    index = list(mapping.values())[0]
+    for _, properties in six.iteritems(index['mappings']):
+        for name, spec in six.iteritems(properties.get('properties', {})):
+            if spec.get('type') in _analyzed_types or 'normalizer' in spec:
+                analyzed.add(name)
+            elif spec.get('type') == 'string' and spec.get('index') != 'not_analyzed':
+                # the strings of ES 2 are analyzed by default
+                analyzed.add(name)
+    return analyzed
+
+
+def _fields(clause, fields):
+    """
+    Collects the fields a clause is evaluated on into ``fields``.
+
+    :return: whether the clause can be evaluated locally
+    """
+    kind, params = list(clause.items())[0] if len(clause) == 1 else (None, clause)
+    if kind is None or kind == 'bool':
+        body = params
+        for occur in _bool_occurs:
+            clauses = body.get(occur, [])
+            for c in clauses if isinstance(clauses, list) else [clauses]:
+                if not _fields(c, fields):
+                    return False
+        return True
+    if kind in ('exists', 'missing'):
+        fields.add(params['field'])
+    elif kind == 'ids':
+        fields.add('_id')
+    elif kind in ('term', 'terms', 'range', 'prefix', 'wildcard', 'regexp'):
+        fields.update(params)
+    elif kind not in ('match_all', 'match_none'):
+        return False
+    return True
+
+
+def _implies(clause, cached):
+    """
+    Returns whether the documents matching ``clause`` all match ``cached``.
+    """
+    if clause == cached:
+        return True
+    if len(clause) != 1 or len(cached) != 1:
+        return False
+    (kind, params), (cached_kind, cached_params) = list(clause.items())[0], list(cached.items())[0]
+    if len(params) != 1 or len(cached_params) != 1 or list(params) != list(cached_params):
+        return False
+    value, cached_value = list(params.values())[0], list(cached_params.values())[0]
+
+    if cached_kind == 'terms' and kind in ('term', 'terms'):
+        values = value if kind == 'terms' else [value]
+        return isinstance(values, list) and all(v in cached_value for v in values)
+    if cached_kind == 'prefix' and kind == 'prefix':
+        return isinstance(value, six.string_types) and value.startswith(cached_value)
+    if cached_kind == 'range' and kind in ('range', 'term'):
+        bounds = value if kind == 'range' else {'gte': value, 'lte': value}
+        return _within(bounds, cached_value)
+    return False
+
+
+def _within(bounds, cached):
+    for op, cached_bound in six.iteritems(cached):
+        if op in ('gt', 'gte'):
+            candidates = [(o, v) for o, v in six.iteritems(bounds) if o in ('gt', 'gte')]
+        elif op in ('lt', 'lte'):
+            candidates = [(o, v) for o, v in six.iteritems(bounds) if o in ('lt', 'lte')]
+        else:
+            # formats and time zones change the meaning of the bounds
+            return False
+        if not any(_tighter(o, v, op, cached_bound) for o, v in candidates):
+            return False
+    return all(o in ('gt', 'gte', 'lt', 'lte') for o in bounds)
+
+
+def _tighter(op, value, cached_op, cached_value):
+    value, cached_value = _comparable(value), _comparable(cached_value)
+    try:
+        if value == cached_value:
+            return op == cached_op or op in ('gt', 'lt')
+        return value > cached_value if cached_op in ('gt', 'gte') else value < cached_value
+    except TypeError:
+        return False
+
+
+def _comparable(value):
+    if isinstance(value, six.string_types):
+        date = parse_date(value)
+        return date if date is not None else value
+    return value
+
+
+_rollup_buckets = ('terms', 'date_histogram', 'histogram', 'range')
+_rollup_metrics = ('sum', 'value_count', 'min', 'max', 'stats', 'extended_stats', 'percentiles')
+_calendar_order = ('minute', 'hour', 'day', 'week', 'month', 'quarter', 'year')
+_calendar_millis = {'minute': 60 * 1000, 'hour': 3600 * 1000, 'day': 24 * 3600 * 1000}
+
+
+class RollupCache(object):
+    """
+    An in-memory cache of aggregations, answering the coarser aggregations of the same documents locally:
+    a groupby on some of the columns a cached aggregation was grouped by, or on a coarser date interval,
+    is re-aggregated from the cached buckets instead of being sent to the cluster.
+
+    The aggregations of the DataFrames sharing the cache are requested in the mergeable form of
+    :meth:`Agg.mergeable <pandasticsearch.queries.Agg.mergeable>` (averages as ``stats``), whose buckets are
+    then merged by :meth:`Agg.merge <pandasticsearch.queries.Agg.merge>`; the aggregations with distinct counts
+    are neither rewritten nor cached. Along with each level of buckets, the values of its field and the documents
+    missing it are counted: a cached aggregation is only rolled up into other groups when its fields have a single
+    value in each document, which falls in exactly one bucket. Aggregations are cached for ``ttl`` seconds.
+
+    >>> from pandasticsearch.cache import RollupCache
+    >>> df = DataFrame.from_es('http://localhost:9200', index='logs', rollup_cache=RollupCache())
+    >>> df.groupby(df.service, df.host).agg(df.latency.avg).to_pandas()             # hits the cluster
+    >>> df.groupby(df.host).agg(df.latency.avg).to_pandas()                         # rolled up
+    >>> df.groupby(df.ts.date_interval('1m')).agg(df.latency.max).to_pandas()       # hits the cluster
+    >>> df.groupby(df.ts.date_interval('1h')).agg(df.latency.max).to_pandas()       # rolled up
+    """
+
+    def __init__(self, max_entries=16, ttl=300):
+        """
+        :param int max_entries: The maximum number of aggregations kept, the least recently used ones being evicted
+        :param float ttl: The number of seconds an aggregation is used for
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+
+    def clear(self):
+        """
+        Removes all the cached aggregations.
+        """
+        self._entries.clear()
+
+    @staticmethod
+    def _scope(frame):
+        client = frame._client
+        return json.dumps([client.url, client.endpoint, frame._filter], sort_keys=True, default=str)
+
+    @staticmethod
+    def instrument(aggregations):
+        """
+        Returns the mergeable aggregations to request, along with the counts :meth:`put` checks
+        the buckets against: the values of the field of each level, and the documents missing it.
+        """
+        rewritten = {}
+        for name, body in six.iteritems(aggregations):
+            agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+            if agg_type in _rollup_buckets:
+                body = dict(body)
+                if 'aggregations' in body:
+                    body['aggregations'] = RollupCache.instrument(body['aggregations'])
+                field = body[agg_type]['field']
+                rewritten[_values_name(name)] = {'value_count': {'field': field}}
+                rewritten[_missing_name(name)] = {'missing': {'field': field}}
+            rewritten[name] = body
+        return rewritten
+
+    @staticmethod
+    def eligible(frame, aggregations):
+        """
+        Returns whether the mergeable aggregations of a DataFrame can be cached and rolled up.
+        """
+        # date math relative to now matches other documents as time goes by
+        return not frame._fanout and not frame._sample and not _relative(frame._filter) and \
+            _levels(aggregations) is not None
+
+    def put(self, frame, aggregations, res_dict):
+        """
+        Caches the result of mergeable aggregations of a DataFrame, requested as :meth:`instrument` returns them.
+        """
+        levels, metrics = _levels(aggregations)
+        total = res_dict.get('hits', {}).get('total', None)
+        if isinstance(total, dict):
+            total = total['value'] if total.get('relation', 'eq') == 'eq' else None
+
+        rows = []
+        partition = [True] * len(levels)
+
+        def walk(node, depth, keys):
+            if depth == len(levels):
+                rows.append((tuple(keys), node.get('doc_count', total),
+                             dict((name, node[name]) for name in metrics if name in node)))
+                return
+            level = levels[depth]
+            buckets = node[level['name']]['buckets']
+            parent = node.get('doc_count', total)
+            values = node.get(_values_name(level['name']), {}).get('value')
+            missing = node.get(_missing_name(level['name']), {}).get('doc_count')
+            # a single value per document, in exactly one of the (non-overlapping) buckets
+            if parent is None or missing != 0 or values != parent or \
+                    sum(b['doc_count'] for b in buckets) != parent or _overlapping(level):
+                partition[depth] = False
+            for bucket in buckets:
+                key = dict((k, bucket[k]) for k in ('key', 'key_as_string', 'from', 'to') if k in bucket)
+                walk(bucket, depth + 1, keys + [key])
+
+        walk(res_dict.get('aggregations', {}), 0, [])
+        key = json.dumps([RollupCache._scope(frame), aggregations], sort_keys=True, default=str)
+        self._entries.pop(key, None)
+        self._entries[key] = {'scope': RollupCache._scope(frame), 'levels': levels, 'metrics': metrics,
+                              'partition': all(partition), 'rows': rows, 'took': res_dict.get('took', 0),
+                              'time': time.time()}
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def answer(self, frame, aggregations):
+        """
+        Returns the results re-aggregating a cached aggregation into the mergeable ``aggregations`` of
+        a DataFrame, to be merged by :meth:`Agg.merge <pandasticsearch.queries.Agg.merge>`, or ``None``.
+        """
+        levels, metrics = _levels(aggregations)
+        scope = RollupCache._scope(frame)
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry['time'] > self.ttl:
+                del self._entries[key]
+                continue
+            if entry['scope'] != scope:
+                continue
+            if any(entry['metrics'].get(name) != body for name, body in six.iteritems(metrics)):
+                continue
+            mapping = _map_levels(levels, entry['levels'], entry['partition'])
+            if mapping is None:
+                continue
+
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self.hits += 1
+            return RollupCache._parts(entry, levels, metrics, mapping)
+        return None
+
+    @staticmethod
+    def _parts(entry, levels, metrics, mapping):
+        parts = []
+        for keys, doc_count, results in entry['rows']:
+            rolled = [_roll_key(level, entry['levels'][i], keys[i]) for level, i in zip(levels, mapping)]
+            content = dict((name, results[name]) for name in metrics if name in results)
+            for level, key in reversed(list(zip(levels, rolled))):
+                bucket = dict(key, doc_count=doc_count)
+                bucket.update(content)
+                content = {level['name']: {'buckets': [bucket]}}
+            order = tuple(_key_order(level, key) for level, key in zip(levels, rolled))
+            parts.append((order, {'took': entry['took'], 'aggregations': content}))
+        # buckets tied by count are then ranked by key, as by Elasticsearch
+        parts.sort(key=lambda part: part[0])
+        return [part for _, part in parts]
+
+
+def _values_name(name):
+    return '{0}#values'.format(name)
+
+
+def _missing_name(name):
+    return '{0}#missing'.format(name)
+
+
+def _overlapping(level):
+    if level['type'] != 'range':
+        return False
+    ranges = level['params']['ranges']
+    return any(a.get('to') is None or b.get('from') is None or a['to'] > b['from']
+               for a, b in zip(ranges, ranges[1:]))
+
+
+def _levels(aggregations):
+    """
+    Splits nested aggregations into their bucket levels and the metrics of the innermost buckets,
+    or returns ``None`` when they cannot be rolled up.
+    """
+    levels = []
+    while len(aggregations) == 1:
+        name, body = list(aggregations.items())[0]
+        agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+        if agg_type not in _rollup_buckets:
+            break
+        params = body[agg_type]
+        if any(k in params for k in ('script', 'order', 'time_zone', 'offset', 'missing', 'min_doc_count',
+                                     'extended_bounds', 'hard_bounds')):
+            return None
+        levels.append({'name': name, 'type': agg_type, 'params': params})
+        aggregations = body.get('aggregations', body.get('aggs', {}))
+
+    for body in six.itervalues(aggregations):
+        agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+        if agg_type not in _rollup_metrics or 'aggregations' in body or 'aggs' in body:
+            return None
+    return levels, aggregations
+
+
+def _map_levels(levels, cached, partition):
+    """
+    Returns the index of the cached level each level is computed from, or ``None``.
+    """
+    if [(l['type'], l['params']) for l in levels] == [(l['type'], l['params']) for l in cached]:
+        return list(range(len(levels)))
+    if not partition:
+        # documents missing from or counted twice in the cached buckets
+        return None
+    mapping = []
+    for level in levels:
+        candidates = [i for i, c in enumerate(cached) if i not in mapping and _rolls_up(c, level)]
+        if not candidates:
+            return None
+        mapping.append(candidates[0])
+    return mapping
+
+
+def _rolls_up(cached, level):
+    if cached['type'] != level['type'] or cached['params'].get('field') != level['params'].get('field'):
+        return False
+    params, cached_params = level['params'], cached['params']
+    if level['type'] == 'terms':
+        return 'include' not in params and 'exclude' not in params and \
+            'include' not in cached_params and 'exclude' not in cached_params
+    if level['type'] == 'range':
+        return params['ranges'] == cached_params['ranges']
+    if level['type'] == 'histogram':
+        return params['interval'] % cached_params['interval'] == 0
+    return _divides(_interval(cached_params), _interval(params))
+
+
+def _interval(params):
+    return params.get('calendar_interval', params.get('fixed_interval', params.get('interval')))
+
+
+def _divides(cached, interval):
+    """
+    Returns whether each bucket of the date interval ``interval`` is a union of buckets of ``cached``.
+    """
+    from pandasticsearch.local import _calendar_units, _fixed_millis
+
+    unit, cached_unit = _calendar_units.get(interval), _calendar_units.get(cached)
+    try:
+        millis = _fixed_millis(interval) if unit is None else _calendar_millis.get(unit)
+        cached_millis = _fixed_millis(cached) if cached_unit is None else _calendar_millis.get(cached_unit)
+    except Exception:
+        return False
+    if cached_millis is not None and millis is not None:
+        return millis % cached_millis == 0
+    if cached_millis is not None:
+        # days, weeks, months, quarters and years start at midnight
+        return _calendar_millis['day'] % cached_millis == 0
+    if unit is None or cached_unit == 'week':
+        return unit == 'week' and cached_unit == 'week'
+    return _calendar_order.index(cached_unit) <= _calendar_order.index(unit) and unit != 'week'
+
+
+def _roll_key(level, cached, key):
+    if level['type'] == 'date_histogram' and level['params'] != cached['params']:
+        from pandasticsearch.local import _floor_date, _format_date
+
+        epoch = datetime.datetime(1970, 1, 1)
+        start = _floor_date(epoch + datetime.timedelta(milliseconds=key['key']), _interval(level['params']))
+        millis = int(round((start - epoch).total_seconds() * 1000))
+        return {'key': millis, 'key_as_string': _format_date(start, level['params'].get('format', None))}
+    if level['type'] == 'histogram':
+        interval = level['params']['interval']
+        return {'key': math.floor(key['key'] / float(interval)) * interval}
+    return key
+
+
+def _key_order(level, key):
+    if level['type'] == 'range':
+        return level['params']['ranges'].index(dict((k, key[k]) for k in ('from', 'to') if k in key))
+    return key['key']
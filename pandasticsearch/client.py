@@ -32,17 +32,26 @@ class RestClient(object):
             url = self.url + '/' + self.endpoint
         return url
 
-    def get(self, params=None):
+    def with_endpoint(self, endpoint):
         """
-        Sends a GET request to Elasticsearch.
+        Returns a new client talking to another endpoint of the same node.
 
-        :param optional params: Dictionary to be sent in the query string.
-        :return: The response as a dictionary.
+        An API endpoint written in the URL of this client, as in ``http://host:port/v2/_search``,
+        is replaced: the new client talks to ``http://host:port/v2/`` followed by ``endpoint``.
 
-        >>> from pandasticsearch import RestClient
-        >>> client = RestClient('http://localhost:9200', '_mapping/index')
-        >>> print(client.get())
+        :param str endpoint: The endpoint of the new client
+        :return: :class:`RestClient`
         """
+        parts = urllib.parse.urlsplit(self.url)
+        segments = parts.path.split('/')
+        for i, segment in enumerate(segments):
+            if segment.startswith('_'):
+                path = '/'.join(segments[:i]) + '/'
+                url = urllib.parse.urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+                return RestClient(url, endpoint, dict(self.headers))
+        return RestClient(self.url, endpoint, dict(self.headers))
+
+    def _send(self, method, data=None, params=None):
         try:
             url = self._prepare_url()
 
@@ -50,8 +59,12 @@ class RestClient(object):
                 url = '{0}?{1}'.format(url, urllib.parse.urlencode(params))
 
             headers = self.headers
-            req = urllib.request.Request(url=url,
-                                         headers=headers)
+            if data is not None:
+                headers['Content-Type'] = 'application/json'
+                data = json.dumps(data).encode('utf-8')
+
+            req = urllib.request.Request(url=url, data=data, headers=headers)
+            req.get_method = lambda: method
 
             res = urllib.request.urlopen(req)
             data = res.read().decode("utf-8")
@@ -71,6 +84,19 @@ class RestClient(object):
         else:
             return json.loads(data)
 
+    def get(self, params=None):
+        """
+        Sends a GET request to Elasticsearch.
+
+        :param optional params: Dictionary to be sent in the query string.
+        :return: The response as a dictionary.
+
+        >>> from pandasticsearch import RestClient
+        >>> client = RestClient('http://localhost:9200', '_mapping/index')
+        >>> print(client.get())
+        """
+        return self._send('GET', params=params)
+
     def post(self, data, params=None):
         """
         Sends a POST request to Elasticsearch.
@@ -83,33 +109,18 @@ class RestClient(object):
         >>> client = RestClient('http://localhost:9200', 'index/type/_search')
         >>> print(client.post(data={"query":{"match_all":{}}}))
         """
-        try:
-            url = self._prepare_url()
-
-            if params is not None:
-                url = '{0}?{1}'.format(url, urllib.parse.urlencode(params))
+        return self._send('POST', data, params)
 
-            headers = self.headers
-            headers['Content-Type'] = 'application/json'
-
-            req = urllib.request.Request(url=url, data=json.dumps(data).encode('utf-8'),
-                                         headers=headers)
-
-            res = urllib.request.urlopen(req)
-            data = res.read().decode("utf-8")
-            res.close()
-        except urllib.error.HTTPError:
-            _, e, _ = sys.exc_info()
-            reason = None
-            if e.code != 200:
-                try:
-                    reason = json.loads(e.read().decode("utf-8"))
-                except (ValueError, AttributeError, KeyError):
-                    pass
-                else:
-                    reason = reason.get('error', None)
+    def delete(self, data=None, params=None):
+        """
+        Sends a DELETE request to Elasticsearch.
 
-            raise ServerDefinedException(reason)
-        else:
-            return json.loads(data)
+        :param optional data: The json data to send in the body of the request.
+        :param optional params: Dictionary to be sent in the query string.
+        :return: The response as a dictionary.
 
+        >>> from pandasticsearch import RestClient
+        >>> client = RestClient('http://localhost:9200', '_search/scroll')
+        >>> print(client.delete(data={"scroll_id": ["xxx"]}))
+        """
+        return self._send('DELETE', data, params)
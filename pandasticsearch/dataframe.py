@@ -3,16 +3,50 @@
 from pandasticsearch.client import RestClient
 from pandasticsearch.queries import Agg, Select
 from pandasticsearch.operators import *
-from pandasticsearch.types import Column, Row
-from pandasticsearch.errors import DataFrameException
-
+from pandasticsearch.types import Column, RowSet
+from pandasticsearch.errors import DataFrameException, NoSuchDependencyException, ServerDefinedException
+from pandasticsearch.iterators import BackgroundIterator, map_concurrently
+from pandasticsearch.indices import IndexPattern
+from pandasticsearch.batch import Batch
+from pandasticsearch.cache import ResultCache
+from pandasticsearch.tail import Tail
+from pandasticsearch.local import LocalClient
+
+import collections
+import csv
 import json
+import math
 import six
 import sys
 import copy
+import itertools
+import uuid
+import warnings
 
 _unbound_index_err = DataFrameException('DataFrame is not bound to ES index')
 
+# index.max_result_window of Elasticsearch, beyond which results have to be scrolled
+_max_result_window = 10000
+_scroll_size = 1000
+# memory ceiling of the pages waiting to be written by exports
+_export_memory = 64 * 1024 * 1024
+# number of indexes queried at the same time by a fan-out DataFrame
+_fanout_workers = 8
+# isin() lists longer than this are split into chunks queried concurrently
+_max_terms = 10000
+
+_numeric_types = ('long', 'integer', 'short', 'byte', 'double', 'float', 'half_float', 'scaled_float',
+                  'unsigned_long')
+
+
+def _routing_value(value):
+    if isinstance(value, dict):
+        # {'term': {field: {'value': value}}}
+        value = value.get('value')
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return six.text_type(value)
+
 
 class DataFrame(object):
     """
@@ -38,6 +72,8 @@ class DataFrame(object):
         self._index = list(self._mapping.keys())[0] if self._mapping else None
         self._doc_type = DataFrame._get_doc_type(self._mapping) if self._mapping else None
         self._columns = sorted(DataFrame._get_cols(self._mapping)) if self._mapping else None
+        if self._columns is not None and kwargs.get('derived', None):
+            self._columns += [name for name in kwargs['derived'] if name not in self._columns]
         self._filter = kwargs.get('filter', None)
         self._groupby = kwargs.get('groupby', None)
         self._aggregation = kwargs.get('aggregation', None)
@@ -45,7 +81,19 @@ class DataFrame(object):
         self._projection = kwargs.get('projection', None)
         self._limit = kwargs.get('limit', None)
         self._compat = kwargs.get('compat', 2)
+        self._sample = kwargs.get('sample', None)
+        self._fanout = kwargs.get('fanout', None)
+        self._index_pattern = kwargs.get('index_pattern', None)
+        self._time_field = kwargs.get('time_field', None)
+        self._routing_field = kwargs.get('routing_field', None)
+        self._preference = kwargs.get('preference', None)
+        self._cache = kwargs.get('cache', None)
+        self._collapse = kwargs.get('collapse', None)
+        self._derived = kwargs.get('derived', None)
+        self._containment_cache = kwargs.get('containment_cache', None)
+        self._rollup_cache = kwargs.get('rollup_cache', None)
         self._last_query = None
+        self._last_failures = {}
 
     @property
     def index(self):
@@ -73,6 +121,18 @@ class DataFrame(object):
         """
         return self._columns
 
+    @property
+    def failures(self):
+        """
+        Returns the indexes which failed during the last fan-out execution, with their exceptions.
+
+        :return: a dictionary mapping each failed index name to its exception
+
+        >>> df.failures
+        {'logs-2016.11.28': ServerDefinedException(...)}
+        """
+        return self._last_failures
+
     @property
     def schema(self):
         """
@@ -85,8 +145,32 @@ class DataFrame(object):
         """
         Creates an :class:`DataFrame <DataFrame>` object by providing the URL of ElasticSearch node and the name of the index.
 
+        When a list of indexes is given, the DataFrame fans out: the query is sent to every index concurrently
+        and the results are merged on the client. Sorted hits are merged in order up to the limit,
+        and aggregations are merged by combining buckets and metrics (sums, counts, minimums, maximums, averages
+        and stats). An index failing does not fail the others, see :attr:`failures`.
+
+        Time-based indexes are given as a pattern holding the date format of the index names between braces,
+        e.g. ``logs-{yyyy.MM.dd}``, along with the date field the documents are indexed by. Each query is then
+        sent only to the indexes that the range conditions of the filter on this field can match, and to all
+        the indexes of the pattern when the filter has no lower bound on it.
+
+        On indexes routed by a field, the filters requiring this field to equal given values (``==`` and ``isin``)
+        send the query to the shards of these routing values only. A ``preference`` makes the repeated queries
+        of a session hit the same shard copies, and thus their caches.
+
         :param str url: URL of the node connected to (default: 'http://localhost:9200')
-        :param str index: The name of the index
+        :param index: The name of the index, a list of names to fan out to, or a pattern of time-based indexes
+        :param str time_field: The date field of the documents of time-based indexes
+        :param str routing_field: The field the documents are routed by
+        :param preference: The shard preference of the searches, or ``True`` for a random value shared by
+                           all the DataFrames derived from this one
+        :param cache: A :class:`ResultCache <pandasticsearch.cache.ResultCache>`, or the path of its directory,
+                      caching the results of :meth:`to_pandas` until the indexes change
+        :param containment_cache: A :class:`ContainmentCache <pandasticsearch.cache.ContainmentCache>` answering
+                                  the searches narrower than a cached one locally
+        :param rollup_cache: A :class:`RollupCache <pandasticsearch.cache.RollupCache>` answering the groupbys
+                             coarser than a cached one locally
         :param str doc_type: The type of the document
         :param str compat: The compatible ES version (an integer number)
         :param dict headers: Custom HTTP headers
@@ -95,6 +179,9 @@ class DataFrame(object):
 
         >>> from pandasticsearch import DataFrame
         >>> df = DataFrame.from_es('http://localhost:9200', index='people')
+        >>> logs = DataFrame.from_es('http://localhost:9200', index=['logs-2016.11.28', 'logs-2016.11.29'])
+        >>> logs = DataFrame.from_es('http://localhost:9200', index='logs-{yyyy.MM.dd}', time_field='timestamp')
+        >>> events = DataFrame.from_es('http://localhost:9200', index='events', routing_field='tenant', preference=True)
         """
 
         doc_type = kwargs.get('doc_type', None)
@@ -102,9 +189,32 @@ class DataFrame(object):
         url = kwargs.get('url', 'http://localhost:9200')
         compat = kwargs.get('compat', 2)
         headers = kwargs.get('headers', None)
+        time_field = kwargs.get('time_field', None)
+        routing_field = kwargs.get('routing_field', None)
+        preference = kwargs.get('preference', None)
+        cache = kwargs.get('cache', None)
+        containment_cache = kwargs.get('containment_cache', None)
+        rollup_cache = kwargs.get('rollup_cache', None)
 
         if index is None:
             raise ValueError('Index name must be specified')
+
+        if preference is True:
+            preference = uuid.uuid4().hex
+        if isinstance(cache, six.string_types):
+            cache = ResultCache(cache)
+
+        index_pattern = None
+        if IndexPattern.is_pattern(index):
+            index_pattern = IndexPattern(index)
+            index = index_pattern.wildcard
+
+        fanout = None
+        if isinstance(index, list):
+            fanout = [(name, RestClient(url, DataFrame._search_endpoint(name, doc_type), headers))
+                      for name in index]
+            index = ','.join(index)
+
         # get mapping structure from server
         if doc_type is None:
             mapping_endpoint = index
@@ -113,12 +223,72 @@ class DataFrame(object):
 
         mapping = RestClient(url, mapping_endpoint, headers).get()
 
+        return DataFrame(client=RestClient(url, DataFrame._search_endpoint(index, doc_type), headers),
+                         mapping=mapping, index=index, doc_type=doc_type, compat=compat, fanout=fanout,
+                         index_pattern=index_pattern, time_field=time_field,
+                         routing_field=routing_field, preference=preference, cache=cache,
+                         containment_cache=containment_cache, rollup_cache=rollup_cache)
+
+    @staticmethod
+    def from_pandas(frame, mapping=None, index='local', compat=2, containment_cache=None, rollup_cache=None):
+        """
+        Creates a :class:`DataFrame <DataFrame>` object answered by a
+        :class:`LocalClient <pandasticsearch.local.LocalClient>` from the documents of a Pandas DataFrame held in
+        memory instead of a cluster, e.g. in tests. The searches are evaluated locally into the responses
+        Elasticsearch would return.
+
+        :param frame: The documents, as a Pandas DataFrame or an Arrow table, whose index gives their ``_id``
+        :param dict mapping: The properties of the fields, e.g. ``{'age': {'type': 'integer'}}``,
+                             inferred from the types of the columns by default
+        :param str index: The name of the index
+        :param str compat: The compatible ES version (an integer number)
+        :param containment_cache: A :class:`ContainmentCache <pandasticsearch.cache.ContainmentCache>`,
+                                  see :meth:`from_es`
+        :param rollup_cache: A :class:`RollupCache <pandasticsearch.cache.RollupCache>`, see :meth:`from_es`
+        :return: DataFrame object for accessing
+        :rtype: DataFrame
+
+        >>> from pandasticsearch import DataFrame
+        >>> df = DataFrame.from_pandas(pandas.DataFrame({'name': ['Alice', 'Bob'], 'age': [12, 11]}))
+        >>> df.groupby(df.name).agg(df.age.max).to_pandas()
+        """
+        client = LocalClient(frame, mapping, index)
+        return DataFrame(client=client, mapping=client.with_endpoint(index).get(), index=index, compat=compat,
+                         containment_cache=containment_cache, rollup_cache=rollup_cache)
+
+    @staticmethod
+    def _search_endpoint(index, doc_type):
         if doc_type is None:
-            endpoint = index + '/_search'
-        else:
-            endpoint = index + '/' + doc_type + '/_search'
-        return DataFrame(client=RestClient(url, endpoint, headers),
-                         mapping=mapping, index=index, doc_type=doc_type, compat=compat)
+            return index + '/_search'
+        return index + '/' + doc_type + '/_search'
+
+    def _copy(self, **kwargs):
+        """
+        Returns a new :class:`DataFrame <DataFrame>` bound to the same index,
+        with the state given in ``kwargs`` replacing the state of this one.
+        """
+        state = dict(client=self._client,
+                     mapping=self._mapping,
+                     filter=self._filter,
+                     groupby=self._groupby,
+                     aggregation=self._aggregation,
+                     projection=self._projection,
+                     sort=self._sort,
+                     limit=self._limit,
+                     compat=self._compat,
+                     sample=self._sample,
+                     fanout=self._fanout,
+                     index_pattern=self._index_pattern,
+                     time_field=self._time_field,
+                     routing_field=self._routing_field,
+                     preference=self._preference,
+                     cache=self._cache,
+                     collapse=self._collapse,
+                     derived=self._derived,
+                     containment_cache=self._containment_cache,
+                     rollup_cache=self._rollup_cache)
+        state.update(kwargs)
+        return DataFrame(**state)
 
     def __getattr__(self, name):
         """
@@ -127,13 +297,13 @@ class DataFrame(object):
         if name not in self.columns:
             raise AttributeError(
                 "'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
-        return Column(name)
+        return Column(name, self)
 
     def __getitem__(self, item):
         if isinstance(item, six.string_types):
             if item not in self.columns:
                 raise TypeError('Column does not exist: [{0}]'.format(item))
-            return Column(item)
+            return Column(item, self)
         elif isinstance(item, BooleanFilter):
             self._filter = item.build()
             return self
@@ -152,15 +322,7 @@ class DataFrame(object):
         [Row(age=12,gender='female',name='Alice'), Row(age=11,gender='male',name='Bob')]
         """
         assert isinstance(condition, BooleanFilter)
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=condition.build(),
-                         groupby=self._groupby,
-                         aggregation=self._aggregation,
-                         projection=self._projection,
-                         sort=self._sort,
-                         limit=self._limit,
-                         compat=self._compat)
+        return self._copy(filter=condition.build())
 
     where = filter
 
@@ -181,15 +343,7 @@ class DataFrame(object):
                 projection.append(col)
             else:
                 raise TypeError('{0} is supposed to be str or Column'.format(col))
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=self._filter,
-                         groupby=self._groupby,
-                         aggregation=self._aggregation,
-                         projection=projection,
-                         sort=self._sort,
-                         limit=self._limit,
-                         compat=self._compat)
+        return self._copy(projection=projection)
 
     def limit(self, num):
         """
@@ -197,15 +351,7 @@ class DataFrame(object):
         """
         assert isinstance(num, int)
         assert num >= 1
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=self._filter,
-                         groupby=self._groupby,
-                         aggregation=self._aggregation,
-                         projection=self._projection,
-                         sort=self._sort,
-                         limit=num,
-                         compat=self._compat)
+        return self._copy(limit=num)
 
     def groupby(self, *cols):
         """
@@ -230,15 +376,7 @@ class DataFrame(object):
             names = [col.field_name() for col in columns]
             groupby = Grouper.from_list(names).build()
 
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=self._filter,
-                         groupby=groupby,
-                         aggregation=self._aggregation,
-                         projection=self._projection,
-                         sort=self._sort,
-                         limit=self.limit,
-                         compat=self._compat)
+        return self._copy(groupby=groupby)
 
     def agg(self, *aggs):
         """
@@ -254,15 +392,22 @@ class DataFrame(object):
             assert isinstance(agg, Aggregator)
             aggregation.update(agg.build())
 
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=self._filter,
-                         groupby=self._groupby,
-                         aggregation=aggregation,
-                         projection=self._projection,
-                         sort=self._sort,
-                         limit=self._limit,
-                         compat=self._compat)
+        return self._copy(aggregation=aggregation)
+
+    def batch(self):
+        """
+        Returns a :class:`Batch <pandasticsearch.batch.Batch>` deferring aggregations of this DataFrame,
+        which are executed together when the batch exits: the aggregations sharing the same filter
+        are merged into a single request.
+
+        >>> with df.batch() as b:
+        ...     avg = b.agg(df.age.avg)
+        ...     counts = b.groupby(df.gender).count()
+        >>> avg.collect()
+        [Row(avg(age)=12)]
+        >>> counts.to_pandas()
+        """
+        return Batch(self)
 
     def sort(self, *cols):
         """
@@ -280,23 +425,160 @@ class DataFrame(object):
             assert isinstance(col, Sorter)
             sorts.append(col.build())
 
-        return DataFrame(client=self._client,
-                         mapping=self._mapping,
-                         filter=self._filter,
-                         groupby=self._groupby,
-                         aggregation=self._aggregation,
-                         projection=self._projection,
-                         sort=sorts,
-                         limit=self._limit,
-                         compat=self._compat)
+        return self._copy(sort=sorts)
 
     orderby = sort
 
+    def with_column(self, name, script, type='double', runtime=False, lang=None, params=None):
+        """
+        Returns a new :class:`DataFrame <DataFrame>` with a column computed on the server by a script.
+
+        By default, the column is computed for each document returned, through ``script_fields``,
+        and in place of the field in the aggregations (e.g. ``groupby`` or ``agg``) on the column.
+        A runtime column (ES >= 7.11) is declared in the ``runtime_mappings`` of the search instead,
+        so that it can also be filtered and sorted on.
+
+        :param str name: The name of the column
+        :param script: The source of the script, or a :class:`Scriptor <pandasticsearch.operators.Scriptor>` object
+        :param str type: The type of a runtime column, e.g. ``'double'``, ``'long'``, ``'keyword'`` or ``'date'``
+        :param bool runtime: Whether the column is a runtime field
+        :param str lang: The language of the script
+        :param dict params: The parameters of the script
+        :return: :class:`DataFrame <DataFrame>`
+
+        >>> df = df.with_column('age_months', "doc['age'].value * 12")
+        >>> df.select('name', 'age_months').collect()
+        [Row(age_months=144,name='Alice'), Row(age_months=132,name='Bob')]
+        >>> df = df.with_column('initial', "emit(doc['name'].value.substring(0, 1))", type='keyword', runtime=True)
+        >>> df.filter(df.initial == 'A').groupby(df.initial).count().collect()
+        """
+        if self.columns is None:
+            raise _unbound_index_err
+        if not isinstance(script, Scriptor):
+            script = Scriptor(script, lang, params)
+        built = script.build()['script']
+        if self._compat >= 6 and 'inline' in built:
+            # 'inline' was renamed 'source' in ES 6
+            built['source'] = built.pop('inline')
+
+        derived = collections.OrderedDict(self._derived or ())
+        derived[name] = {'script': built, 'type': type, 'runtime': runtime}
+        return self._copy(derived=derived)
+
+    def collapse(self, key):
+        """
+        Keeps one document per value of ``key``, the first one in the order of the DataFrame,
+        through the ``collapse`` parameter of the search: only the documents kept are transferred.
+
+        A grouped DataFrame keeps the first document of each value of ``key`` in each group instead,
+        through a ``terms`` aggregation on ``key`` (unless the DataFrame is grouped by it) holding a ``top_hits``
+        aggregation of size 1. The fields of the documents are decoded as columns of the groups.
+
+        Collapsed results cannot be scrolled: they are limited by :meth:`limit` (20 values by default).
+
+        :param key: The column name or :class:`Column <pandasticsearch.types.Column>` to collapse on
+        :return: :class:`DataFrame <DataFrame>`
+
+        >>> df.sort(df.age.asc).collapse('gender').collect()
+        [Row(age=11,gender='male',name='Bob'), Row(age=12,gender='female',name='Alice')]
+        """
+        key = key.field_name() if isinstance(key, Column) else key
+        if self._groupby:
+            return self._top_hits(key, self._sort)
+        return self._copy(collapse=key)
+
+    def latest_by(self, key, sort_field):
+        """
+        Keeps the latest document per value of ``key``, i.e. the one with the greatest ``sort_field``,
+        see :meth:`collapse`.
+
+        :param key: The column name or :class:`Column <pandasticsearch.types.Column>` to collapse on
+        :param sort_field: The column name or :class:`Column <pandasticsearch.types.Column>` ordering the documents
+        :return: :class:`DataFrame <DataFrame>`
+
+        >>> df.latest_by('device', 'timestamp').limit(1000).to_pandas()
+        >>> df.groupby('site').latest_by('device', 'timestamp').to_pandas()
+        """
+        key = key.field_name() if isinstance(key, Column) else key
+        sort_field = sort_field.field_name() if isinstance(sort_field, Column) else sort_field
+        sort = [{sort_field: {'order': 'desc'}}]
+        if self._groupby:
+            return self._top_hits(key, sort)
+        return self._copy(collapse=key, sort=sort)
+
+    def _top_hits(self, key, sort):
+        if self._aggregation is not None:
+            raise DataFrameException('collapse() and latest_by() are not allowed after agg() on a grouped DataFrame')
+        groupby = copy.deepcopy(self._groupby)
+        inner_most = groupby
+        while 'aggregations' in list(inner_most.values())[0]:
+            inner_most = list(inner_most.values())[0]['aggregations']
+        grouper = list(inner_most.values())[0]
+        if grouper.get('terms', {}).get('field') != key:
+            grouper['aggregations'] = Grouper(key, size=self._limit or 20).build()
+
+        top_hits = {'size': 1}
+        if sort:
+            top_hits['sort'] = sort
+        if self._projection:
+            top_hits['_source'] = {'includes': [col.field_name() for col in self._projection], 'excludes': []}
+        return self._copy(groupby=groupby, aggregation={'top_hits({0})'.format(key): {'top_hits': top_hits}})
+
+    def sample(self, n=None, fraction=None, seed=None):
+        """
+        Returns a new :class:`DataFrame <DataFrame>` over a random sample of the documents,
+        drawn by the cluster within the current filter.
+
+        Documents are scored by a ``random_score`` function, so that ``n`` documents are picked at random
+        instead of the first ones by score or sort, and ``fraction`` keeps each document with that probability.
+
+        Aggregations are computed over the sample: with ``n``, over at most ``n`` random documents per shard
+        (``sampler`` aggregation); with ``fraction``, over each document with that probability
+        (``random_sampler`` aggregation, ES >= 8.2, where ``fraction`` must be at most 0.5).
+        The counts and sums are then those of the sample, not of the whole index.
+
+        :param int n: The number of documents to sample (per shard for aggregations)
+        :param float fraction: The probability of each document to be sampled
+        :param int seed: The seed making the sample reproducible
+
+        >>> df.filter(df.age < 30).sample(n=100, seed=42).to_pandas()
+        >>> df.sample(fraction=0.1).groupby(df.gender).agg(df.age.avg).to_pandas()
+        """
+        if n is None and fraction is None:
+            raise ValueError('Either n or fraction must be specified')
+        if n is not None:
+            assert isinstance(n, int)
+            assert n >= 1
+        if fraction is not None:
+            assert 0 < fraction <= 1
+        return self._copy(sample={'size': n, 'fraction': fraction, 'seed': seed})
+
     def _execute(self):
         if self._client is None:
             raise _unbound_index_err
 
-        res_dict = self._client.post(data=self._build_query())
+        if self._fanout:
+            return self._execute_fanout()
+
+        if self._aggregation is None and self._groupby is None:
+            filters = self._chunked_filters()
+            if filters is not None:
+                return self._execute_chunks(filters)
+
+        query = self._build_query()
+        if self._rollup_cache is not None and 'aggregations' in query:
+            # distinct counts would need scripting on the cluster to be merged
+            mergeable = Agg.mergeable(query['aggregations'], self._compat, sketches=False)
+            if self._rollup_cache.eligible(self, mergeable):
+                return self._execute_rollup(query, mergeable)
+
+        res_dict = None
+        if self._containment_cache is not None:
+            res_dict = self._containment_cache.answer(self, query)
+        if res_dict is None:
+            res_dict = self._search(query)
+            if self._containment_cache is not None:
+                self._containment_cache.put(self, query, res_dict)
         if self._aggregation is None and self._groupby is None:
             query = Select()
             query.explain_result(res_dict)
@@ -304,53 +586,550 @@ class DataFrame(object):
             query = Agg.from_dict(res_dict)
         return query
 
-    def collect(self):
+    def _execute_rollup(self, query, mergeable):
+        aggregations = query['aggregations']
+        results = self._rollup_cache.answer(self, mergeable)
+        if results is None:
+            query = dict(query, aggregations=self._rollup_cache.instrument(mergeable))
+            if self._compat >= 7:
+                # the exact number of documents tells whether the buckets partition them
+                query['track_total_hits'] = True
+            res_dict = self._search(query)
+            self._rollup_cache.put(self, mergeable, res_dict)
+            results = [res_dict]
+        return Agg.merge(results, aggregations)
+
+    def _execute_fanout(self):
+        query = self._build_query()
+        is_select = self._aggregation is None and self._groupby is None
+        if not is_select:
+            aggregations = query['aggregations']
+            query = dict(query, aggregations=Agg.mergeable(aggregations, self._compat))
+
+        names = [name for name, _ in self._fanout]
+        params = self._search_params() or None
+        results = map_concurrently(lambda client: client.post(data=query, params=params),
+                                   [client for _, client in self._fanout], _fanout_workers)
+
+        self._last_failures = dict((name, error[1]) for name, (_, error) in zip(names, results) if error is not None)
+        succeeded = [res_dict for res_dict, error in results if error is None]
+        if not succeeded:
+            six.reraise(*results[0][1])
+        if self._last_failures:
+            warnings.warn('Partial results, the query failed on indexes: {0}'.format(
+                ', '.join(sorted(self._last_failures))))
+
+        if is_select:
+            return Select.merge(succeeded, query.get('sort', None), query['size'],
+                                collapse=query.get('collapse', {}).get('field', None))
+        return Agg.merge(succeeded, aggregations)
+
+    def _chunked_filters(self, disjoint=False):
         """
-        Returns all the records as a list of Row.
+        Returns the filters resulting from splitting the longest ``isin()`` list of the filter
+        into chunks of at most ``_max_terms`` distinct values, or ``None`` when no list is that long.
+        Only the lists in AND position are split, so that the union of the chunks matches the filter.
 
-        :return: list of :class:`Row <pandasticsearch.types.Row>`
+        :param bool disjoint: Whether each chunk excludes the documents matching the previous ones,
+                              so that a document with values in several chunks is only matched once
+        """
+        if not self._filter:
+            return None
+        longest, values = None, []
+        for clause in conjuncts(self._filter):
+            if 'terms' in clause and len(clause['terms']) == 1:
+                clause_values = list(clause['terms'].values())[0]
+            elif 'ids' in clause:
+                clause_values = clause['ids']['values']
+            else:
+                continue
+            if not isinstance(clause_values, list):
+                continue
+            # repeated values would make a document match several chunks
+            clause_values = list(collections.OrderedDict.fromkeys(clause_values))
+            if len(clause_values) > max(_max_terms, len(values)):
+                longest, values = clause, clause_values
+
+        if longest is None:
+            return None
+        filters = []
+        previous = []
+        for i in range(0, len(values), _max_terms):
+            chunk = values[i:i + _max_terms]
+            if 'ids' in longest:
+                # a document has a single id, so that the chunks never overlap
+                replacement = {'ids': {'values': chunk}}
+            else:
+                field = list(longest['terms'].keys())[0]
+                replacement = {'terms': {field: chunk}}
+                if disjoint and previous:
+                    replacement = {'bool': {'must': [replacement], 'must_not': list(previous)}}
+                previous.append({'terms': {field: chunk}})
+            filters.append(substitute(self._filter, longest, replacement))
+        return filters
+
+    def _execute_chunks(self, filters):
+        frames = [self._copy(filter=f) for f in filters]
+        queries = [frame._build_query() for frame in frames]
+        results = map_concurrently(lambda i: frames[i]._search(queries[i]), range(len(frames)), _fanout_workers)
+        for _, error in results:
+            if error is not None:
+                six.reraise(*error)
+        self._last_query = queries[0]
+        return Select.merge([res_dict for res_dict, _ in results],
+                            queries[0].get('sort', None), queries[0]['size'], unique=True,
+                            collapse=queries[0].get('collapse', {}).get('field', None))
+
+    def collect(self, flatten=False, arrays='list'):
+        """
+        Returns all the records as a :class:`RowSet <pandasticsearch.types.RowSet>`,
+        which builds each :class:`Row <pandasticsearch.types.Row>` only when it is accessed.
+
+        :param bool flatten: Whether to extract the nested fields of the mapping into flat columns named by their
+                             dotted paths, instead of keeping objects as dictionaries
+        :param str arrays: How multi-valued fields are flattened: ``'list'``, ``'first'`` or ``'explode'``,
+                           see :meth:`Select.flatten <pandasticsearch.queries.Select.flatten>`
+        :return: :class:`RowSet <pandasticsearch.types.RowSet>`
 
         >>> df.collect()
         [Row(age=2, name='Alice'), Row(age=5, name='Bob')]
+        >>> df.collect()['age']
+        [2, 5]
+        >>> df.collect(flatten=True, arrays='first')['address.city']
+        ['Paris', 'Tokyo']
         """
         query = self._execute()
-        return [Row(**v) for v in query.result]
+        if isinstance(query, Select):
+            if flatten:
+                return query.flatten(self._field_paths(), arrays)
+            return RowSet(query.columns, len(query))
+        return RowSet.from_dicts(query.result)
 
-    def to_pandas(self):
+    def to_pandas(self, flatten=False, arrays='list'):
         """
         Export to a Pandas DataFrame object.
 
+        With a :class:`ResultCache <pandasticsearch.cache.ResultCache>`, the result is read from the cache
+        as long as the query is the same and no document was indexed or deleted in the indexes since it was cached.
+
+        :param bool flatten: Whether to extract the nested fields of the mapping into flat columns named by their
+                             dotted paths, instead of keeping objects as dictionaries
+        :param str arrays: How multi-valued fields are flattened: ``'list'``, ``'first'`` or ``'explode'``,
+                           see :meth:`Select.flatten <pandasticsearch.queries.Select.flatten>`
         :return: The DataFrame representing the query result
 
         >>> df[df['gender'] == 'male'].agg(Avg('age')).to_pandas()
             avg(age)
         0        12
+        >>> df.to_pandas(flatten=True, arrays='explode')
+          address.city  name  tags
+        0        Paris  Alice     a
+        1        Paris  Alice     b
+        """
+        key = self._cache_key(flatten=flatten, arrays=arrays) if self._cache is not None else None
+        if key is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+        query = self._execute()
+        if flatten and isinstance(query, Select):
+            frame = query.flatten(self._field_paths(), arrays).to_pandas()
+        else:
+            frame = query.to_pandas()
+
+        if key is not None and frame is not None:
+            self._cache.put(key, frame)
+        return frame
+
+    def _cache_key(self, **options):
+        """
+        Returns the key of the result of the DataFrame in the cache, or ``None`` if it cannot be cached.
+        """
+        if self._client is None:
+            raise _unbound_index_err
+        if self._sample and self._sample['seed'] is None:
+            # unseeded samples differ from one execution to the other
+            return None
+        token = self._freshness_token()
+        if token is None:
+            return None
+        client = self._search_client()
+        params = dict((k, v) for k, v in six.iteritems(self._search_params()) if k != 'preference')
+        return ResultCache.fingerprint({
+            'url': client.url,
+            'endpoint': client.endpoint,
+            'params': params,
+            'query': self._build_query(),
+            'options': options,
+            'token': token,
+        })
+
+    def _freshness_token(self):
+        """
+        Returns the counters of documents indexed and deleted in the searched indexes, which change with any write,
+        along with the counter of refreshes, which make the writes visible to searches some time after.
+        """
+        indexes = self._search_client().endpoint.split('/')[0]
+        params = {'ignore_unavailable': 'true'} if self._index_pattern is not None else None
+        try:
+            stats = self._client.with_endpoint(indexes + '/_stats/docs,indexing,refresh').get(params=params)
+            primaries = stats['_all']['primaries']
+            refresh = primaries['refresh']
+            return [primaries['docs']['count'], primaries['docs']['deleted'],
+                    primaries['indexing']['index_total'], primaries['indexing']['delete_total'],
+                    refresh.get('external_total', refresh['total'])]
+        except (ServerDefinedException, KeyError):
+            return None
+
+    def _field_paths(self):
+        """
+        Returns the dotted paths of the leaf fields of the mapping under the projected columns.
+        """
+        if self._mapping is None:
+            raise _unbound_index_err
+        cols = self._projected_columns()
+        return [path for path in DataFrame._get_field_paths(self._mapping)
+                if any(path == col or path.startswith(col + '.') for col in cols)]
+
+    def to_arrow(self):
+        """
+        Export to a pyarrow Table, built from the decoded columns of the hits
+        with the Arrow types matching the mapping of the index.
+
+        :return: pyarrow.Table
+
+        >>> df.filter(df.age < 13).to_arrow()
+        pyarrow.Table
+        age: int32
+        name: string
         """
         query = self._execute()
-        return query.to_pandas()
+        if isinstance(query, Select):
+            return query.to_arrow(schema=self._arrow_schema())
+        return query.to_arrow()
+
+    def iter_pages(self, batch_size=1000, prefetch=0):
+        """
+        Iterates over all the matching documents (up to the limit, if any) page by page through the scroll API.
+
+        With ``prefetch``, the next pages are requested on a background thread while the current one is processed,
+        up to ``prefetch`` pages ahead (each held in memory).
+        Closing the iterator before the end stops the prefetching and clears the scroll context.
+
+        :param int batch_size: Number of documents fetched per page
+        :param int prefetch: Number of pages fetched ahead of the one being processed
+        :return: a generator of :class:`Select <pandasticsearch.queries.Select>`
+
+        >>> for page in df.iter_pages(batch_size=5000, prefetch=2):
+        ...     page.to_pandas()
+        """
+        pages = self._iter_pages(batch_size)
+        if prefetch:
+            pages = BackgroundIterator(pages, max_items=prefetch)
+        try:
+            for page in pages:
+                yield page
+        finally:
+            pages.close()
+
+    def iter_arrow_batches(self, batch_size=1000, prefetch=0):
+        """
+        Iterates over all the matching documents (up to the limit, if any) as pyarrow RecordBatches,
+        one per page of the scroll API, which all have the same schema, built from the mapping of the index
+        by :meth:`Select.arrow_schema <pandasticsearch.queries.Select.arrow_schema>`.
+
+        :param int batch_size: Number of documents fetched per page
+        :param int prefetch: Number of pages fetched ahead on a background thread, see :meth:`iter_pages`
+        :return: a generator of pyarrow.RecordBatch
+
+        >>> for batch in df.iter_arrow_batches(batch_size=5000):
+        ...     writer.write_batch(batch)
+        """
+        schema = self._arrow_schema()
+        pages = self.iter_pages(batch_size, prefetch)
+        try:
+            for page in pages:
+                for batch in page.to_arrow(schema=schema).to_batches():
+                    yield batch
+        finally:
+            pages.close()
+
+    def to_parquet(self, path, batch_size=10000, max_memory=_export_memory, prefetch=1):
+        """
+        Writes all the matching documents (up to the limit, if any) into a Parquet file,
+        typed after the mapping of the index, with a row group per page of the scroll API.
+
+        Pages are fetched ahead and converted on background threads while the previous ones are written,
+        and fetching pauses whenever the converted pages waiting to be written exceed ``max_memory`` bytes.
+
+        :param str path: The path of the file to write
+        :param int batch_size: Number of documents fetched per page
+        :param int max_memory: The maximum size in bytes of the pages waiting to be written
+        :param int prefetch: Number of pages fetched ahead of the one being converted, see :meth:`iter_pages`
+
+        >>> df.filter(df.age < 25).to_parquet('people.parquet')
+        """
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pyarrow library')
+
+        # the schema of the file is that of every page, whatever values the page holds
+        schema = self._arrow_schema()
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+        try:
+            self._export(lambda pages: (page.to_arrow(schema=schema) for page in pages),
+                         writer.write_table, batch_size, max_memory, prefetch, lambda table: table.nbytes)
+        finally:
+            writer.close()
+
+    def to_csv(self, path, batch_size=10000, max_memory=_export_memory, prefetch=1):
+        """
+        Writes the projected columns of all the matching documents (up to the limit, if any)
+        into a CSV file with a header, page by page through the scroll API.
+        Objects and lists are written as JSON.
+
+        Pages are fetched ahead and converted on background threads while the previous ones are written,
+        and fetching pauses whenever the converted pages waiting to be written exceed ``max_memory`` bytes.
+
+        :param str path: The path of the file to write
+        :param int batch_size: Number of documents fetched per page
+        :param int max_memory: The maximum size in bytes of the pages waiting to be written
+        :param int prefetch: Number of pages fetched ahead of the one being converted, see :meth:`iter_pages`
+
+        >>> df.filter(df.age < 25).select('name', 'age').to_csv('people.csv')
+        """
+        cols = self._projected_columns()
+        if cols is None:
+            raise _unbound_index_err
+
+        def cell(v):
+            if v is None:
+                return ''
+            if isinstance(v, (dict, list)):
+                return json.dumps(v)
+            return v
+
+        def encode(pages):
+            b = six.StringIO()
+            csv.writer(b).writerow(cols)
+            header = b.getvalue()
+            for page in pages:
+                b = six.StringIO()
+                writer = csv.writer(b)
+                for row in page._iter_rows():
+                    writer.writerow([cell(row.get(col)) for col in cols])
+                yield (header + b.getvalue()).encode('utf-8')
+                header = ''
+
+        with open(path, 'wb') as f:
+            self._export(encode, f.write, batch_size, max_memory, prefetch)
+
+    def to_ndjson(self, path, batch_size=10000, max_memory=_export_memory, prefetch=1):
+        """
+        Writes all the matching documents (up to the limit, if any) into a newline-delimited JSON file,
+        a line per document, page by page through the scroll API.
+
+        Pages are fetched ahead and converted on background threads while the previous ones are written,
+        and fetching pauses whenever the converted pages waiting to be written exceed ``max_memory`` bytes.
 
-    def count(self):
+        :param str path: The path of the file to write
+        :param int batch_size: Number of documents fetched per page
+        :param int max_memory: The maximum size in bytes of the pages waiting to be written
+        :param int prefetch: Number of pages fetched ahead of the one being converted, see :meth:`iter_pages`
+
+        >>> df.filter(df.age < 25).to_ndjson('people.json')
+        """
+        def encode(pages):
+            for page in pages:
+                yield ''.join(json.dumps(row) + '\n' for row in page._iter_rows()).encode('utf-8')
+
+        with open(path, 'wb') as f:
+            self._export(encode, f.write, batch_size, max_memory, prefetch)
+
+    def _export(self, convert, write, batch_size, max_memory, prefetch, sizeof=len):
+        pages = self.iter_pages(batch_size, prefetch)
+        chunks = BackgroundIterator(convert(pages), max_bytes=max_memory, sizeof=sizeof)
+        try:
+            for chunk in chunks:
+                write(chunk)
+        finally:
+            chunks.close()
+            pages.close()
+
+    def _iter_pages(self, batch_size):
+        """
+        Yields the matching documents (up to the limit, if any) as :class:`Select <pandasticsearch.queries.Select>`
+        results, a page of ``batch_size`` documents at a time.
+        """
+        assert batch_size > 0
+
+        if self._aggregation or self._groupby:
+            raise DataFrameException('Iterating over pages is not allowed for aggregation. use collect() instead')
+        if self._client is None:
+            raise _unbound_index_err
+
+        remaining = self._limit
+        query = self._build_query()
+        query['size'] = min(batch_size, remaining) if remaining else batch_size
+
+        pages = self._scroll(query)
+        try:
+            for page in pages:
+                if remaining is not None:
+                    if len(page) > remaining:
+                        page = page.head(remaining)
+                    remaining -= len(page)
+                yield page
+                if remaining is not None and remaining <= 0:
+                    break
+        finally:
+            pages.close()
+
+    def _arrow_schema(self):
         """
-        Returns a list of numbers indicating the count for each group
+        Returns the Arrow schema of the projected columns, built from their mappings.
+        """
+        if self._mapping is None:
+            raise _unbound_index_err
+        mappings = collections.OrderedDict()
+        for col in self._projected_columns():
+            if self._derived and col in self._derived:
+                mappings[col] = {'type': self._derived[col]['type']}
+            else:
+                mappings[col] = DataFrame._get_field_mapping(self._mapping, col)
+        return Select.arrow_schema(mappings)
 
-        >>> df.groupby(df.gender).count()
-        [2, 1]
+    def count(self, approximate=False, threshold=10000):
+        """
+        Counts the documents.
+
+        Without groups, the number of matching documents is returned as an int,
+        counted exactly through the ``_count`` API.
+        In approximate mode a search of size 0 is sent instead, which stops tracking the total hits
+        at ``threshold`` (ES >= 7), so the number returned is a lower bound once it reaches ``threshold``.
+        A filter on a runtime column is counted by such a search tracking all the hits, as the ``_count`` API
+        takes no ``runtime_mappings``, and so is the search of a client from which no ``_count`` endpoint
+        can be derived.
+        The chunks of a long ``isin()`` list are counted concurrently and their counts added up,
+        each chunk excluding the documents of the previous ones, which hold several of the values.
+
+        With groups, a :class:`DataFrame <DataFrame>` is returned whose ``doc_count`` column holds
+        the count of each group, read from the buckets without any metric aggregation.
+
+        :param bool approximate: Whether to trade exactness beyond ``threshold`` for speed
+        :param int threshold: The number of hits tracked exactly in approximate mode
+
+        >>> df.filter(df.age < 13).count()
+        2
+        >>> df.groupby(df.gender).count().collect()
+        [Row(doc_count=2), Row(doc_count=1)]
         """
-        df = DataFrame(client=self._client,
-                       mapping=self._mapping,
-                       filter=self._filter,
-                       groupby=self._groupby,
-                       aggregation=MetricAggregator('_index', 'value_count', alias='count').build(),
-                       projection=self._projection,
-                       sort=self._sort,
-                       limit=self._limit,
-                       compat=self._compat)
-        return df
+        if self._groupby:
+            return self._copy(aggregation=None)
 
-    def show(self, n=10000, truncate=15):
+        if self._client is None:
+            raise _unbound_index_err
+
+        filters = self._chunked_filters(disjoint=True)
+        if filters is not None:
+            counts = map_concurrently(lambda f: self._copy(filter=f).count(approximate, threshold),
+                                      filters, _fanout_workers)
+            for _, error in counts:
+                if error is not None:
+                    six.reraise(*error)
+            return sum(n for n, _ in counts)
+
+        query = self._filter_query()
+        endpoint = self._endpoint('_count')
+
+        if not approximate and endpoint is not None and 'runtime_mappings' not in query:
+            res_dict = self._client.with_endpoint(endpoint).post(data=query, params=self._search_params() or None)
+            return res_dict['count']
+
+        query['size'] = 0
+        if self._compat >= 7:
+            query['track_total_hits'] = threshold if approximate else True
+        total = self._search(query)['hits']['total']
+        if isinstance(total, dict):
+            return total['value']
+        return total
+
+    def _search_client(self):
+        """
+        Returns the client of the search endpoint, narrowed down to the time-based indexes the filter can match.
+        """
+        if self._index_pattern is None or self._time_field is None:
+            return self._client
+        endpoint = self._client.endpoint
+        wildcard = self._index_pattern.wildcard
+        if not endpoint.startswith(wildcard):
+            return self._client
+        indexes = self._index_pattern.prune(self._filter, self._time_field)
+        return self._client.with_endpoint(indexes + endpoint[len(wildcard):])
+
+    def _search_params(self):
+        """
+        Returns the query string parameters of the searches of this DataFrame.
+        """
+        params = {}
+        if self._index_pattern is not None:
+            # the daily index of a day without documents may not exist
+            params['ignore_unavailable'] = 'true'
+        routing = self._routing()
+        if routing:
+            params['routing'] = ','.join(routing)
+        if self._preference is not None:
+            params['preference'] = self._preference
+        return params
+
+    def _routing(self):
+        """
+        Returns the sorted routing values that the filter requires, or ``None`` when it allows any.
+        """
+        if self._routing_field is None or not self._filter:
+            return None
+        routing = None
+        for clause in conjuncts(self._filter):
+            if 'term' in clause and self._routing_field in clause['term']:
+                values = [clause['term'][self._routing_field]]
+            elif 'terms' in clause and self._routing_field in clause['terms']:
+                values = clause['terms'][self._routing_field]
+            else:
+                continue
+            values = set(_routing_value(v) for v in values)
+            routing = values if routing is None else routing & values
+        return sorted(routing) if routing else None
+
+    def _search(self, query, params=None):
+        search_params = self._search_params()
+        search_params.update(params or {})
+        return self._search_client().post(data=query, params=search_params or None)
+
+    def _endpoint(self, api):
+        """
+        Returns the endpoint of another API on the index of the search endpoint, e.g. ``people/_count``,
+        or ``None`` when no index can be derived from the search client.
+        """
+        client = self._search_client()
+        endpoint = client.endpoint
+        if not endpoint and getattr(client, 'url', None):
+            # a search endpoint written in the URL, as in http://host:port/v2/_search, is replaced by with_endpoint()
+            segments = six.moves.urllib.parse.urlsplit(client.url).path.rstrip('/').split('/')
+            apis = [i for i, segment in enumerate(segments) if segment.startswith('_')]
+            endpoint = '/'.join(segments[apis[0]:]) if apis else ''
+        if not endpoint.endswith('_search'):
+            return None
+        return endpoint[:-len('_search')] + api
+
+    def show(self, n=20, truncate=15):
         """
         Prints the first ``n`` rows to the console.
 
+        Only ``n`` rows of the printed columns are requested, and each row is printed as soon as it is decoded.
+        More than 10000 rows are fetched page by page through the scroll API.
+
         :param n:  Number of rows to show.
         :param truncate:  Number of words to be truncated for each column.
 
@@ -365,21 +1144,428 @@ class DataFrame(object):
         """
         assert n > 0
 
-        if self._aggregation:
+        if self._aggregation or self._groupby:
             raise DataFrameException('show() is not allowed for aggregation. use collect() instead')
 
-        query = self._execute()
+        cols = self._projected_columns()
+        if cols is None or self._client is None:
+            raise _unbound_index_err
 
-        if self._projection:
-            cols = [col.field_name() for col in self._projection]
+        if self._limit:
+            n = min(n, self._limit)
+
+        query = self._build_query()
+        query['_source'] = self._source_filter(cols)
+        if n <= _max_result_window:
+            query['size'] = n
+            pages = [Select.from_dict(self._search(query))]
+        else:
+            query['size'] = _scroll_size
+            pages = self._scroll(query)
+
+        try:
+            millis = Select.write_tabular(sys.stdout, pages, cols, n, truncate)
+        finally:
+            if hasattr(pages, 'close'):
+                pages.close()
+        sys.stdout.write('time: {0}ms\n'.format(millis))
+
+    def head(self, n=5):
+        """
+        Returns the first ``n`` rows, as cheaply as the cluster allows.
+
+        The filter runs in non-scoring context, only the projected columns are fetched and,
+        unless the DataFrame is sorted or sampled, each shard terminates as soon as it has found ``n`` documents.
+        Total hits are not tracked (ES >= 7), and the rows of sorted hits, which are not scored, hold no ``_score``.
+
+        take() is an alias for head().
+
+        :param int n: Number of rows to return
+        :return: :class:`RowSet <pandasticsearch.types.RowSet>`
+
+        >>> df.filter(df.age < 13).head(2)
+        [Row(age=12,gender='female',name='Alice'), Row(age=11,gender='male',name='Bob')]
+        """
+        assert n > 0
+
+        if self._aggregation or self._groupby:
+            raise DataFrameException('head() is not allowed for aggregation. use collect() instead')
+
+        cols = self._projected_columns()
+        if cols is None or self._client is None:
+            raise _unbound_index_err
+
+        query = self._build_query()
+        query['size'] = n
+        query['_source'] = self._source_filter(cols)
+        if not self._sort and not self._sample and not self._collapse:
+            # the first n documents of each shard in index order are as good as any
+            query['sort'] = ['_doc']
+            query['terminate_after'] = n
+        if self._compat >= 7:
+            query['track_total_hits'] = False
+
+        select = Select.from_dict(self._search(query))
+        columns = select.columns
+        if 'sort' in query and not query.get('track_scores', False):
+            # sorted hits are not scored
+            columns = collections.OrderedDict((k, v) for k, v in six.iteritems(columns) if k != '_score')
+        return RowSet(columns, len(select))
+
+    take = head
+
+    def join(self, other, on, how='inner', suffixes=('_x', '_y'), batch_size=1000):
+        """
+        Joins with another :class:`DataFrame <DataFrame>` on the client, and returns the result as a Pandas DataFrame.
+
+        The smaller side (as counted by the cluster) is fetched first and hashed by its join keys. Unless the
+        rows of the other side are kept whether they match or not, only the documents holding the fetched keys
+        are then searched for on the other side, through ``terms`` filters of at most 10000 keys on the first
+        join column. The rows of the other side are matched page by page as they are streamed.
+
+        The order of the rows of the result is not defined. As in SQL, rows whose join keys are missing never match.
+
+        :param other: The :class:`DataFrame <DataFrame>` to join with
+        :param on: The name of the join column present on both sides, or a list of names
+        :param str how: ``'inner'``, ``'left'``, ``'right'`` or ``'outer'``
+        :param suffixes: The suffixes of the columns, other than the join columns, present on both sides
+        :param int batch_size: The number of documents fetched per request
+        :return: pandas.DataFrame
+
+        >>> orders.join(customers.select('id', 'name'), on='id').head()
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        if how not in ('inner', 'left', 'right', 'outer'):
+            raise ValueError('Join type must be one of inner, left, right and outer: [{0}]'.format(how))
+        on = [on] if isinstance(on, six.string_types) else list(on)
+
+        for frame in (self, other):
+            if frame._aggregation or frame._groupby:
+                raise DataFrameException('join() is not allowed for aggregation. use collect() instead')
+            if frame._projected_columns() is None or frame._client is None:
+                raise _unbound_index_err
+            for key in on:
+                if key not in frame._projected_columns():
+                    raise DataFrameException('Join column does not exist: [{0}]'.format(key))
+
+        left_cols, right_cols = self._projected_columns(), other._projected_columns()
+        overlap = set(left_cols) & set(right_cols) - set(on)
+        names = [c + suffixes[0] if c in overlap else c for c in left_cols] + \
+                [c + suffixes[1] if c in overlap else c for c in right_cols if c not in on]
+
+        build_left = self._size() <= other._size()
+        build, probe = (self, other) if build_left else (other, self)
+        keep_build = how == 'outer' or how == ('left' if build_left else 'right')
+        keep_probe = how == 'outer' or how == ('right' if build_left else 'left')
+
+        build_cols, probe_cols = build._projected_columns(), probe._projected_columns()
+        table = collections.OrderedDict()
+        for row in DataFrame._page_rows(build.iter_pages(batch_size, prefetch=1), build_cols):
+            table.setdefault(tuple(row[build_cols.index(k)] for k in on), []).append(row)
+
+        if keep_probe or probe._limit or probe._sample:
+            # the semi-join would drop the unmatched rows, or change which documents make the limit or the sample
+            probes = [probe]
         else:
-            cols = self.columns
+            keys = list(collections.OrderedDict.fromkeys(k[0] for k in table if None not in k))
+            probes = [probe._copy(filter=probe._and_filter({'terms': {on[0]: keys[i:i + _max_terms]}}))
+                      for i in range(0, len(keys), _max_terms)]
+
+        def joined(build_row, probe_row):
+            left, right = (build_row, probe_row) if build_left else (probe_row, build_row)
+            row = []
+            for i, c in enumerate(left_cols):
+                if left is not None:
+                    row.append(left[i])
+                elif c in on:
+                    row.append(right[right_cols.index(c)])
+                else:
+                    row.append(None)
+            for i, c in enumerate(right_cols):
+                if c not in on:
+                    row.append(right[i] if right is not None else None)
+            return row
+
+        records = []
+        matched = set()
+        for frame in probes:
+            for row in DataFrame._page_rows(frame.iter_pages(batch_size, prefetch=1), probe_cols):
+                key = tuple(row[probe_cols.index(k)] for k in on)
+                build_rows = table.get(key) if None not in key else None
+                if build_rows:
+                    matched.add(key)
+                    records.extend(joined(build_row, row) for build_row in build_rows)
+                elif keep_probe:
+                    records.append(joined(None, row))
+        if keep_build:
+            for key, build_rows in six.iteritems(table):
+                if key not in matched:
+                    records.extend(joined(build_row, None) for build_row in build_rows)
+
+        return pandas.DataFrame.from_records(records, columns=names)
+
+    def describe(self, cols=None, percentiles=(0.25, 0.5, 0.75)):
+        """
+        Computes summary statistics of the columns in a single request, as :meth:`pandas.DataFrame.describe` does:
+        the ``count``, ``mean``, sample ``std``, ``min``, ``max`` and ``percentiles`` of numeric and date columns,
+        along with the approximate number of ``unique`` values of each column.
+
+        By default, all the numeric and date columns of the mapping are described. The other columns
+        requested only get their ``count`` and ``unique`` rows. The statistics of date columns are
+        decoded as UTC timestamps, their deviations as timedeltas.
+
+        :param cols: The column names or :class:`Column <pandasticsearch.types.Column>` objects
+        :param percentiles: The percentiles to compute, as fractions between 0 and 1
+        :return: pandas.DataFrame with a row per statistic and a column per column described
+
+        >>> df.describe()
+                     age
+        count   3.000000
+        unique  3.000000
+        mean   12.000000
+        std     1.000000
+        min    11.000000
+        25%    11.500000
+        50%    12.000000
+        75%    12.500000
+        max    13.000000
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        if self._aggregation or self._groupby:
+            raise DataFrameException('describe() is not allowed for aggregation. use collect() instead')
+        if self._client is None or self.columns is None:
+            raise _unbound_index_err
 
+        types = DataFrame._get_field_types(self._mapping)
+        # derived columns are described by their declared type
+        types.update((name, spec['type']) for name, spec in six.iteritems(self._derived or {}))
         if cols is None:
+            cols = [c for c in self._projected_columns() if types.get(c) in _numeric_types + ('date',)]
+            if not cols:
+                raise DataFrameException('No numeric or date column to describe')
+        else:
+            cols = [c.field_name() if isinstance(c, Column) else c for c in cols]
+            for c in cols:
+                if c not in self.columns:
+                    raise DataFrameException('Column does not exist: [{0}]'.format(c))
+
+        percents = [p * 100 for p in percentiles]
+        aggregations = {}
+        for c in cols:
+            aggregations['cardinality({0})'.format(c)] = {'cardinality': {'field': c}}
+            if types.get(c) in _numeric_types + ('date',):
+                aggregations['extended_stats({0})'.format(c)] = {'extended_stats': {'field': c}}
+                aggregations['percentiles({0})'.format(c)] = {'percentiles': {'field': c, 'percents': percents}}
+            else:
+                aggregations['value_count({0})'.format(c)] = {'value_count': {'field': c}}
+
+        results = self._search(self._filter_query(aggregations))['aggregations']
+
+        labels = ['count', 'unique', 'mean', 'std', 'min'] + ['{0:g}%'.format(p) for p in percents] + ['max']
+        data = collections.OrderedDict()
+        for c in cols:
+            unique = results['cardinality({0})'.format(c)]['value']
+            stats = results.get('extended_stats({0})'.format(c))
+            if stats is None:
+                data[c] = [results['value_count({0})'.format(c)]['value'], unique] + [None] * (len(labels) - 2)
+                continue
+
+            n = stats['count']
+            # ES computes the population deviation, pandas the sample one
+            std = math.sqrt(stats['variance'] * n / (n - 1)) if n > 1 and stats['variance'] is not None else None
+            values = [stats['avg'], stats['min']] + \
+                DataFrame._percentile_values(results['percentiles({0})'.format(c)]['values'], percents) + \
+                [stats['max']]
+            if types.get(c) == 'date':
+                values = [pandas.to_datetime(v, unit='ms', utc=True) if v is not None else None for v in values]
+                std = pandas.to_timedelta(std, unit='ms') if std is not None else None
+            data[c] = [n, unique, values[0], std] + values[1:]
+
+        return pandas.DataFrame(data, index=labels, columns=cols)
+
+    @classmethod
+    def _percentile_values(cls, values, percents):
+        # {'25.0': 11.5} by default, [{'key': 25.0, 'value': 11.5}] when not keyed
+        if isinstance(values, dict):
+            values = [{'key': k, 'value': v} for k, v in six.iteritems(values)]
+        by_percent = dict((round(float(v['key']), 6), v['value']) for v in values)
+        return [by_percent.get(round(p, 6)) for p in percents]
+
+    def value_counts(self, *cols, **kwargs):
+        """
+        Counts the documents holding each distinct value, or combination of values, of the columns,
+        paging through a ``composite`` aggregation (ES >= 6.1). The documents missing a column are not counted.
+
+        With ``separate=True``, the values of each column are counted on their own, the ``composite``
+        aggregations of all the columns being paged through in the same requests.
+
+        :param cols: The column names or :class:`Column <pandasticsearch.types.Column>` objects
+        :param bool separate: Whether to count the values of each column on its own
+        :param int batch_size: The number of buckets fetched per request and column
+        :return: pandas.Series of the counts, in descending order and indexed by the values,
+                 or an ordered dictionary mapping each column to such a Series with ``separate=True``
+
+        >>> df.value_counts('gender')
+        gender
+        female    2
+        male      1
+        Name: count, dtype: int64
+        >>> df.value_counts('gender', 'age', separate=True)['age']
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        separate = kwargs.pop('separate', False)
+        batch_size = kwargs.pop('batch_size', 1000)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: {0}'.format(', '.join(sorted(kwargs))))
+        cols = [c.field_name() if isinstance(c, Column) else c for c in cols]
+        if not cols:
+            raise ValueError('At least one column must be specified')
+
+        def to_series(columns, buckets):
+            counts = [doc_count for _, doc_count in buckets]
+            if len(columns) == 1:
+                index = pandas.Index([key[columns[0]] for key, _ in buckets], name=columns[0])
+            else:
+                index = pandas.MultiIndex.from_tuples([tuple(key[c] for c in columns) for key, _ in buckets],
+                                                      names=columns)
+            series = pandas.Series(counts, index=index, name='count', dtype='int64')
+            # stable, so that equal counts stay in the ascending order of their values
+            return series.sort_values(ascending=False, kind='mergesort')
+
+        if not separate:
+            return to_series(cols, list(self._iter_values(cols, batch_size)))
+
+        buckets = collections.OrderedDict((c, []) for c in cols)
+        groups = collections.OrderedDict(('_values_{0}'.format(i), [c]) for i, c in enumerate(cols))
+        for name, page in self._composite_pages(groups, batch_size):
+            buckets[groups[name][0]].extend((b['key'], b['doc_count']) for b in page)
+        return collections.OrderedDict((c, to_series([c], buckets[c])) for c in cols)
+
+    def _iter_values(self, cols, batch_size):
+        """
+        Yields the distinct combinations of values of the columns, as dictionaries, along with their counts.
+        """
+        for _, page in self._composite_pages({'_values': cols}, batch_size):
+            for bucket in page:
+                yield bucket['key'], bucket['doc_count']
+
+    def _composite_pages(self, groups, batch_size):
+        """
+        Pages through ``composite`` aggregations named after the keys of ``groups``, which map each name to
+        the columns of the aggregation. Each request carries the aggregations not exhausted yet.
+
+        :return: a generator of ``(name, buckets)`` pairs
+        """
+        if self._aggregation or self._groupby:
+            raise DataFrameException('Counting values is not allowed for aggregation')
+        if self._client is None or self.columns is None:
+            raise _unbound_index_err
+        for c in itertools.chain(*groups.values()):
+            if c not in self.columns:
+                raise DataFrameException('Column does not exist: [{0}]'.format(c))
+
+        pending = collections.OrderedDict(
+            (name, {'size': batch_size, 'sources': [{c: {'terms': {'field': c}}} for c in cols]})
+            for name, cols in six.iteritems(groups))
+        while pending:
+            query = self._filter_query(dict((name, {'composite': composite})
+                                            for name, composite in six.iteritems(pending)))
+            aggregations = self._search(query)['aggregations']
+            for name in list(pending):
+                buckets = aggregations[name]['buckets']
+                if buckets:
+                    yield name, buckets
+                if len(buckets) < batch_size:
+                    del pending[name]
+                else:
+                    # after_key is only returned since ES 6.3
+                    after = aggregations[name].get('after_key', buckets[-1]['key'])
+                    pending[name] = dict(pending[name], after=after)
+
+    def tail(self, time_field, since=None, tiebreaker=None, batch_size=1000):
+        """
+        Returns a :class:`Tail <pandasticsearch.tail.Tail>` fetching the documents incrementally in the order of
+        ``time_field``: each fetch only searches the documents newer than the last one fetched before.
+
+        :param str time_field: The date (or numeric) field the documents are fetched in the order of
+        :param since: The time of the first documents to fetch, in any format of a range filter on the field
+        :param str tiebreaker: A field whose values are unique among the documents of the same time
+        :param int batch_size: The number of documents fetched per request
+        :return: :class:`Tail <pandasticsearch.tail.Tail>`
+
+        >>> tail = df.tail('timestamp', since='now-1d')
+        >>> pdf = tail.append_to(pdf)
+        >>> for rows in tail.follow(interval=10):
+        ...     print(len(rows))
+        """
+        if self.columns is None:
             raise _unbound_index_err
+        if time_field not in self.columns:
+            raise DataFrameException('Column does not exist: [{0}]'.format(time_field))
+        return Tail(self, time_field, since, tiebreaker, batch_size)
 
-        sys.stdout.write(query.result_as_tabular(cols, n, truncate))
-        sys.stdout.write('time: {0}ms\n'.format(query.millis_taken))
+    def _size(self):
+        """
+        Returns the number of documents of the DataFrame, as limited.
+        """
+        n = self.count()
+        return min(n, self._limit) if self._limit else n
+
+    def _and_filter(self, clause):
+        if not self._filter:
+            return clause
+        return {'bool': {'must': [self._filter, clause]}}
+
+    @staticmethod
+    def _page_rows(pages, cols):
+        try:
+            for page in pages:
+                columns = page.columns
+                values = [columns.get(c, None) or [None] * len(page) for c in cols]
+                for row in zip(*values):
+                    yield row
+        finally:
+            pages.close()
+
+    def _projected_columns(self):
+        if self._projection:
+            return [col.field_name() for col in self._projection]
+        return self.columns
+
+    def _scroll(self, query, scroll='1m'):
+        """
+        Yields the results of ``query`` page by page through the scroll API.
+        The scroll context is cleared once the pages are exhausted or the generator is closed.
+        """
+        if 'collapse' in query:
+            raise DataFrameException('Collapsed results cannot be scrolled, use limit() and collect() instead')
+        res_dict = self._search(query, {'scroll': scroll})
+        scroll_client = self._client.with_endpoint('_search/scroll')
+        try:
+            while True:
+                page = Select.from_dict(res_dict)
+                if len(page) == 0:
+                    break
+                yield page
+                res_dict = scroll_client.post(data={'scroll': scroll, 'scroll_id': res_dict['_scroll_id']})
+        finally:
+            if '_scroll_id' in res_dict:
+                try:
+                    scroll_client.delete(data={'scroll_id': [res_dict['_scroll_id']]})
+                except ServerDefinedException:
+                    pass
 
     def __repr__(self):
         if self.columns is None:
@@ -392,7 +1578,7 @@ class DataFrame(object):
         """
         if self._client is None:
             raise _unbound_index_err
-        sys.stdout.write(json.dumps(self._client.post(data=self._build_query()), indent=4))
+        sys.stdout.write(json.dumps(self._search(self._build_query()), indent=4))
 
     def to_dict(self):
         """
@@ -463,13 +1649,111 @@ class DataFrame(object):
                 query['query'] = {'filtered': {'filter': self._filter}}
 
         if self._projection:
-            query['_source'] = {"includes": [col.field_name() for col in self._projection], "excludes": []}
+            query['_source'] = self._source_filter([col.field_name() for col in self._projection])
+
+        if self._derived:
+            self._apply_derived(query)
 
         if self._sort:
             query['sort'] = self._sort
+
+        if self._collapse and 'aggregations' not in query:
+            query['collapse'] = {'field': self._collapse}
+
+        if self._sample:
+            self._apply_sample(query)
+
         self._last_query = query
         return query
 
+    def _filter_query(self, aggregations=None):
+        """
+        Returns the body of a request on the documents of the filter, without hits when ``aggregations`` are given.
+        Runtime columns are mapped and the scripts of the other derived columns replace their fields
+        in the aggregations.
+        """
+        query = dict((k, v) for k, v in six.iteritems(self._build_query()) if k == 'query')
+        if aggregations is not None:
+            query['size'] = 0
+            query['aggregations'] = aggregations
+        if self._derived:
+            self._apply_derived(query)
+            # no document is fetched
+            query.pop('fields', None)
+            query.pop('script_fields', None)
+        return query
+
+    def _source_filter(self, cols):
+        includes = [c for c in cols if not self._derived or c not in self._derived]
+        if not includes:
+            # an empty list of includes would return the whole documents
+            return False
+        return {'includes': includes, 'excludes': []}
+
+    def _apply_derived(self, query):
+        """
+        Adds the scripts of the derived columns to the query: runtime fields are mapped for the whole query,
+        the other scripts are run for the projected columns, or in place of their fields in the aggregations.
+        """
+        projected = self._projected_columns()
+        scripts = {}
+        for name, spec in six.iteritems(self._derived):
+            if spec['runtime']:
+                query.setdefault('runtime_mappings', {})[name] = {'type': spec['type'], 'script': spec['script']}
+                if 'aggregations' not in query and name in projected:
+                    query.setdefault('fields', []).append(name)
+            else:
+                scripts[name] = spec['script']
+                if 'aggregations' not in query and name in projected:
+                    query.setdefault('script_fields', {})[name] = {'script': spec['script']}
+
+        def scripted(node):
+            if isinstance(node, dict):
+                node = dict((k, scripted(v)) for k, v in six.iteritems(node))
+                if isinstance(node.get('field', None), six.string_types) and node['field'] in scripts:
+                    node['script'] = scripts[node.pop('field')]
+                return node
+            if isinstance(node, list):
+                return [scripted(x) for x in node]
+            return node
+
+        if scripts and 'aggregations' in query:
+            query['aggregations'] = scripted(query['aggregations'])
+
+    def _apply_sample(self, query):
+        size = self._sample['size']
+        fraction = self._sample['fraction']
+        seed = self._sample['seed']
+
+        random_score = {}
+        if seed is not None:
+            random_score['seed'] = seed
+            if self._compat >= 7:
+                random_score['field'] = '_seq_no'
+        random_query = {'function_score': {'query': query.get('query', {'match_all': {}}),
+                                           'random_score': random_score,
+                                           'boost_mode': 'replace'}}
+
+        aggregations = query.get('aggregations', None)
+        if aggregations is None:
+            query['query'] = random_query
+            if size is not None:
+                query['size'] = size
+            if fraction is not None:
+                # random scores are uniform in [0, 1)
+                query['min_score'] = 1 - fraction
+        elif size is not None:
+            # the sampler keeps the top scoring documents of each shard, which are random ones
+            query['query'] = random_query
+            query['aggregations'] = {'_sample': {'sampler': {'shard_size': size},
+                                                 'aggregations': aggregations}}
+        else:
+            sampler = {'probability': fraction}
+            if seed is not None:
+                sampler['seed'] = seed
+            query['aggregations'] = {'_sample': {'random_sampler': sampler,
+                                                 'aggregations': aggregations}}
+
     @classmethod
     def _get_cols(cls, mapping):
         cols = []
@@ -482,6 +1766,47 @@ class DataFrame(object):
             raise Exception('0 columns found in mapping')
         return cols
 
+    @classmethod
+    def _get_field_paths(cls, mapping):
+        def walk(properties, prefix):
+            for k, v in sorted(six.iteritems(properties)):
+                if 'properties' in v:
+                    for path in walk(v['properties'], prefix + k + '.'):
+                        yield path
+                else:
+                    yield prefix + k
+
+        paths = []
+        index = list(mapping.values())[0]  # {'index': {}}
+        for _, properties in six.iteritems(index['mappings']):
+            paths.extend(walk(properties['properties'], ''))
+        return paths
+
+    @classmethod
+    def _get_field_types(cls, mapping):
+        types = {}
+        index = list(mapping.values())[0]  # {'index': {}}
+        for _, properties in six.iteritems(index['mappings']):
+            for k, v in six.iteritems(properties['properties']):
+                types[k] = v.get('type', 'object')
+        return types
+
+    @classmethod
+    def _get_field_mapping(cls, mapping, path):
+        """
+        Returns the mapping of the field at a dotted path, or an empty one if there is none.
+        """
+        index = list(mapping.values())[0]  # {'index': {}}
+        for _, properties in six.iteritems(index['mappings']):
+            spec = {'properties': properties.get('properties', {})}
+            for name in path.split('.'):
+                spec = spec.get('properties', {}).get(name)
+                if spec is None:
+                    break
+            if spec is not None:
+                return spec
+        return {}
+
     @classmethod
     def _get_doc_type(cls, mapping):
         index = list(mapping.values())[0]  # {'index': {}}
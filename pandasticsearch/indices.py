@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*-
+
+import datetime
+import re
+
+import six
+
+from pandasticsearch.operators import conjuncts
+
+# Java date format tokens of index patterns, from the finest unit to the coarsest
+_tokens = (('HH', '%H', 'hour'),
+           ('dd', '%d', 'day'),
+           ('MM', '%m', 'month'),
+           ('yyyy', '%Y', 'year'),
+           ('yy', '%y', 'year'))
+
+_date_formats = ('%Y-%m-%dT%H:%M:%S.%f',
+                 '%Y-%m-%dT%H:%M:%S',
+                 '%Y-%m-%dT%H:%M',
+                 '%Y-%m-%d %H:%M:%S',
+                 '%Y-%m-%d',
+                 '%Y/%m/%d %H:%M:%S',
+                 '%Y/%m/%d')
+
+_date_math = re.compile(r'^now((?:[+-]\d+[yMwdhHms])*)(?:/([yMwdhHms]))?$')
+_date_math_units = {'y': 'year', 'M': 'month', 'w': 'week', 'd': 'day',
+                    'h': 'hour', 'H': 'hour', 'm': 'minute', 's': 'second'}
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+# beyond this length of the concrete index names in the URL, the whole pattern is searched:
+# the request line of Elasticsearch is limited to 4kb (http.max_initial_line_length)
+_max_indexes_length = 3 * 1024
+
+
+class IndexPattern(object):
+    """
+    A pattern of time-based index names, the date of the index being written in a Java date format
+    between braces, e.g. ``logs-{yyyy.MM.dd}`` for daily indexes such as ``logs-2016.11.29``.
+
+    >>> pattern = IndexPattern('logs-{yyyy.MM.dd}')
+    >>> pattern.wildcard
+    'logs-*'
+    >>> pattern.indexes(datetime.datetime(2016, 11, 28, 12), datetime.datetime(2016, 11, 29))
+    ['logs-2016.11.28', 'logs-2016.11.29']
+    """
+
+    def __init__(self, pattern):
+        match = re.match(r'^(.*)\{(.+)\}(.*)$', pattern)
+        if match is None:
+            raise ValueError('Index pattern must hold a date format between braces: [{0}]'.format(pattern))
+        self._pattern = pattern
+        self._prefix, date_format, self._suffix = match.groups()
+
+        self._unit = None
+        self._format = date_format
+        for token, directive, unit in _tokens:
+            if token in self._format:
+                self._format = self._format.replace(token, directive)
+                if self._unit is None:
+                    self._unit = unit
+        if self._unit is None:
+            raise ValueError('Index pattern holds no date token: [{0}]'.format(pattern))
+
+    @staticmethod
+    def is_pattern(index):
+        return isinstance(index, six.string_types) and re.search(r'\{.+\}', index) is not None
+
+    @property
+    def wildcard(self):
+        """
+        Returns the wildcard expression matching all the indexes of the pattern.
+        """
+        return self._prefix + '*' + self._suffix
+
+    def indexes(self, start, end):
+        """
+        Returns the names of the indexes holding the documents dated from ``start`` to ``end`` (UTC).
+
+        :param datetime.datetime start: The first date
+        :param datetime.datetime end: The last date
+        :return: a list of index names
+        """
+        names = []
+        current = _floor(start, self._unit)
+        while current <= end:
+            name = self._prefix + current.strftime(self._format) + self._suffix
+            if not names or names[-1] != name:
+                names.append(name)
+            current = _add(current, 1, self._unit)
+        return names
+
+    def prune(self, filter, time_field, now=None):
+        """
+        Returns the expression of the indexes which can hold documents matching ``filter``,
+        as bounded by the range conditions on ``time_field`` that the filter requires.
+
+        :param dict filter: The filter built from a :class:`BooleanFilter <pandasticsearch.operators.BooleanFilter>`
+        :param str time_field: The date field from which the index date is derived
+        :return: a comma-separated list of index names, or the wildcard when the filter is not bounded
+                 or the list would not fit in the URL of a request
+        """
+        now = now or datetime.datetime.utcnow()
+        start, end = time_bounds(filter, time_field, now)
+        if start is None:
+            return self.wildcard
+        if end is None:
+            end = now
+        names = ','.join(self.indexes(start, end))
+        if not names or len(six.moves.urllib.parse.quote(names, safe=',')) > _max_indexes_length:
+            return self.wildcard
+        return names
+
+    def __repr__(self):
+        return 'IndexPattern(%s)' % self._pattern
+
+
+def time_bounds(filter, field, now=None):
+    """
+    Returns the earliest and latest dates (UTC) of ``field`` that the ``filter`` allows,
+    ``None`` standing for an unbounded or unknown side.
+    """
+    now = now or datetime.datetime.utcnow()
+    start = end = None
+    if not filter:
+        return start, end
+    for clause in conjuncts(filter):
+        if 'range' not in clause or field not in clause['range']:
+            continue
+        for op, value in six.iteritems(clause['range'][field]):
+            if op in ('gt', 'gte', 'from'):
+                date = parse_date(value, now)
+                if date is not None and (start is None or date > start):
+                    start = date
+            elif op in ('lt', 'lte', 'to'):
+                date = parse_date(value, now, round_up=True)
+                if date is not None and (end is None or date < end):
+                    end = date
+    return start, end
+
+
+def parse_date(value, now=None, round_up=False):
+    """
+    Parses a date of a range condition into a naive UTC datetime: a datetime, a date, epoch milliseconds,
+    an ISO 8601 string or date math relative to ``now`` (e.g. ``now-1d/d``).
+
+    :param bool round_up: Whether rounded date math goes to the end of the unit, as for upper bounds
+    :return: datetime.datetime, or ``None`` when the value cannot be parsed
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _epoch + datetime.timedelta(milliseconds=value)
+    if not isinstance(value, six.string_types):
+        return None
+
+    match = _date_math.match(value)
+    if match is not None:
+        date = now or datetime.datetime.utcnow()
+        for sign, amount, unit in re.findall(r'([+-])(\d+)([yMwdhHms])', match.group(1)):
+            date = _add(date, int(amount) * (1 if sign == '+' else -1), _date_math_units[unit])
+        if match.group(2):
+            unit = _date_math_units[match.group(2)]
+            date = _floor(date, unit)
+            if round_up:
+                date = _add(date, 1, unit) - datetime.timedelta(microseconds=1)
+        return date
+
+    offset = datetime.timedelta(0)
+    tz = re.search(r'(Z|[+-]\d{2}:?\d{2})$', value)
+    if tz is not None:
+        value = value[:tz.start()]
+        if tz.group(1) != 'Z':
+            digits = tz.group(1).replace(':', '')
+            offset = datetime.timedelta(hours=int(digits[1:3]), minutes=int(digits[3:5]))
+            if digits[0] == '-':
+                offset = -offset
+    for date_format in _date_formats:
+        try:
+            return datetime.datetime.strptime(value, date_format) - offset
+        except ValueError:
+            pass
+    return None
+
+
+def _floor(date, unit):
+    if unit == 'second':
+        return date.replace(microsecond=0)
+    if unit == 'minute':
+        return date.replace(second=0, microsecond=0)
+    if unit == 'hour':
+        return date.replace(minute=0, second=0, microsecond=0)
+    if unit == 'week':
+        date = date - datetime.timedelta(days=date.weekday())
+        unit = 'day'
+    date = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'month':
+        return date.replace(day=1)
+    if unit == 'year':
+        return date.replace(month=1, day=1)
+    return date
+
+
+def _add(date, amount, unit):
+    if unit in ('month', 'year'):
+        months = date.month - 1 + amount * (12 if unit == 'year' else 1)
+        year = date.year + months // 12
+        month = months % 12 + 1
+        day = min(date.day, _days_in_month(year, month))
+        return date.replace(year=year, month=month, day=day)
+    return date + datetime.timedelta(**{unit + 's': amount})
+
+
+def _days_in_month(year, month):
+    if month == 12:
+        return 31
+    return (datetime.date(year, month + 1, 1) - datetime.date(year, month, 1)).days
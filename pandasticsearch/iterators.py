@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+
+import sys
+import threading
+
+import six
+
+_end = object()
+
+
+class BackgroundIterator(six.Iterator):
+    """
+    Iterates over an iterable on a background thread, so that producing the next items
+    overlaps with consuming the current one.
+
+    The produced items wait in a bounded buffer: the producer blocks (back-pressure) when
+    the buffer holds ``max_items`` items or when the next item would bring the size of
+    the buffer beyond ``max_bytes``. An item is always accepted by an empty buffer.
+
+    >>> it = BackgroundIterator(pages, max_items=2)
+    >>> for page in it:
+    ...     process(page)
+    """
+
+    def __init__(self, iterable, max_items=None, max_bytes=None, sizeof=len):
+        """
+        :param iterable: The iterable to iterate over
+        :param int max_items: The maximum number of items buffered
+        :param int max_bytes: The maximum total size of the items buffered
+        :param sizeof: The function returning the size of an item, used with ``max_bytes``
+        """
+        self._iterable = iterable
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._buffer = []
+        self._bytes = 0
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _full(self, size):
+        if not self._buffer:
+            return False
+        if self._max_items is not None and len(self._buffer) >= self._max_items:
+            return True
+        return self._max_bytes is not None and self._bytes + size > self._max_bytes
+
+    def _produce(self):
+        try:
+            for item in self._iterable:
+                size = self._sizeof(item) if self._max_bytes is not None else 0
+                with self._cond:
+                    while not self._closed and self._full(size):
+                        self._cond.wait()
+                    if self._closed:
+                        break
+                    self._buffer.append((item, size))
+                    self._bytes += size
+                    self._cond.notify_all()
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+            with self._cond:
+                self._buffer.append((_end, 0))
+                self._cond.notify_all()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._cond:
+            while not self._buffer:
+                self._cond.wait()
+            item, size = self._buffer[0]
+            if item is _end:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    six.reraise(*error)
+                raise StopIteration
+            self._buffer.pop(0)
+            self._bytes -= size
+            self._cond.notify_all()
+        return item
+
+    def close(self):
+        """
+        Stops the producer and waits for it to release the iterable.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            self._buffer = [(_end, 0)]
+            self._bytes = 0
+            self._error = None
+
+
+def map_concurrently(fn, items, max_workers=8):
+    """
+    Applies ``fn`` to each item on up to ``max_workers`` threads.
+
+    :return: A list of ``(result, exc_info)`` pairs in the order of ``items``,
+             ``exc_info`` being ``None`` unless ``fn`` raised an exception.
+
+    >>> map_concurrently(lambda client: client.post(data=query), clients)
+    """
+    items = list(items)
+    results = [None] * len(items)
+    todo = six.moves.queue.Queue()
+    for i in range(len(items)):
+        todo.put(i)
+
+    def work():
+        while True:
+            try:
+                i = todo.get_nowait()
+            except six.moves.queue.Empty:
+                return
+            try:
+                results[i] = (fn(items[i]), None)
+            except Exception:
+                results[i] = (None, sys.exc_info())
+
+    threads = [threading.Thread(target=work) for _ in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,985 @@
+# -*- coding: UTF-8 -*-
+
+import datetime
+import fnmatch
+import math
+import re
+import uuid
+
+import six
+
+from pandasticsearch.errors import NoSuchDependencyException, ServerDefinedException
+from pandasticsearch.indices import parse_date, _add, _floor
+from pandasticsearch.operators import _bool_occurs
+
+_integer_types = ('long', 'integer', 'short', 'byte', 'unsigned_long')
+_numeric_types = _integer_types + ('double', 'float', 'half_float', 'scaled_float')
+_default_percents = (1, 5, 25, 50, 75, 95, 99)
+# single-value metrics evaluated for all the buckets of an aggregation at once
+_grouped_reductions = {'value_count': 'count', 'cardinality': 'nunique', 'sum': 'sum', 'avg': 'mean', 'min': 'min',
+                       'max': 'max'}
+
+# calendar units of date histograms, as named by the units of date math
+_calendar_units = {'minute': 'minute', '1m': 'minute', 'hour': 'hour', '1h': 'hour', 'day': 'day', '1d': 'day',
+                   'week': 'week', '1w': 'week', 'month': 'month', '1M': 'month', 'quarter': 'quarter',
+                   '1q': 'quarter', 'year': 'year', '1y': 'year'}
+_fixed_units = {'ms': 1, 's': 1000, 'm': 60 * 1000, 'h': 3600 * 1000, 'd': 24 * 3600 * 1000}
+# Java date format tokens, the longest first
+_format_tokens = (('yyyy', '%Y'), ('yy', '%y'), ('MM', '%m'), ('dd', '%d'), ('HH', '%H'), ('mm', '%M'),
+                  ('ss', '%S'))
+
+
+def _unsupported(what):
+    return ServerDefinedException('The local backend does not support {0}'.format(what))
+
+
+class LocalClient(object):
+    """
+    LocalClient stands in for a :class:`RestClient <pandasticsearch.client.RestClient>`, answering the requests
+    of a DataFrame from a Pandas DataFrame held in memory: the search bodies are evaluated with vectorized
+    Pandas operations into responses shaped like the ones of Elasticsearch.
+
+    The filters, sorts, source filtering, collapsing, scrolling and the usual bucket and metric aggregations
+    are supported, scripts are not. Lists in the cells are the values of multi-valued fields.
+
+    >>> from pandasticsearch import DataFrame
+    >>> df = DataFrame.from_pandas(pandas.DataFrame({'name': ['Alice', 'Bob'], 'age': [12, 11]}))
+    >>> df.filter(df.age > 11).collect()
+    [Row(age=12,name='Alice')]
+    """
+
+    def __init__(self, frame, mapping=None, index='local', endpoint=None):
+        """
+        :param frame: The documents, as a Pandas DataFrame or an Arrow table, whose index gives their ``_id``
+        :param dict mapping: The properties of the fields, e.g. ``{'age': {'type': 'integer'}}``,
+                             inferred from the types of the columns by default
+        :param str index: The name of the index
+        :param str endpoint: The endpoint of the requests, ``<index>/_search`` by default
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        if not isinstance(frame, pandas.DataFrame) and hasattr(frame, 'to_pandas'):
+            frame = frame.to_pandas()
+        self.url = 'local://'
+        self.endpoint = endpoint if endpoint is not None else index + '/_search'
+        self.headers = {}
+        self._index = index
+        self._ids = [six.text_type(i) for i in frame.index]
+        self._frame = frame.reset_index(drop=True)
+        self._properties = mapping if mapping is not None else LocalClient._infer_mapping(self._frame)
+        self._types = dict((k, v.get('type', 'object')) for k, v in six.iteritems(self._properties))
+        self._values_cache = {}
+        self._scrolls = {}
+
+    @staticmethod
+    def _infer_mapping(frame):
+        from pandas.api import types
+
+        properties = {}
+        for col in frame.columns:
+            dtype = frame[col].dtype
+            if types.is_bool_dtype(dtype):
+                es_type = 'boolean'
+            elif types.is_integer_dtype(dtype):
+                es_type = 'long'
+            elif types.is_float_dtype(dtype):
+                es_type = 'double'
+            elif types.is_datetime64_any_dtype(dtype):
+                es_type = 'date'
+            else:
+                es_type = LocalClient._infer_type(frame[col])
+            properties[col] = {'type': es_type}
+        return properties
+
+    @staticmethod
+    def _infer_type(series):
+        for value in series:
+            if isinstance(value, (list, tuple)) or getattr(value, 'ndim', 0) > 0:
+                if not len(value):
+                    continue
+                value = value[0]
+            if value is None or isinstance(value, float) and math.isnan(value):
+                continue
+            if isinstance(value, bool):
+                return 'boolean'
+            if isinstance(value, six.integer_types):
+                return 'long'
+            if isinstance(value, float):
+                return 'double'
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                return 'date'
+            if isinstance(value, dict):
+                return 'object'
+            return 'keyword'
+        return 'keyword'
+
+    def with_endpoint(self, endpoint):
+        """
+        Returns a new client answering another endpoint from the same documents.
+
+        :param str endpoint: The endpoint of the new client
+        :return: :class:`LocalClient`
+        """
+        client = LocalClient.__new__(LocalClient)
+        client.__dict__.update(self.__dict__)
+        client.endpoint = endpoint
+        return client
+
+    def _api(self):
+        if self.endpoint.startswith('_search/scroll'):
+            return '_search/scroll'
+        parts = self.endpoint.split('/')
+        for api in ('_search', '_count', '_stats', '_mapping'):
+            if api in parts[1:]:
+                return api
+        return '_mapping'
+
+    def get(self, params=None):
+        """
+        Answers a GET request: the mapping of the index, or its statistics.
+        """
+        api = self._api()
+        if api == '_mapping':
+            return {self._index: {'mappings': {'_doc': {'properties': self._properties}}}}
+        if api == '_stats':
+            n = len(self._frame)
+            return {'_all': {'primaries': {'docs': {'count': n, 'deleted': 0},
+                                           'indexing': {'index_total': n, 'delete_total': 0},
+                                           'refresh': {'total': 0, 'external_total': 0}}}}
+        return self.post(None, params)
+
+    def post(self, data, params=None):
+        """
+        Answers a POST request: a search, a count or the next page of a scroll.
+        """
+        api = self._api()
+        data = data or {}
+        if api == '_search':
+            return self._search(data, params or {})
+        if api == '_count':
+            mask, _ = self._match(data)
+            return {'count': int(mask.sum())}
+        if api == '_search/scroll':
+            return self._next_page(data['scroll_id'])
+        raise _unsupported('the endpoint [{0}]'.format(self.endpoint))
+
+    def delete(self, data=None, params=None):
+        """
+        Answers a DELETE request, which clears scroll contexts.
+        """
+        if self._api() != '_search/scroll':
+            raise _unsupported('the endpoint [{0}]'.format(self.endpoint))
+        scroll_ids = (data or {}).get('scroll_id', [])
+        for scroll_id in scroll_ids if isinstance(scroll_ids, list) else [scroll_ids]:
+            self._scrolls.pop(scroll_id, None)
+        return {'succeeded': True, 'num_freed': len(scroll_ids)}
+
+    # searches
+
+    def _search(self, body, params):
+        for key in ('runtime_mappings', 'script_fields', 'search_after', 'post_filter'):
+            if key in body:
+                raise _unsupported('[{0}]'.format(key))
+
+        mask, scores = self._match(body)
+        if 'min_score' in body:
+            mask &= scores >= body['min_score']
+
+        size = body.get('size', 10)
+        start = body.get('from', 0)
+        res_dict = {'took': 0, 'timed_out': False,
+                    'hits': {'total': {'value': int(mask.sum()), 'relation': 'eq'}, 'max_score': None, 'hits': []}}
+
+        if size or 'scroll' in params:
+            positions, sort_values = self._sorted(mask.nonzero()[0], body.get('sort', None), scores)
+            collapse = body.get('collapse', {}).get('field', None)
+            if collapse is not None:
+                positions, sort_values = self._collapsed(positions, sort_values, collapse)
+            page = _Page(positions, sort_values, scores, body.get('_source', True), collapse, size)
+            if 'scroll' in params:
+                scroll_id = uuid.uuid4().hex
+                self._scrolls[scroll_id] = page
+                res_dict['_scroll_id'] = scroll_id
+            else:
+                page.offset = start
+            res_dict['hits']['hits'] = page.next(self)
+
+        if 'aggregations' in body or 'aggs' in body:
+            res_dict['aggregations'] = self._aggregate(body.get('aggregations', body.get('aggs')), mask, scores)
+        return res_dict
+
+    def _next_page(self, scroll_id):
+        if scroll_id not in self._scrolls:
+            raise ServerDefinedException('No search context found for id [{0}]'.format(scroll_id))
+        return {'took': 0, '_scroll_id': scroll_id, 'hits': {'hits': self._scrolls[scroll_id].next(self)}}
+
+    def _match(self, body):
+        """
+        Returns the mask of the documents matching the query of a search body, and their scores.
+        """
+        import numpy
+
+        n = len(self._frame)
+        query = body.get('query', {'match_all': {}})
+        scores = numpy.ones(n)
+        if 'function_score' in query:
+            function_score = query['function_score']
+            if 'random_score' not in function_score:
+                raise _unsupported('[function_score] without [random_score]')
+            seed = function_score['random_score'].get('seed', None)
+            if isinstance(seed, six.string_types):
+                seed = int(seed) if seed.isdigit() else sum(ord(c) for c in seed)
+            scores = numpy.random.RandomState(seed).random_sample(n)
+            query = function_score.get('query', {'match_all': {}})
+        return self._filter(query), scores
+
+    def _filter(self, query):
+        """
+        Returns the boolean mask of the documents matching a query.
+        """
+        import numpy
+
+        n = len(self._frame)
+        if not query:
+            return numpy.ones(n, dtype=bool)
+        if set(query) <= set(_bool_occurs + ('minimum_should_match',)):
+            # the bare body of a bool query, as combined by BooleanFilter
+            query = {'bool': query}
+        if len(query) != 1:
+            raise _unsupported('the query {0}'.format(sorted(query)))
+        kind, params = list(query.items())[0]
+
+        if kind == 'match_all':
+            return numpy.ones(n, dtype=bool)
+        if kind == 'match_none':
+            return numpy.zeros(n, dtype=bool)
+        if kind == 'bool':
+            return self._bool(params)
+        if kind == 'filtered':
+            return self._filter(params.get('filter', {})) & self._filter(params.get('query', {}))
+        if kind == 'constant_score':
+            return self._filter(params['filter'])
+        if kind == 'ids':
+            values = set(six.text_type(v) for v in params['values'])
+            return numpy.array([i in values for i in self._ids], dtype=bool)
+        if kind in ('exists', 'missing'):
+            exists = self._any(params['field'], lambda s: numpy.ones(len(s), dtype=bool))
+            return exists if kind == 'exists' else ~exists
+
+        field, value = list(params.items())[0]
+        if isinstance(value, dict) and kind != 'range':
+            value = value.get('value', value.get('values'))
+        if kind == 'term':
+            value = self._coerce(field, value)
+            return self._any(field, lambda s: (s == value).values)
+        if kind == 'terms':
+            values = [self._coerce(field, v) for v in value]
+            return self._any(field, lambda s: s.isin(values).values)
+        if kind == 'range':
+            return self._range(field, value)
+        if kind == 'prefix':
+            return self._any(field, lambda s: s.astype(six.text_type).str.startswith(value).values)
+        if kind == 'wildcard':
+            pattern = re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in value) + r'\Z')
+            return self._any(field, lambda s: s.astype(six.text_type).str.match(pattern).values)
+        if kind == 'regexp':
+            pattern = re.compile('(?:' + value + r')\Z')
+            return self._any(field, lambda s: s.astype(six.text_type).str.match(pattern).values)
+        raise _unsupported('the query [{0}]'.format(kind))
+
+    def _bool(self, params):
+        import numpy
+
+        def clauses(occur):
+            value = params.get(occur, [])
+            return value if isinstance(value, list) else [value]
+
+        mask = numpy.ones(len(self._frame), dtype=bool)
+        for clause in clauses('must') + clauses('filter'):
+            mask &= self._filter(clause)
+        for clause in clauses('must_not'):
+            mask &= ~self._filter(clause)
+        should = clauses('should')
+        if should:
+            # in filter context, one should clause must match by default
+            minimum = int(params.get('minimum_should_match', 1))
+            matched = numpy.zeros(len(self._frame), dtype=int)
+            for clause in should:
+                matched += self._filter(clause)
+            mask &= matched >= minimum
+        return mask
+
+    def _range(self, field, bounds):
+        import operator
+
+        ops = {'gt': operator.gt, 'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le}
+        conditions = []
+        for op, value in six.iteritems(bounds):
+            if op in ops and value is not None:
+                # rounded date math goes to the end of the unit for gt and lte
+                conditions.append((ops[op], self._coerce(field, value, round_up=op in ('gt', 'lte'))))
+            elif op in ('from', 'to'):
+                raise _unsupported('[{0}] in ranges'.format(op))
+
+        def match(s):
+            hit = s.notna()
+            for op, value in conditions:
+                hit &= op(s, value)
+            return hit.values
+        return self._any(field, match)
+
+    def _coerce(self, field, value, round_up=False):
+        """
+        Converts a value of a query to the type of the values of the field.
+        """
+        import pandas
+
+        es_type = self._types.get(field, None)
+        if es_type == 'date':
+            date = parse_date(value, round_up=round_up)
+            if date is None:
+                raise ServerDefinedException('failed to parse date field [{0}] with value [{1}]'.format(field, value))
+            return pandas.Timestamp(date)
+        if es_type in _numeric_types and isinstance(value, six.string_types):
+            return float(value)
+        if es_type == 'boolean' and isinstance(value, six.string_types):
+            return value == 'true'
+        if es_type in ('keyword', 'text') and not isinstance(value, six.string_types):
+            return 'true' if value is True else 'false' if value is False else six.text_type(value)
+        return value
+
+    def _values(self, field):
+        """
+        Returns the values of a field as a Series indexed by the position of their document,
+        a multi-valued document having one entry per value.
+        """
+        if field in self._values_cache:
+            return self._values_cache[field]
+        import pandas
+
+        if field == '_id':
+            values = pandas.Series(self._ids)
+        elif field in self._frame.columns:
+            values = self._frame[field]
+        else:
+            values = pandas.Series([], dtype=object)
+        if values.dtype == object:
+            values = values.explode()
+        values = values.dropna()
+
+        es_type = self._types.get(field, None)
+        if es_type == 'date':
+            if pandas.api.types.is_numeric_dtype(values):
+                values = pandas.to_datetime(values, unit='ms', utc=True)
+            else:
+                try:
+                    values = pandas.to_datetime(values, utc=True, errors='coerce', format='ISO8601')
+                except (TypeError, ValueError):
+                    values = pandas.to_datetime(values, utc=True, errors='coerce')
+            values = values.dt.tz_localize(None).dropna()
+        elif es_type in _numeric_types and values.dtype == object:
+            values = pandas.to_numeric(values, errors='coerce').dropna()
+        self._values_cache[field] = values
+        return values
+
+    def _any(self, field, predicate):
+        """
+        Returns the mask of the documents of which any value of the field satisfies the predicate.
+        """
+        import numpy
+
+        values = self._values(field)
+        mask = numpy.zeros(len(self._frame), dtype=bool)
+        if len(values):
+            hit = numpy.asarray(predicate(values), dtype=bool)
+            mask[values.index.values[hit]] = True
+        return mask
+
+    def _numbers(self, field, mask):
+        """
+        Returns the values of a field in the documents of the mask as floats, dates as epoch milliseconds.
+        """
+        import pandas
+
+        values = self._values(field)
+        values = values[mask[values.index.values]] if len(values) else values
+        if self._types.get(field, None) == 'date':
+            return (values - pandas.Timestamp(0)) / pandas.Timedelta(milliseconds=1)
+        return values.astype(float)
+
+    # hits
+
+    def _sorted(self, positions, sort, scores):
+        """
+        Orders the positions of documents by the sort of a search, missing values last.
+
+        :return: the positions and the sort values of each document, or ``None`` without sort
+        """
+        import pandas
+
+        if not sort:
+            order = pandas.Series(-scores[positions]).sort_values(kind='mergesort').index
+            return positions[order.values], None
+        if not isinstance(sort, list):
+            sort = [sort]
+
+        keys = pandas.DataFrame(index=positions)
+        ascending = []
+        for i, spec in enumerate(sort):
+            if isinstance(spec, six.string_types):
+                field, params = spec, {}
+            else:
+                field, params = list(spec.items())[0]
+            if field == '_script':
+                raise _unsupported('sorting by script')
+            if isinstance(params, six.string_types):
+                params = {'order': params}
+            asc = params.get('order', 'desc' if field == '_score' else 'asc') == 'asc'
+            if field == '_score':
+                keys[i] = scores[positions]
+            elif field == '_doc':
+                keys[i] = positions
+            else:
+                values = self._values(field)
+                values = values[values.index.isin(positions)]
+                if self._types.get(field, None) == 'date':
+                    values = (values - pandas.Timestamp(0)) // pandas.Timedelta(milliseconds=1)
+                # multi-valued fields sort by their smallest value ascending, by their largest descending
+                mode = params.get('mode', 'min' if asc else 'max')
+                grouped = values.groupby(level=0)
+                keys[i] = getattr(grouped, 'mean' if mode == 'avg' else mode)() if len(values) else None
+            ascending.append(asc)
+
+        keys = keys.sort_values(by=list(keys.columns), ascending=ascending, na_position='last', kind='mergesort')
+        sort_values = [[_json_value(v) for v in row] for row in keys.itertuples(index=False)]
+        return keys.index.values, sort_values
+
+    def _collapsed(self, positions, sort_values, field):
+        import pandas
+
+        values = self._values(field)
+        first = values[~values.index.duplicated()].reindex(positions)
+        keep = ~pandas.Series(first.values).duplicated().values
+        if sort_values is not None:
+            sort_values = [v for v, k in zip(sort_values, keep) if k]
+        return positions[keep], sort_values
+
+    def _hits(self, positions, sort_values, scores, source, collapse=None):
+        includes, excludes = _source_patterns(source)
+        records = self._frame.iloc[positions].to_dict('records') if len(positions) else []
+        hits = []
+        for i, (position, record) in enumerate(zip(positions, records)):
+            hit = {'_index': self._index, '_id': self._ids[position], '_score': float(scores[position])}
+            if source is not False:
+                hit['_source'] = dict((k, _json_value(v)) for k, v in six.iteritems(record)
+                                      if _is_present(v) and _included(k, includes, excludes))
+            if sort_values is not None:
+                hit['sort'] = sort_values[i]
+                hit['_score'] = None
+            if collapse is not None:
+                value = record.get(collapse)
+                hit['fields'] = {collapse: [_json_value(value)] if _is_present(value) else []}
+            hits.append(hit)
+        return hits
+
+    # aggregations
+
+    def _aggregate(self, aggregations, mask, scores):
+        results = {}
+        for name, body in six.iteritems(aggregations):
+            agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+            params = body[agg_type]
+            sub = body.get('aggregations', body.get('aggs', None))
+            if 'script' in params:
+                raise _unsupported('scripts in aggregations')
+            method = getattr(self, '_agg_' + agg_type, None)
+            if method is None:
+                raise _unsupported('the aggregation [{0}]'.format(agg_type))
+            results[name] = method(params, mask, scores, sub)
+        return results
+
+    def _bucket(self, mask, scores, sub, **keys):
+        bucket = dict(keys, doc_count=int(mask.sum()))
+        if sub:
+            bucket.update(self._aggregate(sub, mask, scores))
+        return bucket
+
+    def _grouped_bucket(self, buckets, code, scores, sub, **keys):
+        """
+        Returns a bucket of grouped documents, building the mask of its documents only for its sub-aggregations.
+        """
+        if not sub:
+            return dict(keys, doc_count=buckets.count(code))
+        return self._bucket(buckets.member(code), scores, sub, **keys)
+
+    def _grouped_metric(self, buckets, body, mask):
+        """
+        Evaluates a single-value metric aggregation in every bucket at once.
+
+        :return: the value of the metric in each bucket, or ``None`` for other aggregations
+        """
+        import pandas
+
+        agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+        params = body[agg_type]
+        if agg_type not in _grouped_reductions or 'script' in params:
+            return None
+        if agg_type in ('value_count', 'cardinality'):
+            values = self._values(params['field'])
+            values = values[mask[values.index.values]] if len(values) else values
+        else:
+            values = self._numbers(params['field'], mask)
+        members = pandas.DataFrame({'_doc': buckets.docs, '_code': buckets.codes})
+        members = members.merge(pandas.DataFrame({'_doc': values.index.values, 'value': values.values}), on='_doc')
+        reduced = members.groupby('_code')['value'].agg(_grouped_reductions[agg_type])
+        reduced = reduced.reindex(range(len(buckets.keys)))
+        if agg_type in ('value_count', 'cardinality', 'sum'):
+            reduced = reduced.fillna(0)
+        return reduced.values
+
+    def _key(self, field, value):
+        """
+        Returns the key of a bucket as returned by Elasticsearch, along with its string form if any.
+        """
+        import pandas
+
+        es_type = self._types.get(field, None)
+        if es_type == 'date':
+            millis = int((pandas.Timestamp(value) - pandas.Timestamp(0)) // pandas.Timedelta(milliseconds=1))
+            return {'key': millis, 'key_as_string': _format_date(pandas.Timestamp(value), None)}
+        if es_type == 'boolean':
+            return {'key': 1 if value else 0, 'key_as_string': 'true' if value else 'false'}
+        value = _json_value(value)
+        if es_type in _integer_types and isinstance(value, float):
+            value = int(value)
+        return {'key': value}
+
+    def _agg_terms(self, params, mask, scores, sub):
+        field = params['field']
+        include, exclude = params.get('include', None), params.get('exclude', None)
+        order = params.get('order', [{'_count': 'desc'}])
+        order = order if isinstance(order, list) else [order]
+
+        values = self._values(field)
+        buckets = _Buckets(values[mask[values.index.values]] if len(values) else values, len(mask))
+        entries = []
+        for code, value in enumerate(buckets.keys):
+            if include is not None and not _matches_terms(value, include):
+                continue
+            if exclude is not None and _matches_terms(value, exclude):
+                continue
+            keys = self._key(field, value)
+            entries.append((code, keys, dict(keys, doc_count=buckets.count(code))))
+
+        # metrics ordering the buckets are evaluated for all of them, grouped by bucket where possible
+        for spec in order:
+            name = list(spec)[0]
+            agg_name = name.partition('.')[0]
+            if name in ('_count', '_key', '_term') or agg_name not in (sub or {}):
+                continue
+            metric = None if '.' in name else self._grouped_metric(buckets, sub[agg_name], mask)
+            for code, _, row in entries:
+                if metric is not None:
+                    row[agg_name] = {'value': _float(metric[code])}
+                else:
+                    row.update(self._aggregate({agg_name: sub[agg_name]}, buckets.member(code), scores))
+        for spec in reversed(order):
+            name, direction = list(spec.items())[0]
+            entries.sort(key=lambda e: _order_value(e[2], name), reverse=direction == 'desc')
+        entries = [e for e in entries if e[2]['doc_count'] >= params.get('min_doc_count', 1)]
+
+        size = params.get('size', 10)
+        others = sum(row['doc_count'] for _, _, row in entries[size:])
+        # sub-aggregations are only computed for the buckets returned
+        buckets = [self._grouped_bucket(buckets, code, scores, sub, **keys) for code, keys, _ in entries[:size]]
+        return {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': others, 'buckets': buckets}
+
+    def _agg_range(self, params, mask, scores, sub):
+        field = params['field']
+        buckets = []
+        for spec in params['ranges']:
+            start, end = spec.get('from', None), spec.get('to', None)
+            bounds = {}
+            if start is not None:
+                bounds['gte'] = start
+            if end is not None:
+                bounds['lt'] = end
+            member = mask & self._range(field, bounds)
+            key = spec.get('key', '{0}-{1}'.format('*' if start is None else float(start),
+                                                   '*' if end is None else float(end)))
+            keys = {'key': key}
+            if start is not None:
+                keys['from'] = start
+            if end is not None:
+                keys['to'] = end
+            buckets.append(self._bucket(member, scores, sub, **keys))
+        return {'buckets': buckets}
+
+    def _agg_histogram(self, params, mask, scores, sub):
+        import numpy
+
+        field, interval = params['field'], params['interval']
+        offset = params.get('offset', 0)
+        values = self._numbers(field, mask)
+        buckets = _Buckets(numpy.floor((values - offset) / interval) * interval + offset, len(mask))
+        codes = dict((key, code) for code, key in enumerate(buckets.keys))
+        if codes and params.get('min_doc_count', 0) == 0:
+            key = min(codes)
+            while key < max(codes):
+                key += interval
+                codes.setdefault(key, None)
+        return {'buckets': [self._grouped_bucket(buckets, codes[key], scores, sub, key=_json_value(key))
+                            for key in sorted(codes) if buckets.count(codes[key]) >= params.get('min_doc_count', 0)]}
+
+    def _agg_date_histogram(self, params, mask, scores, sub):
+        import pandas
+
+        field = params['field']
+        interval = params.get('calendar_interval', params.get('fixed_interval', params.get('interval')))
+        dates = self._values(field)
+        dates = dates[mask[dates.index.values]] if len(dates) else dates
+        buckets = _Buckets(_floor_dates(dates, interval), len(mask))
+        codes = dict((pandas.Timestamp(start).to_pydatetime(), code) for code, start in enumerate(buckets.keys))
+        if codes and params.get('min_doc_count', 0) == 0:
+            start, last = min(codes), max(codes)
+            while start < last:
+                start = _next_date(start, interval)
+                codes.setdefault(start, None)
+
+        result = []
+        for start in sorted(codes):
+            if buckets.count(codes[start]) < params.get('min_doc_count', 0):
+                continue
+            millis = int((pandas.Timestamp(start) - pandas.Timestamp(0)) // pandas.Timedelta(milliseconds=1))
+            result.append(self._grouped_bucket(buckets, codes[start], scores, sub, key=millis,
+                                               key_as_string=_format_date(start, params.get('format', None))))
+        return {'buckets': result}
+
+    def _agg_composite(self, params, mask, scores, sub):
+        import pandas
+
+        names, fields = [], []
+        for source in params['sources']:
+            name, spec = list(source.items())[0]
+            if 'terms' not in spec:
+                raise _unsupported('composite sources other than terms')
+            names.append(name)
+            fields.append(spec['terms']['field'])
+
+        # one row per document and combination of its values
+        combinations = None
+        for name, field in zip(names, fields):
+            values = self._values(field)
+            values = values[mask[values.index.values]] if len(values) else values
+            frame = pandas.DataFrame({'_doc': values.index.values, name: values.values})
+            combinations = frame if combinations is None else combinations.merge(frame, on='_doc')
+        combinations = combinations.drop_duplicates()
+
+        after = params.get('after', None)
+        after = tuple(after[name] for name in names) if after else None
+        selected, keys = [], []
+        distinct = combinations[names].drop_duplicates().sort_values(names)
+        for row in distinct.itertuples(index=False):
+            key = tuple(self._key(field, k)['key'] for field, k in zip(fields, row))
+            if after is not None and key <= after:
+                continue
+            selected.append(row)
+            keys.append(key)
+            if len(keys) == params.get('size', 10):
+                break
+
+        selected = pandas.DataFrame(selected, columns=names)
+        selected['_code'] = range(len(selected))
+        members = combinations.merge(selected, on=names)
+        buckets = _Buckets(pandas.Series(members['_code'].values, index=members['_doc'].values), len(mask))
+        buckets = [self._grouped_bucket(buckets, code, scores, sub, key=dict(zip(names, key)))
+                   for code, key in enumerate(keys)]
+        result = {'buckets': buckets}
+        if buckets:
+            result['after_key'] = buckets[-1]['key']
+        return result
+
+    def _agg_filter(self, params, mask, scores, sub):
+        return self._bucket(mask & self._filter(params), scores, sub)
+
+    def _agg_missing(self, params, mask, scores, sub):
+        import numpy
+
+        values = self._values(params['field'])
+        present = numpy.zeros(len(mask), dtype=bool)
+        present[values.index.values] = True
+        return self._bucket(mask & ~present, scores, sub)
+
+    def _agg_sampler(self, params, mask, scores, sub):
+        import numpy
+
+        positions = mask.nonzero()[0]
+        top = positions[numpy.argsort(-scores[positions], kind='mergesort')][:params.get('shard_size', 100)]
+        member = numpy.zeros(len(mask), dtype=bool)
+        member[top] = True
+        return self._bucket(member, scores, sub)
+
+    def _agg_random_sampler(self, params, mask, scores, sub):
+        import numpy
+
+        draws = numpy.random.RandomState(params.get('seed', None)).random_sample(len(mask))
+        return self._bucket(mask & (draws < params['probability']), scores, sub)
+
+    def _agg_top_hits(self, params, mask, scores, sub):
+        positions, sort_values = self._sorted(mask.nonzero()[0], params.get('sort', None), scores)
+        size = params.get('size', 3)
+        hits = self._hits(positions[:size], sort_values[:size] if sort_values is not None else None,
+                          scores, params.get('_source', True))
+        return {'hits': {'total': {'value': int(mask.sum()), 'relation': 'eq'}, 'max_score': None, 'hits': hits}}
+
+    def _agg_value_count(self, params, mask, scores, sub):
+        values = self._values(params['field'])
+        return {'value': int(mask[values.index.values].sum()) if len(values) else 0}
+
+    def _agg_cardinality(self, params, mask, scores, sub):
+        values = self._values(params['field'])
+        return {'value': int(values[mask[values.index.values]].nunique()) if len(values) else 0}
+
+    def _agg_sum(self, params, mask, scores, sub):
+        return {'value': float(self._numbers(params['field'], mask).sum())}
+
+    def _agg_avg(self, params, mask, scores, sub):
+        return {'value': _float(self._numbers(params['field'], mask).mean())}
+
+    def _agg_min(self, params, mask, scores, sub):
+        return {'value': _float(self._numbers(params['field'], mask).min())}
+
+    def _agg_max(self, params, mask, scores, sub):
+        return {'value': _float(self._numbers(params['field'], mask).max())}
+
+    def _agg_stats(self, params, mask, scores, sub):
+        values = self._numbers(params['field'], mask)
+        return {'count': len(values), 'min': _float(values.min()), 'max': _float(values.max()),
+                'avg': _float(values.mean()), 'sum': float(values.sum())}
+
+    def _agg_extended_stats(self, params, mask, scores, sub):
+        values = self._numbers(params['field'], mask)
+        stats = self._agg_stats(params, mask, scores, sub)
+        if not len(values):
+            stats.update({'sum_of_squares': None, 'variance': None, 'variance_population': None,
+                          'variance_sampling': None, 'std_deviation': None, 'std_deviation_population': None,
+                          'std_deviation_sampling': None, 'std_deviation_bounds': {'upper': None, 'lower': None}})
+            return stats
+        variance = float(values.var(ddof=0))
+        sampling = float(values.var(ddof=1)) if len(values) > 1 else None
+        std = math.sqrt(variance)
+        sigma = params.get('sigma', 2)
+        stats.update({'sum_of_squares': float((values ** 2).sum()),
+                      'variance': variance,
+                      'variance_population': variance,
+                      'variance_sampling': sampling,
+                      'std_deviation': std,
+                      'std_deviation_population': std,
+                      'std_deviation_sampling': math.sqrt(sampling) if sampling is not None else None,
+                      'std_deviation_bounds': {'upper': stats['avg'] + sigma * std,
+                                               'lower': stats['avg'] - sigma * std}})
+        return stats
+
+    def _agg_percentiles(self, params, mask, scores, sub):
+        values = self._numbers(params['field'], mask)
+        percents = params.get('percents', _default_percents)
+        percentiles = [{'key': float(p), 'value': _float(values.quantile(p / 100.0)) if len(values) else None}
+                       for p in percents]
+        if params.get('keyed', True):
+            return {'values': dict((str(p['key']), p['value']) for p in percentiles)}
+        return {'values': percentiles}
+
+
+class _Buckets(object):
+    """
+    The documents of the buckets of an aggregation, grouped by the code of their key.
+    """
+
+    def __init__(self, keys, length):
+        """
+        :param keys: the key of each value of the documents, indexed by the position of their document
+        :param length: the number of documents
+        """
+        import numpy
+        import pandas
+
+        codes, self.keys = pandas.factorize(keys, sort=True)
+        members = pandas.DataFrame({'_doc': keys.index.values, '_code': codes}).drop_duplicates()
+        order = numpy.argsort(members['_code'].values, kind='mergesort')
+        self.docs = members['_doc'].values[order]
+        self.codes = members['_code'].values[order]
+        self.counts = numpy.bincount(self.codes, minlength=len(self.keys))
+        self.starts = numpy.concatenate([[0], numpy.cumsum(self.counts)])
+        self.length = length
+
+    def count(self, code):
+        return 0 if code is None else int(self.counts[code])
+
+    def member(self, code):
+        """
+        Returns the mask of the documents of a bucket, an empty one for a bucket filled in without documents.
+        """
+        import numpy
+
+        mask = numpy.zeros(self.length, dtype=bool)
+        if code is not None:
+            mask[self.docs[self.starts[code]:self.starts[code + 1]]] = True
+        return mask
+
+
+class _Page(object):
+    """
+    The ordered hits of a search, built page by page.
+    """
+
+    def __init__(self, positions, sort_values, scores, source, collapse, size):
+        self.positions = positions
+        self.sort_values = sort_values
+        self.scores = scores
+        self.source = source
+        self.collapse = collapse
+        self.size = size
+        self.offset = 0
+
+    def next(self, client):
+        start, end = self.offset, self.offset + self.size
+        self.offset = end
+        sort_values = self.sort_values[start:end] if self.sort_values is not None else None
+        return client._hits(self.positions[start:end], sort_values, self.scores, self.source, self.collapse)
+
+
+def _float(value):
+    return None if value is None or math.isnan(value) else float(value)
+
+
+def _is_present(value):
+    if value is None:
+        return False
+    if isinstance(value, float) and math.isnan(value):
+        return False
+    try:
+        import pandas
+        return value is not pandas.NaT
+    except ImportError:
+        return True
+
+
+def _json_value(value):
+    """
+    Converts a value of a Pandas DataFrame to the JSON value of a document.
+    """
+    if isinstance(value, (list, tuple)) or getattr(value, 'ndim', 0) > 0:
+        # lists, or arrays of the list columns of Arrow tables
+        return [_json_value(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _json_value(v)) for k, v in six.iteritems(value))
+    if not _is_present(value):
+        return None
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # NumPy scalars
+        return value.item()
+    return value
+
+
+def _source_patterns(source):
+    if source is True or source is False or source is None:
+        return [], []
+    if isinstance(source, six.string_types):
+        return [source], []
+    if isinstance(source, list):
+        return source, []
+    return source.get('includes', []), source.get('excludes', [])
+
+
+def _included(key, includes, excludes):
+    def matches(pattern):
+        return fnmatch.fnmatchcase(key, pattern) or key.startswith(pattern + '.')
+    if includes and not any(matches(p) for p in includes):
+        return False
+    return not any(matches(p) for p in excludes)
+
+
+def _matches_terms(value, spec):
+    if isinstance(spec, list):
+        return value in spec or six.text_type(value) in [six.text_type(v) for v in spec]
+    return re.match('(?:' + spec + r')\Z', six.text_type(value)) is not None
+
+
+def _order_value(bucket, name):
+    if name == '_count':
+        return bucket['doc_count']
+    if name in ('_key', '_term'):
+        return bucket['key']
+    # a metric sub-aggregation, e.g. 'avg(x)' or 'stats(x).max'
+    agg_name, _, stat = name.partition('.')
+    result = bucket.get(agg_name, {})
+    value = result.get(stat or 'value', result.get('doc_count'))
+    return value if value is not None else float('-inf')
+
+
+def _floor_date(date, interval):
+    unit = _calendar_units.get(interval, None)
+    if unit == 'quarter':
+        date = _floor(date, 'month')
+        return date.replace(month=date.month - (date.month - 1) % 3)
+    if unit is not None:
+        return _floor(date, unit)
+    width = _fixed_millis(interval)
+    millis = int(round((date - datetime.datetime(1970, 1, 1)).total_seconds() * 1000))
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=millis // width * width)
+
+
+def _floor_dates(dates, interval):
+    """
+    Floors a Series of dates to the start of their interval, as :func:`_floor_date` does for a single date.
+    """
+    import pandas
+
+    unit = _calendar_units.get(interval, None)
+    if unit in ('month', 'quarter', 'year'):
+        return dates.dt.to_period({'month': 'M', 'quarter': 'Q', 'year': 'Y'}[unit]).dt.start_time
+    if unit == 'week':
+        return dates.dt.floor('D') - pandas.to_timedelta(dates.dt.weekday, unit='D')
+    if unit is not None:
+        return dates.dt.floor({'minute': 'min', 'hour': 'h', 'day': 'D'}[unit])
+    return dates.dt.floor(pandas.Timedelta(milliseconds=_fixed_millis(interval)))
+
+
+def _next_date(date, interval):
+    unit = _calendar_units.get(interval, None)
+    if unit == 'quarter':
+        return _add(date, 3, 'month')
+    if unit is not None:
+        return _add(date, 1, unit)
+    return date + datetime.timedelta(milliseconds=_fixed_millis(interval))
+
+
+def _fixed_millis(interval):
+    match = re.match(r'^(\d+)(ms|s|m|h|d)$', six.text_type(interval))
+    if match is None:
+        raise _unsupported('the interval [{0}]'.format(interval))
+    return int(match.group(1)) * _fixed_units[match.group(2)]
+
+
+def _format_date(date, date_format):
+    """
+    Formats a date with a Java date format, ``strict_date_optional_time`` by default.
+    """
+    if date_format is None:
+        return date.strftime('%Y-%m-%dT%H:%M:%S.') + '{0:03d}Z'.format(date.microsecond // 1000)
+    pattern = re.compile('|'.join(re.escape(token) for token, _ in _format_tokens) + "|'[^']*'|SSS")
+    tokens = dict(_format_tokens)
+
+    def replace(match):
+        token = match.group(0)
+        if token.startswith("'"):
+            return token[1:-1]
+        if token == 'SSS':
+            return '{0:03d}'.format(date.microsecond // 1000)
+        return date.strftime(tokens[token])
+    return pattern.sub(replace, date_format)
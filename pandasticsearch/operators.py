@@ -1,10 +1,14 @@
 # -*- coding: UTF-8 -*-
 
+import six
+
 _metric_aggs = ('avg', 'min', 'max', 'cardinality', 'value_count', 'sum',
                 'percentiles', 'percentile_ranks', 'stats', 'extended_stats')
 
 _sort_mode = ('min', 'max', 'sum', 'avg', 'median')
 
+_bool_occurs = ('must', 'filter', 'should', 'must_not')
+
 
 class Aggregator(object):
     def __init__(self, field):
@@ -246,7 +250,10 @@ class IsIn(BooleanFilter):
     def __init__(self, field, value):
         super(IsIn, self).__init__()
         assert isinstance(value, list)
-        self._filter = {'terms': {field: value}}
+        if field == '_id':
+            self._filter = {'ids': {'values': value}}
+        else:
+            self._filter = {'terms': {field: value}}
 
 
 class Like(BooleanFilter):
@@ -283,3 +290,41 @@ class ScriptFilter(BooleanFilter):
     def __init__(self, inline, lang=None, params=None):
         super(ScriptFilter, self).__init__()
         self._filter = {'script': Scriptor(inline, lang, params).build()}
+
+
+def conjuncts(filter):
+    """
+    Yields the leaf clauses that a document must satisfy to match ``filter``,
+    i.e. the clauses in AND position of the filter tree (``bool.must`` and ``bool.filter``).
+
+    >>> list(conjuncts(((col('a') > 1) & (col('b') == 2)).build()))
+    [{'range': {'a': {'gt': 1}}}, {'term': {'b': 2}}]
+    """
+    if 'bool' in filter:
+        body = filter['bool']
+    elif set(filter) <= set(_bool_occurs):
+        # combined filters nest the body of their operands, see BooleanFilter.subtree
+        body = filter
+    else:
+        yield filter
+        return
+    for occur in ('must', 'filter'):
+        clauses = body.get(occur, [])
+        if isinstance(clauses, dict):
+            clauses = [clauses]
+        for clause in clauses:
+            for leaf in conjuncts(clause):
+                yield leaf
+
+
+def substitute(filter, clause, replacement):
+    """
+    Returns a copy of ``filter`` in which ``clause``, one of its clauses (the very object), is replaced.
+    """
+    if filter is clause:
+        return replacement
+    if isinstance(filter, dict):
+        return dict((k, substitute(v, clause, replacement)) for k, v in six.iteritems(filter))
+    if isinstance(filter, list):
+        return [substitute(x, clause, replacement) for x in filter]
+    return filter
@@ -1,10 +1,44 @@
 # -*- coding: UTF-8 -*-
 
 import collections
+import heapq
+import itertools
 import json
+import math
 import six
 
-from pandasticsearch.errors import NoSuchDependencyException
+from pandasticsearch.errors import NoSuchDependencyException, ParseResultException
+from pandasticsearch.indices import parse_date
+from pandasticsearch.sketches import HyperLogLog, TDigest
+from pandasticsearch.types import RowSet
+
+_array_policies = ('first', 'explode', 'list')
+
+_bucket_aggs = ('terms', 'range', 'date_histogram', 'histogram')
+_single_bucket_aggs = ('sampler', 'random_sampler', 'filter')
+_default_percents = (1, 5, 25, 50, 75, 95, 99)
+# the percentiles requested from each index to approximate its distribution
+_sketch_percents = (0, 0.1, 0.5) + tuple(range(1, 100)) + (99.5, 99.9, 100)
+
+# Arrow types of the Elasticsearch field types, by name of their pyarrow factory
+_arrow_types = {
+    'long': 'int64',
+    'integer': 'int32',
+    'short': 'int16',
+    'byte': 'int8',
+    'double': 'float64',
+    'float': 'float32',
+    'half_float': 'float32',
+    'scaled_float': 'float64',
+    'boolean': 'bool_',
+    'keyword': 'string',
+    'text': 'string',
+    'string': 'string',
+    'ip': 'string',
+}
+# formats of date fields whose values parse into timestamps, any other format keeping them as strings
+_timestamp_formats = ('strict_date_optional_time', 'date_optional_time', 'strict_date_time', 'date_time',
+                      'strict_date', 'date', 'epoch_millis', 'strict_date_optional_time_nanos')
 
 
 class Query(collections.MutableSequence):
@@ -26,6 +60,12 @@ class Query(collections.MutableSequence):
         """
         raise NotImplementedError('implemented in subclass')
 
+    def to_arrow(self):
+        """
+        Export the current query result to a pyarrow Table.
+        """
+        raise NotImplementedError('implemented in subclass')
+
     def print_json(self):
         indented_json = json.dumps(self._result_dict, sort_keys=True, separators=(',', ': '), indent=4,
                                    ensure_ascii=False)
@@ -49,52 +89,312 @@ class Query(collections.MutableSequence):
         return json.dumps(self._result_dict)
 
     def insert(self, index, value):
-        self._values.insert(index, value)
+        self.result.insert(index, value)
 
     def append(self, value):
-        self._values.append(value)
+        self.result.append(value)
 
     def __str__(self):
-        return str(self._values)
+        return str(self.result)
 
     def __len__(self):
-        return len(self._values)
+        return len(self.result)
 
     def __delitem__(self, index):
-        del self._values[index]
+        del self.result[index]
 
     def __setitem__(self, index, value):
-        self._values[index] = value
+        self.result[index] = value
 
     def __getitem__(self, index):
-        return self._values[index]
+        return self.result[index]
 
 
 class Select(Query):
     def __init__(self):
         super(Select, self).__init__()
+        self._columns = None
 
     def explain_result(self, result=None):
         super(Select, self).explain_result(result)
-        rows = []
-        for hit in self._result_dict['hits']['hits']:
-            row = {}
-            for k in hit.keys():
-                if k == '_source':
-                    row.update(hit['_source'])
-                elif k.startswith('_'):
-                    row[k] = hit[k]
-            rows.append(row)
-        self._values = rows
+        # hits are decoded lazily, either row by row or column by column
+        self._values = None
+        self._columns = None
+
+    @property
+    def result(self):
+        if self._values is None and self._result_dict is not None:
+            multi = Select._multi_valued_fields(self._hits)
+            self._values = [dict(Select._hit_items(hit, multi)) for hit in self._hits]
+        return self._values
+
+    @property
+    def columns(self):
+        """
+        Returns the hits decoded as columns, without building a dictionary for each row.
+
+        :return: an ordered dictionary mapping each field name to the list of its values,
+                 ``None`` standing for the fields missing in a hit
+        """
+        if self._columns is None and self._result_dict is not None:
+            self._columns = Select._decode_columns(self._hits)
+        return self._columns
+
+    @property
+    def _hits(self):
+        return self._result_dict['hits']['hits']
+
+    def __len__(self):
+        if self._values is None and self._result_dict is not None:
+            return len(self._hits)
+        return super(Select, self).__len__()
+
+    def head(self, n):
+        """
+        Returns a :class:`Select` holding the first ``n`` hits of this one.
+        """
+        result = dict(self._result_dict)
+        result['hits'] = dict(result['hits'], hits=self._hits[:n])
+        return Select.from_dict(result)
 
     def to_pandas(self):
         try:
             import pandas
         except ImportError:
             raise NoSuchDependencyException('this method requires pandas library')
-        if self._values:
-            df = pandas.DataFrame(data=self._values)
-            return df
+        if len(self) > 0:
+            if self._values is not None:
+                return pandas.DataFrame(data=self._values)
+            return pandas.DataFrame(data=self.columns)
+
+    def to_arrow(self, types=None, schema=None):
+        """
+        Export the current query result to a pyarrow Table, built from the decoded columns.
+
+        :param dict types: The Elasticsearch type of each column, e.g. ``{'age': 'integer'}``,
+                           typing the table as :meth:`arrow_schema` does
+        :param schema: The pyarrow.Schema of the table, e.g. built by :meth:`arrow_schema`, so that the
+                       tables of several results have the same schema.
+                       Without ``types`` nor ``schema``, the types are inferred from the values.
+        :return: pyarrow.Table
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pyarrow library')
+
+        columns = self.columns or {}
+        if types is not None:
+            schema = Select.arrow_schema(collections.OrderedDict(
+                (name, es_type if isinstance(es_type, dict) else {'type': es_type})
+                for name, es_type in six.iteritems(types)))
+        if schema is None:
+            return pyarrow.Table.from_arrays([pyarrow.array(v) for v in columns.values()],
+                                             names=list(columns.keys()))
+
+        arrays = []
+        for field in schema:
+            values = columns.get(field.name, [None] * len(self))
+            arrays.append(Select._arrow_array(pyarrow, field.name, values, field.type))
+        return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+    @staticmethod
+    def arrow_schema(mappings):
+        """
+        Returns the pyarrow schema of columns typed after their mappings: objects as structs of their properties,
+        nested fields as lists of structs, dates as UTC timestamps (as strings for custom formats),
+        and the types without Arrow equivalent as strings, holding the JSON of values other than strings.
+
+        :param mappings: An ordered dictionary of the mapping of each column, e.g. ``{'age': {'type': 'integer'}}``
+        :return: pyarrow.Schema
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pyarrow library')
+        return pyarrow.schema([pyarrow.field(name, Select._arrow_type(pyarrow, spec))
+                               for name, spec in six.iteritems(mappings)])
+
+    @classmethod
+    def _arrow_type(cls, pyarrow, spec):
+        es_type = spec.get('type', 'object' if 'properties' in spec else None)
+        if 'properties' in spec:
+            struct = pyarrow.struct([pyarrow.field(k, Select._arrow_type(pyarrow, v))
+                                     for k, v in sorted(six.iteritems(spec['properties']))])
+            return pyarrow.list_(struct) if es_type == 'nested' else struct
+        if es_type in ('date', 'date_nanos'):
+            formats = spec.get('format', 'strict_date_optional_time').split('||')
+            if all(f in _timestamp_formats for f in formats):
+                return pyarrow.timestamp('ms', tz='UTC')
+            return pyarrow.string()
+        if es_type in _arrow_types:
+            return getattr(pyarrow, _arrow_types[es_type])()
+        return pyarrow.string()
+
+    @classmethod
+    def _arrow_array(cls, pyarrow, name, values, arrow_type):
+        if not (pyarrow.types.is_integer(arrow_type) or pyarrow.types.is_floating(arrow_type) or
+                pyarrow.types.is_boolean(arrow_type)):
+            try:
+                values = [Select._arrow_value(pyarrow, v, arrow_type) for v in values]
+            except ValueError:
+                raise ParseResultException('Cannot convert column [{0}] to {1}'.format(name, arrow_type))
+        try:
+            return pyarrow.array(values, arrow_type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            try:
+                return pyarrow.array(values).cast(arrow_type)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+                raise ParseResultException('Cannot convert column [{0}] to {1}'.format(name, arrow_type))
+
+    @classmethod
+    def _arrow_value(cls, pyarrow, value, arrow_type):
+        """
+        Converts a value of ``_source`` into the Python value of an Arrow type, raising ValueError if it cannot.
+        """
+        if value is None:
+            return None
+        if pyarrow.types.is_timestamp(arrow_type):
+            date = parse_date(value)
+            if date is None:
+                raise ValueError(value)
+            return date
+        if pyarrow.types.is_struct(arrow_type):
+            if not isinstance(value, dict):
+                raise ValueError(value)
+            return dict((field.name, Select._arrow_value(pyarrow, value.get(field.name), field.type))
+                        for field in arrow_type)
+        if pyarrow.types.is_list(arrow_type):
+            items = value if isinstance(value, list) else [value]
+            return [Select._arrow_value(pyarrow, item, arrow_type.value_type) for item in items]
+        if pyarrow.types.is_string(arrow_type) and not isinstance(value, six.string_types):
+            return json.dumps(value)
+        return value
+
+    def flatten(self, paths, arrays='list'):
+        """
+        Returns the hits with a flat column for each dotted path of the (nested) fields of ``_source``,
+        extracted in a single pass, followed by the script fields and runtime fields of ``fields``.
+        The values of an array of objects are gathered into a list.
+
+        :param paths: The dotted paths of the fields to extract, e.g. ``['user.name', 'user.age']``
+        :param str arrays: How multi-valued fields are handled: ``'list'`` keeps the list in the cell,
+                           ``'first'`` keeps the first value, ``'explode'`` makes a row per value
+                           (a row per combination when several fields of a hit are multi-valued)
+        :return: :class:`RowSet <pandasticsearch.types.RowSet>`
+        """
+        if arrays not in _array_policies:
+            raise ValueError('arrays must be one of {0}'.format(_array_policies))
+
+        keys = [path.split('.') for path in paths]
+        extracted = set(paths)
+        multi = Select._multi_valued_fields(self._hits)
+        columns = collections.OrderedDict()
+        length = 0
+
+        for hit in self._hits:
+            # fields are unwrapped as in the columns of the hits, a collapse key is already in _source
+            fields = [(name, values if name in multi else (values[0] if values else None))
+                      for name, values in six.iteritems(hit.get('fields', {})) if name not in extracted]
+            names = list(paths) + [name for name, _ in fields]
+            values = [Select._extract(hit.get('_source', {}), k) for k in keys] + [v for _, v in fields]
+            if arrays == 'first':
+                rows = [[(v[0] if v else None) if isinstance(v, list) else v for v in values]]
+            elif arrays == 'explode':
+                rows = itertools.product(*[v if isinstance(v, list) and v else [v] for v in values])
+            else:
+                rows = [values]
+
+            meta = [(k, v) for k, v in six.iteritems(hit) if k.startswith('_') and k != '_source']
+            for row in rows:
+                for k, v in itertools.chain(meta, zip(names, row)):
+                    if k not in columns:
+                        columns[k] = [None] * length
+                    columns[k].append(v)
+                length += 1
+                for column in columns.values():
+                    if len(column) < length:
+                        column.append(None)
+
+        for path in paths:
+            if path not in columns:
+                columns[path] = [None] * length
+        return RowSet(columns, length)
+
+    @classmethod
+    def _extract(cls, value, keys):
+        if not keys:
+            return value
+        if isinstance(value, list):
+            # gather the field of each object of the array
+            gathered = []
+            for item in value:
+                v = Select._extract(item, keys)
+                if isinstance(v, list):
+                    gathered.extend(v)
+                elif v is not None:
+                    gathered.append(v)
+            return gathered or None
+        if not isinstance(value, dict):
+            return None
+
+        found = None
+        if keys[0] in value:
+            found = Select._extract(value[keys[0]], keys[1:])
+        # the document may also hold dotted field names
+        i = 2
+        while found is None and i <= len(keys):
+            name = '.'.join(keys[:i])
+            if name in value:
+                found = Select._extract(value[name], keys[i:])
+            i += 1
+        return found
+
+    @classmethod
+    def _hit_items(cls, hit, multi=()):
+        for k, v in six.iteritems(hit):
+            if k == '_source':
+                for item in six.iteritems(v):
+                    yield item
+            elif k == 'fields':
+                # script fields and runtime fields, always returned as arrays
+                source = hit.get('_source', {})
+                for name, values in six.iteritems(v):
+                    if name in source:
+                        continue
+                    if name in multi:
+                        yield name, values
+                    else:
+                        yield name, values[0] if values else None
+            elif k.startswith('_'):
+                yield k, v
+
+    @classmethod
+    def _multi_valued_fields(cls, hits):
+        """
+        Returns the names of the ``fields`` holding several values in some hit, which are kept as lists
+        in all the hits so that a column does not mix values and lists.
+        """
+        multi = set()
+        for hit in hits:
+            for name, values in six.iteritems(hit.get('fields', {})):
+                if len(values) > 1:
+                    multi.add(name)
+        return multi
+
+    @classmethod
+    def _decode_columns(cls, hits):
+        columns = collections.OrderedDict()
+        multi = Select._multi_valued_fields(hits)
+        for i, hit in enumerate(hits):
+            for k, v in Select._hit_items(hit, multi):
+                if k not in columns:
+                    columns[k] = [None] * i
+                columns[k].append(v)
+            for values in columns.values():
+                if len(values) <= i:
+                    values.append(None)
+        return columns
 
     @staticmethod
     def from_dict(d):
@@ -102,6 +402,73 @@ class Select(Query):
         query.explain_result(d)
         return query
 
+    @staticmethod
+    def merge(results, sort=None, size=None, unique=False, collapse=None):
+        """
+        Merges the results of the same query run against several indexes.
+
+        :param results: The search results as dictionaries
+        :param sort: The sort of the query, whose order the hits of each result follow
+        :param int size: The maximum number of hits to keep
+        :param bool unique: Whether a document found in several results is kept only once
+        :param str collapse: The field the results were collapsed on, of which only the first hit per value is kept
+        :return: :class:`Select`
+        """
+        return Select.from_dict({
+            'took': max([result['took'] for result in results] or [0]),
+            'hits': {'hits': Select._merge_hits([result['hits']['hits'] for result in results],
+                                                sort, size, unique, collapse)}
+        })
+
+    @classmethod
+    def _merge_hits(cls, hits, sort=None, size=None, unique=False, collapse=None):
+        if sort:
+            orders = [Select._sort_order(s) for s in sort]
+            # hits carry their sort values, which a k-way merge can compare
+            keyed = [((_SortKey(hit.get('sort', ()), orders), i, j, hit) for j, hit in enumerate(h))
+                     for i, h in enumerate(hits)]
+            merged = (x[-1] for x in heapq.merge(*keyed))
+        else:
+            merged = itertools.chain(*hits)
+        if unique:
+            merged = Select._unique_hits(merged)
+        if collapse is not None:
+            merged = Select._collapse_hits(merged, collapse)
+        if size is not None:
+            merged = itertools.islice(merged, size)
+        return list(merged)
+
+    @classmethod
+    def _collapse_hits(cls, hits, field):
+        seen = set()
+        for hit in hits:
+            # collapsed hits carry the value they were collapsed on
+            value = hit.get('fields', {}).get(field, hit.get('_source', {}).get(field))
+            key = json.dumps(value, sort_keys=True)
+            if key not in seen:
+                seen.add(key)
+                yield hit
+
+    @classmethod
+    def _unique_hits(cls, hits):
+        seen = set()
+        for hit in hits:
+            if '_id' in hit:
+                key = (hit.get('_index'), hit['_id'])
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield hit
+
+    @classmethod
+    def _sort_order(cls, sort):
+        if isinstance(sort, six.string_types):
+            return 'desc' if sort == '_score' else 'asc'
+        name, spec = list(sort.items())[0]
+        if isinstance(spec, dict):
+            return spec.get('order', 'desc' if name == '_score' else 'asc')
+        return spec
+
     @classmethod
     def _stringfy_value(cls, value):
         b = six.StringIO()
@@ -113,41 +480,80 @@ class Select(Query):
 
     def result_as_tabular(self, cols, n, truncate=20):
         b = six.StringIO()
-        widths = []
-        tavnit = '|'
-        separator = '+'
-
-        for col in cols:
-            maxlen = len(col)
-            for kv in self.result[:n]:
-                if col in kv:
-                    s = Select._stringfy_value(kv[col])
-                else:
-                    s = '(NULL)'
-                if len(s) > maxlen:
-                    maxlen = len(s)
-            widths.append(min(maxlen, truncate))
-
-        for w in widths:
-            tavnit += ' %-' + '%ss |' % (w,)
-            separator += '-' * w + '--+'
-
-        b.write(separator + '\n')
-        b.write(tavnit % tuple(cols) + '\n')
-        b.write(separator + '\n')
-        for kv in self.result[:n]:
-            row = []
+        Select.write_tabular(b, [self], cols, n, truncate)
+        return b.getvalue()
+
+    def _iter_rows(self):
+        if self._values is not None:
+            return iter(self._values)
+        multi = Select._multi_valued_fields(self._hits)
+        return (dict(Select._hit_items(hit, multi)) for hit in self._hits)
+
+    @classmethod
+    def write_tabular(cls, out, selects, cols, n, truncate=20):
+        """
+        Writes the first ``n`` rows of a sequence of results into ``out`` as a table,
+        formatting each row once as it is decoded.
+        Column widths are fitted to the first result, later results are cut to the same widths.
+
+        :param out: A file-like object to write to
+        :param selects: An iterable of :class:`Select` results, e.g. the pages of a scroll
+        :param cols: The columns to print
+        :param int n: The maximum number of rows to print
+        :param int truncate: The maximum width of a column
+        :return: The milliseconds taken by Elasticsearch to produce the printed results
+        """
+        def format_row(row):
+            cells = []
             for col in cols:
-                if col in kv:
-                    s = Select._stringfy_value(kv[col])
+                if col in row:
+                    s = Select._stringfy_value(row[col])
                     if len(s) > truncate:
                         s = s[:truncate - 3] + '...'
                 else:
                     s = '(NULL)'
-                row.append(s)
-            b.write(tavnit % tuple(row) + '\n')
-        b.write(separator + '\n')
-        return b.getvalue()
+                cells.append(s)
+            return cells
+
+        def fit(cells):
+            return tuple(s if len(s) <= w else s[:w - 3] + '...' for s, w in zip(cells, widths))
+
+        def write_header():
+            tavnit = '|' + ''.join(' %-' + '%ss |' % (w,) for w in widths)
+            separator = '+' + ''.join('-' * w + '--+' for w in widths)
+            out.write(separator + '\n')
+            out.write(tavnit % tuple(cols) + '\n')
+            out.write(separator + '\n')
+            return tavnit, separator
+
+        widths = None
+        tavnit = separator = None
+        remaining = n
+        millis = 0
+
+        for select in selects:
+            millis += select.millis_taken or 0
+            rows = itertools.islice(select._iter_rows(), remaining)
+
+            if widths is None:
+                rows = [tuple(format_row(row)) for row in rows]
+                widths = [min(max([len(col)] + [len(cells[i]) for cells in rows]), truncate)
+                          for i, col in enumerate(cols)]
+                tavnit, separator = write_header()
+            else:
+                rows = (fit(format_row(row)) for row in rows)
+
+            for cells in rows:
+                out.write(tavnit % cells + '\n')
+                remaining -= 1
+            if remaining <= 0:
+                break
+
+        if widths is None:
+            widths = [min(len(col), truncate) for col in cols]
+            tavnit, separator = write_header()
+        out.write(separator + '\n')
+        return millis
 
 
 class Agg(Query):
@@ -186,6 +592,16 @@ class Agg(Query):
                 df = pandas.DataFrame(data=self._values)
             return df
 
+    def to_arrow(self):
+        """
+        Export the current query result to a pyarrow Table, through its Pandas DataFrame.
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pyarrow library')
+        return pyarrow.Table.from_pandas(self.to_pandas())
+
     @classmethod
     def _process_agg(cls, bucket, indexes=(), names=()):
         """
@@ -208,6 +624,16 @@ class Agg(Query):
                                                   indexes + (key,),
                                                   names + (k,)):
                             yield x
+                elif 'doc_count' in v:  # single bucket, e.g. sampler
+                    rows = list(Agg._process_agg(v, indexes, names))
+                    # the bucket's own row is only kept when it does not hold sub-buckets
+                    nested = [x for x in rows if len(x[1]) > len(indexes)]
+                    for x in nested or rows:
+                        yield x
+                elif 'hits' in v:  # top_hits
+                    hits = v['hits']['hits']
+                    if hits:
+                        row.update(hits[0].get('_source', {}))
                 elif 'value' in v:
                     row[k] = v['value']
                 elif 'values' in v:  # percentiles
@@ -221,8 +647,206 @@ class Agg(Query):
         if len(row) > 0:
             yield (names, indexes, row)
 
+    @staticmethod
+    def merge(results, aggregations):
+        """
+        Merges the results of the same aggregations run against several indexes.
+        Buckets are matched by key, counts and sums are added, minimums and maximums are compared.
+        The ``terms`` buckets are then ranked again by count and cut to their size.
+
+        Averages, distinct counts and percentiles can only be merged when they were requested as rewritten
+        by :meth:`mergeable`: distinct counts are then estimated from the merged HyperLogLog sketches of
+        the indexes, percentiles from the merged t-digests approximating their distributions.
+        The percentiles of a single result are returned as computed.
+
+        :param results: The search results as dictionaries
+        :param dict aggregations: The aggregations originally requested
+        :return: :class:`Agg`
+        """
+        return Agg.from_dict({
+            'took': max([result['took'] for result in results] or [0]),
+            'aggregations': Agg._merge_aggs(aggregations, [result['aggregations'] for result in results])
+        })
+
+    @staticmethod
+    def mergeable(aggregations, compat=7, sketches=True):
+        """
+        Returns a copy of the aggregations whose results can be merged by :meth:`merge`:
+
+        * averages are requested as ``stats``, so that they can be recombined from their sums and counts,
+        * distinct counts of fields as the registers of a HyperLogLog sketch, through a ``scripted_metric``,
+        * percentiles on a dense grid of percents, along with the count of their values.
+
+        :param int compat: The compatible ES version, see :meth:`HyperLogLog.scripted_metric`
+        :param bool sketches: Whether distinct counts are rewritten, which requires scripting on the cluster;
+                              otherwise they are kept as ``cardinality`` aggregations, which cannot be merged
+        """
+        rewritten = {}
+        for name, body in six.iteritems(aggregations):
+            body = dict(body)
+            for key in ('aggregations', 'aggs'):
+                if key in body:
+                    body[key] = Agg.mergeable(body[key], compat, sketches)
+            if 'avg' in body:
+                body['stats'] = body.pop('avg')
+            elif sketches and 'cardinality' in body and 'field' in body['cardinality']:
+                body.update(HyperLogLog.scripted_metric(body.pop('cardinality')['field'], compat=compat))
+            elif 'percentiles' in body:
+                params = dict(body['percentiles'])
+                percents = set(params.get('percents', _default_percents)) | set(_sketch_percents)
+                params.update(percents=sorted(percents), keyed=True)
+                body['percentiles'] = params
+                counted = dict((k, v) for k, v in six.iteritems(params) if k in ('field', 'script'))
+                rewritten[Agg._count_name(name)] = {'value_count': counted}
+            rewritten[name] = body
+        return rewritten
+
+    @staticmethod
+    def _count_name(name):
+        return '{0}#count'.format(name)
+
+    @classmethod
+    def _merge_aggs(cls, aggregations, parts):
+        merged = {}
+        for name, body in six.iteritems(aggregations):
+            values = [part[name] for part in parts if name in part]
+            sub = body.get('aggregations', body.get('aggs', None))
+            agg_type = [k for k in body if k not in ('aggregations', 'aggs', 'meta')][0]
+
+            if agg_type in _bucket_aggs:
+                merged[name] = {'buckets': Agg._merge_buckets(agg_type, body[agg_type], sub, values)}
+            elif agg_type == 'top_hits':
+                params = body[agg_type]
+                hits = Select._merge_hits([v['hits']['hits'] for v in values], params.get('sort', None),
+                                          params.get('size', 3))
+                merged[name] = {'hits': {'hits': hits}}
+            elif agg_type == 'percentiles':
+                counts = [part.get(Agg._count_name(name), None) for part in parts if name in part]
+                merged[name] = Agg._merge_percentiles(name, body[agg_type], values, counts)
+            elif agg_type in _single_bucket_aggs:
+                bucket = {'doc_count': sum(v['doc_count'] for v in values)}
+                if sub:
+                    bucket.update(Agg._merge_aggs(sub, values))
+                merged[name] = bucket
+            else:
+                merged[name] = Agg._merge_metric(name, agg_type, values)
+        return merged
+
+    @classmethod
+    def _merge_buckets(cls, agg_type, params, sub, values):
+        groups = collections.OrderedDict()
+        for v in values:
+            for bucket in v['buckets']:
+                groups.setdefault(bucket['key'], []).append(bucket)
+
+        buckets = []
+        for group in six.itervalues(groups):
+            bucket = dict((k, v) for k, v in six.iteritems(group[0]) if k in ('key', 'key_as_string', 'from', 'to'))
+            bucket['doc_count'] = sum(b['doc_count'] for b in group)
+            if sub:
+                bucket.update(Agg._merge_aggs(sub, group))
+            buckets.append(bucket)
+
+        if agg_type == 'terms':
+            buckets.sort(key=lambda b: -b['doc_count'])
+            buckets = buckets[:params.get('size', 10)]
+        elif agg_type in ('date_histogram', 'histogram'):
+            buckets.sort(key=lambda b: b['key'])
+        return buckets
+
+    @classmethod
+    def _merge_metric(cls, name, agg_type, values):
+        if agg_type in ('sum', 'value_count'):
+            return {'value': sum(v['value'] or 0 for v in values)}
+        elif agg_type in ('min', 'max'):
+            present = [v['value'] for v in values if v['value'] is not None]
+            if not present:
+                return {'value': None}
+            return {'value': min(present) if agg_type == 'min' else max(present)}
+        elif agg_type in ('avg', 'stats', 'extended_stats'):
+            stats = Agg._merge_stats(values, agg_type == 'extended_stats')
+            if agg_type == 'avg':
+                return {'value': stats['avg']}
+            return stats
+        elif agg_type == 'cardinality' and all(isinstance(v['value'], list) for v in values):
+            sketch = HyperLogLog.from_registers(values[0]['value'])
+            for v in values[1:]:
+                sketch.merge(HyperLogLog.from_registers(v['value']))
+            return {'value': sketch.cardinality()}
+        raise ParseResultException('Cannot merge [{0}] aggregation [{1}] across indexes'.format(agg_type, name))
+
+    @classmethod
+    def _merge_percentiles(cls, name, params, values, counts):
+        percents = params.get('percents', _default_percents)
+        if len(values) == 1:
+            # a single result is decoded as computed by the cluster, on the requested percents only
+            computed = values[0]['values']
+            if isinstance(computed, dict):
+                computed = [{'key': k, 'value': v} for k, v in six.iteritems(computed)]
+            computed = dict((round(float(v['key']), 6), v['value']) for v in computed)
+            merged = [{'key': float(p), 'value': computed.get(round(float(p), 6))} for p in percents]
+        else:
+            if any(count is None for count in counts):
+                raise ParseResultException('Cannot merge [percentiles] aggregation [{0}] across indexes'.format(name))
+            digest = TDigest()
+            for v, count in zip(values, counts):
+                digest.merge(TDigest.from_percentiles(v['values'], count['value']))
+            merged = [{'key': float(p), 'value': digest.percentile(p)} for p in percents]
+        if params.get('keyed', True):
+            return {'values': dict((str(float(p['key'])), p['value']) for p in merged)}
+        return {'values': merged}
+
+    @classmethod
+    def _merge_stats(cls, values, extended=False):
+        values = [v for v in values if v['count']]
+        count = sum(v['count'] for v in values)
+        if count == 0:
+            stats = {'count': 0, 'min': None, 'max': None, 'avg': None, 'sum': 0}
+            if extended:
+                stats.update({'sum_of_squares': None, 'variance': None, 'std_deviation': None})
+            return stats
+
+        total = sum(v['sum'] for v in values)
+        stats = {'count': count,
+                 'min': min(v['min'] for v in values),
+                 'max': max(v['max'] for v in values),
+                 'avg': float(total) / count,
+                 'sum': total}
+        if extended:
+            sum_of_squares = sum(v['sum_of_squares'] for v in values)
+            variance = max(sum_of_squares / count - stats['avg'] ** 2, 0.0)
+            std_deviation = math.sqrt(variance)
+            stats.update({'sum_of_squares': sum_of_squares,
+                          'variance': variance,
+                          'std_deviation': std_deviation,
+                          'std_deviation_bounds': {'upper': stats['avg'] + 2 * std_deviation,
+                                                   'lower': stats['avg'] - 2 * std_deviation}})
+        return stats
+
     @staticmethod
     def from_dict(d):
         agg = Agg()
         agg.explain_result(d)
         return agg
+
+
+class _SortKey(object):
+    """
+    Compares the sort values of hits following the orders of the sort, missing values last.
+    """
+    __slots__ = ('values', 'orders')
+
+    def __init__(self, values, orders):
+        self.values = values
+        self.orders = orders
+
+    def __lt__(self, other):
+        for a, b, order in zip(self.values, other.values, self.orders):
+            if a == b:
+                continue
+            if a is None:
+                return False
+            if b is None:
+                return True
+            return a > b if order == 'desc' else a < b
+        return False
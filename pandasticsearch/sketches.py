@@ -0,0 +1,305 @@
+# -*- coding: UTF-8 -*-
+
+import bisect
+import math
+
+import six
+
+_hash_bits = 32
+
+
+def _fmix32(h):
+    # the finalizer of MurmurHash3, spreading the bits of a hash code
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h
+
+
+def _hash(value):
+    """
+    Hashes a value like the ``scripted_metric`` of :meth:`HyperLogLog.scripted_metric` does on the cluster:
+    the Java hash code of the string of the value, mixed by the MurmurHash3 finalizer.
+    """
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    text = six.text_type(value).encode('utf-16-be')
+    h = 0
+    for i in range(0, len(text), 2):
+        h = (31 * h + (six.indexbytes(text, i) << 8 | six.indexbytes(text, i + 1))) & 0xffffffff
+    return _fmix32(h)
+
+
+class HyperLogLog(object):
+    """
+    A HyperLogLog sketch of the distinct values of a column, whose relative error is about ``1.04 / sqrt(2 ** precision)``.
+
+    Two sketches of the same precision are merged by keeping the maximum of each register, so that the sketches
+    of disjoint partitions of the data (indexes, time chunks, pages of hits) merge into the sketch of their union.
+
+    >>> from pandasticsearch.sketches import HyperLogLog
+    >>> hll = HyperLogLog()
+    >>> hll.update(['a', 'b', 'a'])
+    >>> hll.merge(HyperLogLog.from_values(['b', 'c'])).cardinality()
+    3
+    """
+
+    def __init__(self, precision=12, registers=None):
+        """
+        :param int precision: The number of bits of the hash selecting the register, between 4 and 16
+        :param list registers: The registers of an existing sketch
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError('The precision of HyperLogLog must be between 4 and 16')
+        self.precision = precision
+        self.registers = list(registers) if registers is not None else [0] * (1 << precision)
+        if len(self.registers) != 1 << precision:
+            raise ValueError('A HyperLogLog of precision {0} has {1} registers'.format(precision, 1 << precision))
+
+    @staticmethod
+    def from_values(values, precision=12):
+        hll = HyperLogLog(precision)
+        hll.update(values)
+        return hll
+
+    def add(self, value):
+        """
+        Adds a value to the sketch, ``None`` being ignored.
+        """
+        if value is None:
+            return
+        h = _hash(value)
+        bits = _hash_bits - self.precision
+        register = h >> bits
+        rest = h & ((1 << bits) - 1)
+        # the position of the leftmost 1 in the remaining bits
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def update(self, values):
+        """
+        Adds values to the sketch, the items of lists (multi-valued fields) being added one by one.
+        """
+        for value in values:
+            if isinstance(value, list):
+                self.update(value)
+            else:
+                self.add(value)
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one.
+
+        :return: this sketch
+        """
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precisions')
+        self.registers = [max(a, b) for a, b in zip(self.registers, other.registers)]
+        return self
+
+    def cardinality(self):
+        """
+        Returns the estimated number of distinct values.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting, more accurate for small cardinalities
+            estimate = m * math.log(float(m) / zeros)
+        elif estimate > (1 << _hash_bits) / 30.0:
+            # hash collisions
+            estimate = -(1 << _hash_bits) * math.log(1 - estimate / (1 << _hash_bits))
+        return int(round(estimate))
+
+    @staticmethod
+    def scripted_metric(field, precision=12, compat=7):
+        """
+        Returns the body of a ``scripted_metric`` aggregation computing the registers of the sketch
+        of a field on the cluster, so that the sketches of several searches can be merged on the client.
+        The value of the aggregation is the list of registers, see :meth:`from_registers`.
+
+        :param str field: The field, whose values are hashed as strings
+        :param int precision: The precision of the sketch
+        :param int compat: The compatible ES version, the state of the scripts being named differently before ES 7
+        """
+        state, states = ('state', 'states') if compat >= 7 else ('params._agg', 'params._aggs')
+        bits = _hash_bits - precision
+        return {'scripted_metric': {
+            'init_script': '{0}.registers = new int[{1}];'.format(state, 1 << precision),
+            'map_script': (
+                'for (def v : doc[params.field]) {{'
+                ' int h = String.valueOf(v).hashCode();'
+                ' h ^= h >>> 16; h *= -2048144789; h ^= h >>> 13; h *= -1028477387; h ^= h >>> 16;'
+                ' int r = h >>> {1};'
+                ' int rank = Integer.numberOfLeadingZeros((h << {2}) | (1 << {3})) + 1;'
+                ' if (rank > {0}.registers[r]) {{ {0}.registers[r] = rank; }}'
+                ' }}').format(state, bits, precision, precision - 1),
+            'combine_script': 'return {0}.registers;'.format(state),
+            'reduce_script': (
+                'int[] merged = new int[{1}];'
+                ' for (def s : {0}) {{ if (s != null) {{'
+                ' for (int i = 0; i < merged.length; ++i) {{ merged[i] = (int) Math.max(merged[i], s[i]); }}'
+                ' }} }}'
+                ' return merged;').format(states, 1 << precision),
+            'params': {'field': field},
+        }}
+
+    @staticmethod
+    def from_registers(registers):
+        """
+        Returns the sketch of the registers computed by :meth:`scripted_metric`.
+        """
+        return HyperLogLog(int(math.log(len(registers), 2)), registers)
+
+
+class TDigest(object):
+    """
+    A t-digest sketch of the distribution of a numeric column, answering quantiles with an error
+    which is smallest for the extreme quantiles. Sketches are merged by merging their centroids.
+
+    >>> from pandasticsearch.sketches import TDigest
+    >>> digest = TDigest.from_values(range(1, 101))
+    >>> digest.merge(TDigest.from_values(range(101, 201))).percentile(50)
+    100.5
+    """
+
+    def __init__(self, compression=100):
+        """
+        :param int compression: The maximum number of centroids is about twice the compression
+        """
+        self.compression = compression
+        self._centroids = []   # [mean, weight], ordered by mean
+        self._buffer = []
+        self._min = None
+        self._max = None
+
+    @staticmethod
+    def from_values(values, compression=100):
+        digest = TDigest(compression)
+        digest.update(values)
+        return digest
+
+    @staticmethod
+    def from_percentiles(values, count, compression=100):
+        """
+        Approximates a distribution from some of its percentiles, as returned by a ``percentiles`` aggregation:
+        the values between two consecutive percentiles are assumed to be uniformly distributed.
+
+        :param values: The percentiles, as a dictionary ``{'25.0': 11.5}`` or a list ``[{'key': 25.0, 'value': 11.5}]``
+        :param int count: The number of values the percentiles were computed on
+        """
+        if isinstance(values, dict):
+            values = [{'key': k, 'value': v} for k, v in six.iteritems(values)]
+        points = sorted((float(v['key']), v['value']) for v in values if v['value'] is not None)
+        digest = TDigest(compression)
+        if not count or not points:
+            return digest
+        if len(points) == 1:
+            digest.add(points[0][1], count)
+            return digest
+
+        digest._min, digest._max = points[0][1], points[-1][1]
+        for (p1, v1), (p2, v2) in zip(points, points[1:]):
+            weight = count * (p2 - p1) / (points[-1][0] - points[0][0])
+            if weight > 0:
+                digest._buffer.append([(v1 + v2) / 2.0, weight])
+        digest._compress()
+        return digest
+
+    @property
+    def count(self):
+        return sum(w for _, w in self._centroids) + sum(w for _, w in self._buffer)
+
+    def add(self, value, weight=1):
+        """
+        Adds a value to the sketch, ``None`` being ignored.
+        """
+        if value is None:
+            return
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+        self._buffer.append([value, weight])
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def update(self, values):
+        """
+        Adds values to the sketch, the items of lists (multi-valued fields) being added one by one.
+        """
+        for value in values:
+            if isinstance(value, list):
+                self.update(value)
+            else:
+                self.add(value)
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one.
+
+        :return: this sketch
+        """
+        if other._min is not None:
+            self._min = other._min if self._min is None else min(self._min, other._min)
+            self._max = other._max if self._max is None else max(self._max, other._max)
+        self._buffer.extend([m, w] for m, w in other._centroids + other._buffer)
+        self._compress()
+        return self
+
+    def _compress(self):
+        centroids = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        total = float(sum(w for _, w in centroids))
+        merged = []
+        seen = 0.0
+        for mean, weight in centroids:
+            if merged:
+                last = merged[-1]
+                q = (seen + (last[1] + weight) / 2.0) / total
+                # the centroids are kept small near the extremes, where quantiles need precision
+                if last[1] + weight <= 4 * total * q * (1 - q) / self.compression:
+                    last[0] += (mean - last[0]) * weight / (last[1] + weight)
+                    last[1] += weight
+                    continue
+                seen += last[1]
+            merged.append([mean, weight])
+        self._centroids = merged
+
+    def quantile(self, q):
+        """
+        Returns the estimated ``q`` quantile, between 0 and 1, or ``None`` for an empty sketch.
+        """
+        if self._buffer:
+            self._compress()
+        if not self._centroids:
+            return None
+        if q <= 0:
+            return self._min
+        if q >= 1:
+            return self._max
+
+        total = float(sum(w for _, w in self._centroids))
+        # the cumulated weight at the mean of each centroid, half of its weight being below
+        positions, seen = [], 0.0
+        for _, weight in self._centroids:
+            positions.append(seen + weight / 2.0)
+            seen += weight
+        means = [mean for mean, _ in self._centroids]
+        points = [(0.0, self._min)] + list(zip(positions, means)) + [(total, self._max)]
+
+        target = q * total
+        i = bisect.bisect_left([p for p, _ in points], target)
+        (p1, v1), (p2, v2) = points[max(i - 1, 0)], points[min(i, len(points) - 1)]
+        if p2 == p1:
+            return v1
+        return v1 + (v2 - v1) * (target - p1) / (p2 - p1)
+
+    def percentile(self, percent):
+        """
+        Returns the estimated percentile, between 0 and 100.
+        """
+        return self.quantile(percent / 100.0)
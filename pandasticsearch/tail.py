@@ -0,0 +1,143 @@
+# -*- coding: UTF-8 -*-
+
+import time
+
+from pandasticsearch.errors import DataFrameException, NoSuchDependencyException
+from pandasticsearch.queries import Select
+from pandasticsearch.types import RowSet
+
+
+class Tail(object):
+    """
+    Fetches the documents of a :class:`DataFrame <pandasticsearch.DataFrame>` incrementally, in the order of
+    a time field: each fetch returns the documents which come after the high-water mark of the previous one.
+
+    The high-water mark is the sort values (time, then tiebreaker) of the last document fetched. Without a
+    tiebreaker, the documents sharing the time of the mark are told apart by their ``_id``.
+
+    >>> tail = df.tail('timestamp', since='now-1h')
+    >>> tail.fetch()    # the documents of the last hour
+    >>> tail.fetch()    # the documents indexed since
+    >>> for rows in tail.follow(interval=10):
+    ...     process(rows)
+    """
+
+    def __init__(self, frame, time_field, since=None, tiebreaker=None, batch_size=1000):
+        """
+        :param frame: The :class:`DataFrame <pandasticsearch.DataFrame>` to fetch from
+        :param str time_field: The date (or numeric) field the documents are fetched in the order of
+        :param since: The time of the first documents to fetch, in any format of a range filter on the field
+        :param str tiebreaker: A field whose values are unique among the documents of the same time
+        :param int batch_size: The number of documents fetched per request
+        """
+        if frame._aggregation or frame._groupby:
+            raise DataFrameException('tail() is not allowed for aggregation')
+        self._frame = frame
+        self._time_field = time_field
+        # the sort values of dates are epoch millis, which a custom format of the field would not parse
+        self._is_date = frame._mapping is not None and \
+            frame._get_field_types(frame._mapping).get(time_field) == 'date'
+        self._since = since
+        self._tiebreaker = tiebreaker
+        self._batch_size = batch_size
+        self._watermark = None
+        self._seen = set()
+
+    @property
+    def watermark(self):
+        """
+        Returns the sort values of the last document fetched, or ``None`` before any document is.
+        """
+        return self._watermark
+
+    def _query(self):
+        if self._watermark is not None:
+            bound = {'range': {self._time_field: {'gte': self._watermark[0]}}}
+            if self._is_date:
+                bound['range'][self._time_field]['format'] = 'epoch_millis'
+        elif self._since is not None:
+            bound = {'range': {self._time_field: {'gte': self._since}}}
+        else:
+            # documents without time would sort last, beyond any later document
+            bound = {'exists': {'field': self._time_field}}
+
+        sort = [{self._time_field: {'order': 'asc'}}]
+        if self._tiebreaker is not None:
+            sort.append({self._tiebreaker: {'order': 'asc'}})
+        frame = self._frame._copy(filter=self._frame._and_filter(bound), sort=sort, limit=None)
+        query = frame._build_query()
+        query['size'] = self._batch_size
+        return frame, query
+
+    def _is_new(self, hit):
+        if self._watermark is None:
+            return True
+        values = hit.get('sort', [])
+        if self._tiebreaker is not None:
+            return list(values) > list(self._watermark)
+        return values[0] != self._watermark[0] or hit.get('_id') not in self._seen
+
+    def _fetch(self):
+        frame, query = self._query()
+        hits = []
+        took = 0
+        pages = frame._scroll(query)
+        try:
+            for page in pages:
+                took += page.millis_taken
+                hits.extend(hit for hit in page._hits if self._is_new(hit))
+        finally:
+            pages.close()
+
+        for hit in hits:
+            values = hit['sort']
+            if self._watermark is None or values[0] != self._watermark[0]:
+                self._seen = set()
+            self._watermark = values
+            self._seen.add(hit.get('_id'))
+        return Select.from_dict({'took': took, 'hits': {'hits': hits}})
+
+    def fetch(self):
+        """
+        Fetches the documents which come after the high-water mark, and moves the mark to the last of them.
+
+        :return: :class:`RowSet <pandasticsearch.types.RowSet>`, empty when there is no new document
+        """
+        select = self._fetch()
+        return RowSet(select.columns, len(select))
+
+    def follow(self, interval=5.0, max_polls=None):
+        """
+        Polls for new documents every ``interval`` seconds, and yields them as they arrive.
+
+        :param float interval: The number of seconds between two polls
+        :param int max_polls: The number of polls after which to stop, or ``None`` to poll forever
+        :return: a generator of non-empty :class:`RowSet <pandasticsearch.types.RowSet>`
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            if polls:
+                time.sleep(interval)
+            rows = self.fetch()
+            polls += 1
+            if len(rows):
+                yield rows
+
+    def append_to(self, frame):
+        """
+        Fetches the new documents and appends them to a Pandas DataFrame.
+
+        :param frame: The Pandas DataFrame holding the documents fetched so far, or ``None``
+        :return: a new Pandas DataFrame
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+
+        select = self._fetch()
+        if len(select) == 0:
+            return frame
+        if frame is None or len(frame) == 0:
+            return select.to_pandas()
+        return pandas.concat([frame, select.to_pandas()], ignore_index=True)
@@ -1,12 +1,15 @@
 # -*- coding: UTF-8 -*-
 
 from pandasticsearch.operators import *
+from pandasticsearch.errors import DataFrameException, NoSuchDependencyException
+import collections
 import six
 
 
 class Column(object):
-    def __init__(self, field):
+    def __init__(self, field, frame=None):
         self._field = field
+        self._frame = frame
 
     def field_name(self):
         return self._field
@@ -33,10 +36,15 @@ class Column(object):
         """
         Returns a :class:`BooleanFilter <pandasticsearch.operators.BooleanFilter>`
 
+        Filtering the ``_id`` column is done with an ``ids`` query. When a list longer than 10000 values
+        has to hold, the documents are searched (or counted) chunk by chunk concurrently,
+        and the hits of the chunks are merged without duplicates.
+
         :param values:  A list of values to filter terms
         :return: :class:`BooleanFilter <pandasticsearch.operators.BooleanFilter>`
 
         df.filter(df.gender.isin(['male', 'female'])
+        df.filter(col('_id').isin(ids))
         """
         return IsIn(field=self._field, value=values)
 
@@ -265,6 +273,21 @@ class Column(object):
         """
         return MetricAggregator(self._field, 'extended_stats')
 
+    def distinct(self, batch_size=1000):
+        """
+        Returns the distinct values of the column among the documents of its DataFrame,
+        paging through a ``composite`` aggregation (ES >= 6.1).
+
+        :param int batch_size: The number of values fetched per request
+        :return: a list of the values in ascending order
+
+        >>> df.gender.distinct()
+        ['female', 'male']
+        """
+        if self._frame is None:
+            raise DataFrameException('Column is not bound to a DataFrame: [{0}]'.format(self._field))
+        return [key[self._field] for key, _ in self._frame._iter_values([self._field], batch_size)]
+
 
 class Row(tuple):
     """
@@ -313,3 +336,98 @@ class Row(tuple):
 
     def as_dict(self):
         return dict((x, y) for x, y in zip(self._fields, self))
+
+
+class RowSet(collections.Sequence):
+    """
+    The result type of :meth:`DataFrame.collect <pandasticsearch.dataframe.DataFrame.collect>`.
+    Values are kept in columns and each :class:`Row` is only built when it is accessed.
+    Fields missing in a document are ``None`` in its row.
+
+    >>> rows = df.collect()
+    >>> len(rows)
+    3
+    >>> rows[0]
+    Row(age=12,name='Alice')
+    >>> rows['age']
+    [12, 11, 13]
+    >>> rows[1:]
+    [Row(age=11,name='Bob'), Row(age=13,name='Leo')]
+    >>> rows.to_pandas()
+    """
+
+    def __init__(self, columns, length=None):
+        """
+        :param columns: An ordered dictionary mapping each column name to the list of its values
+        :param int length: Number of rows (default: the length of the columns)
+        """
+        self._columns = columns
+        if length is None:
+            length = len(next(iter(columns.values()))) if columns else 0
+        self._length = length
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        """
+        Creates a :class:`RowSet` from a list of dictionaries, one per row.
+        """
+        names = collections.OrderedDict()
+        for d in dicts:
+            for k in d:
+                names[k] = None
+        columns = collections.OrderedDict((n, [d.get(n) for d in dicts]) for n in names)
+        return cls(columns, len(dicts))
+
+    @property
+    def columns(self):
+        """
+        Returns all column names as a list.
+        """
+        return list(self._columns.keys())
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, item):
+        if isinstance(item, six.string_types):
+            return self._columns[item]
+        elif isinstance(item, slice):
+            length = len(range(*item.indices(self._length)))
+            return RowSet(collections.OrderedDict((k, v[item]) for k, v in six.iteritems(self._columns)), length)
+        elif isinstance(item, six.integer_types):
+            if not -self._length <= item < self._length:
+                raise IndexError('RowSet index out of range')
+            return Row(**dict((k, v[item]) for k, v in six.iteritems(self._columns)))
+        else:
+            raise TypeError('Unsupported index: [{0}]'.format(item))
+
+    def __iter__(self):
+        names = self.columns
+        if not names:
+            for _ in range(self._length):
+                yield Row()
+            return
+        for values in zip(*[self._columns[n] for n in names]):
+            yield Row(**dict(zip(names, values)))
+
+    def __eq__(self, other):
+        if isinstance(other, (RowSet, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __repr__(self):
+        return '[' + ', '.join(repr(row) for row in self) + ']'
+
+    def to_pandas(self):
+        """
+        Export to a Pandas DataFrame object, handing over the columns without building rows.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise NoSuchDependencyException('this method requires pandas library')
+        return pandas.DataFrame(data=self._columns, index=range(self._length))
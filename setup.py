@@ -5,6 +5,7 @@ with open('requirements.txt') as f:
 
 extras_require = {
     "pandas": ["pandas"],
+    "arrow": ["pyarrow"],
 }
 
 setup(
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+import json
+import unittest
+
+from mock import patch, Mock
+
+from pandasticsearch.client import RestClient
+from pandasticsearch.dataframe import DataFrame
+from pandasticsearch.errors import DataFrameException
+from pandasticsearch.types import Row
+
+
+def create_df():
+    mapping = {"index": {"mappings": {"doc_type": {"properties": {"a": {"type": "integer"},
+                                                              "b": {"type": "keyword"}}}}}}
+    return DataFrame(client=RestClient('http://localhost:9200', 'index/_search'), mapping=mapping)
+
+
+class TestBatch(unittest.TestCase):
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_batch(self, mock_urlopen):
+        bodies = []
+        results = {
+            'avg(a)': {'value': 12.0},
+            'b': {'buckets': [{'key': 'x', 'doc_count': 2}, {'key': 'y', 'doc_count': 1}]},
+            'max(a)': {'value': 20.0},
+        }
+
+        def urlopen(request):
+            body = json.loads(request.data.decode('utf-8'))
+            bodies.append(body)
+            aggregations = dict((name, results[name.split('_', 2)[-1]]) for name in body['aggregations'])
+            response = Mock()
+            response.read.return_value = json.dumps({'took': 1, 'aggregations': aggregations}).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        df = create_df()
+        filtered = df.filter(df.a > 10)
+        with filtered.batch() as b:
+            avg = b.agg(df.a.avg)
+            counts = b.groupby(df.b).count()
+            other = b.add(df.agg(df.a.max))
+            self.assertRaises(DataFrameException, lambda: avg.result)
+            self.assertEqual(len(bodies), 0)
+
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(sorted(bodies[0]['aggregations']), ['_batch0_avg(a)', '_batch1_b'])
+        self.assertEqual(bodies[0]['query'], {'filtered': {'filter': {'range': {'a': {'gt': 10}}}}})
+        self.assertEqual(list(bodies[1]['aggregations']), ['_batch0_max(a)'])
+        self.assertTrue('query' not in bodies[1])
+
+        self.assertEqual(avg.collect(), [Row(**{'avg(a)': 12.0})])
+        self.assertEqual(counts.collect(), [Row(doc_count=2), Row(doc_count=1)])
+        self.assertEqual(counts.to_pandas()['doc_count'].to_dict(), {('x',): 2, ('y',): 1})
+        self.assertEqual(other.to_pandas()['max(a)'].tolist(), [20.0])
+
+    def test_batch_rejects_selects(self):
+        df = create_df()
+        self.assertRaises(DataFrameException, df.batch().add, df.filter(df.a > 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,289 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch, Mock
+
+from pandasticsearch.client import RestClient
+from pandasticsearch.dataframe import DataFrame
+from pandasticsearch.cache import ContainmentCache, ResultCache, RollupCache, _divides, _implies
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipIf(pandas is None or pyarrow is None, 'requires pandas and pyarrow')
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_put_get(self):
+        cache = ResultCache(os.path.join(self.dir, 'cache'))
+        key = ResultCache.fingerprint({'query': {'size': 20}})
+        self.assertEqual(key, ResultCache.fingerprint({'query': {'size': 20}}))
+        self.assertNotEqual(key, ResultCache.fingerprint({'query': {'size': 10}}))
+
+        self.assertIsNone(cache.get(key))
+        frame = pandas.DataFrame({'a': [1, 2], 'b': ['x', None]})
+        self.assertTrue(cache.put(key, frame))
+        self.assertTrue(cache.get(key).equals(frame))
+
+        self.assertFalse(cache.put('objects', pandas.DataFrame({'a': [{'x': 1}, 'y']})))
+        self.assertIsNone(cache.get('objects'))
+
+        cache.clear()
+        self.assertIsNone(cache.get(key))
+
+    def test_eviction(self):
+        cache = ResultCache(self.dir)
+        frame = pandas.DataFrame({'a': list(range(100))})
+        cache.put('k1', frame)
+        size = os.path.getsize(os.path.join(self.dir, 'k1.arrow'))
+
+        cache.max_bytes = 2 * size
+        cache.put('k2', frame)
+        os.utime(os.path.join(self.dir, 'k1.arrow'), (0, 0))
+        os.utime(os.path.join(self.dir, 'k2.arrow'), (1, 1))
+        cache.get('k1')
+        cache.put('k3', frame)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['k1.arrow', 'k3.arrow'])
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_dataframe_cache(self, mock_urlopen):
+        mapping = {"people": {"mappings": {"doc": {"properties": {"a": {"type": "integer"}}}}}}
+        df = DataFrame(client=RestClient('http://localhost:9200', 'people/_search'), mapping=mapping,
+                       cache=ResultCache(self.dir))
+        stats = {'_all': {'primaries': {'docs': {'count': 2, 'deleted': 0},
+                                        'indexing': {'index_total': 2, 'delete_total': 0},
+                                        'refresh': {'total': 1, 'external_total': 1}}}}
+        hits = [{'_source': {'a': 1}}, {'_source': {'a': 2}}]
+        urls = []
+
+        def urlopen(request):
+            urls.append(request.full_url)
+            if '/_stats/' in request.full_url:
+                body = stats
+            else:
+                body = {'took': 1, 'hits': {'hits': hits}}
+            response = Mock()
+            response.read.return_value = json.dumps(body).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        filtered = df.filter(df.a > 0)
+        self.assertEqual(filtered.to_pandas()['a'].tolist(), [1, 2])
+        self.assertEqual(urls, ['http://localhost:9200/people/_stats/docs,indexing,refresh',
+                                'http://localhost:9200/people/_search'])
+
+        del urls[:]
+        self.assertEqual(filtered.to_pandas()['a'].tolist(), [1, 2])
+        self.assertEqual(urls, ['http://localhost:9200/people/_stats/docs,indexing,refresh'])
+
+        # another query, or a write to the index, misses the cache
+        del urls[:]
+        df.filter(df.a > 1).to_pandas()
+        stats['_all']['primaries']['indexing']['index_total'] = 3
+        filtered.to_pandas()
+        self.assertEqual(len(urls), 4)
+
+        # the write is only searched once refreshed
+        del urls[:]
+        filtered.to_pandas()
+        stats['_all']['primaries']['refresh']['external_total'] = 2
+        filtered.to_pandas()
+        self.assertEqual(len(urls), 3)
+
+        # an empty result is not cached
+        del hits[:]
+        self.assertIsNone(df.filter(df.a > 2).to_pandas())
+
+
+@unittest.skipIf(pandas is None, 'requires pandas')
+class TestContainmentCache(unittest.TestCase):
+    def test_implies(self):
+        self.assertTrue(_implies({'term': {'a': 1}}, {'term': {'a': 1}}))
+        self.assertTrue(_implies({'term': {'a': 1}}, {'terms': {'a': [1, 2]}}))
+        self.assertTrue(_implies({'terms': {'a': [2]}}, {'terms': {'a': [1, 2]}}))
+        self.assertFalse(_implies({'terms': {'a': [3]}}, {'terms': {'a': [1, 2]}}))
+        self.assertTrue(_implies({'range': {'a': {'gt': 5, 'lt': 8}}}, {'range': {'a': {'gte': 5}}}))
+        self.assertFalse(_implies({'range': {'a': {'gte': 5}}}, {'range': {'a': {'gt': 5}}}))
+        self.assertFalse(_implies({'range': {'a': {'lt': 8}}}, {'range': {'a': {'gte': 5}}}))
+        self.assertTrue(_implies({'range': {'ts': {'gte': '2016-11-28T12:00:00Z'}}},
+                                 {'range': {'ts': {'gte': '2016-11-28'}}}))
+        self.assertTrue(_implies({'term': {'a': 6}}, {'range': {'a': {'gte': 5}}}))
+        self.assertTrue(_implies({'prefix': {'a': 'abc'}}, {'prefix': {'a': 'ab'}}))
+        self.assertFalse(_implies({'term': {'b': 1}}, {'term': {'a': 1}}))
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_dataframe_containment(self, mock_urlopen):
+        mapping = {'people': {'mappings': {'doc': {'properties': {
+            'age': {'type': 'integer'}, 'name': {'type': 'keyword'}, 'day': {'type': 'keyword'},
+            'bio': {'type': 'text'}}}}}}
+        hits = [{'_index': 'people', '_id': str(i), '_source': source} for i, source in enumerate([
+            {'age': 12, 'name': 'Alice', 'day': 'mon', 'bio': 'Plays the Piano'},
+            {'age': 11, 'name': 'Bob', 'day': 'mon', 'bio': 'Paints'},
+            {'age': 13, 'name': 'Leo', 'day': 'mon', 'bio': 'Plays chess'}])]
+        responses = [mapping, {'took': 1, 'hits': {'total': 3, 'hits': hits}}]
+
+        def urlopen(request):
+            response = Mock()
+            response.read.return_value = json.dumps(responses.pop(0)).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        cache = ContainmentCache()
+        df = DataFrame.from_es(url='http://localhost:9200', index='people', containment_cache=cache)
+        day = df.filter(df.day == 'mon')
+        self.assertEqual(len(day.collect()), 3)
+        self.assertEqual(mock_urlopen.call_count, 2)
+
+        rows = df.filter((df.day == 'mon') & (df.age > 11)).sort(df.age.desc).select('name').collect()
+        self.assertEqual(rows['name'], ['Leo', 'Alice'])
+        self.assertEqual(rows['_index'], ['people', 'people'])
+        self.assertEqual(df.filter((df.day == 'mon') & df.name.isin(['Bob'])).limit(1).collect()['age'], [11])
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(cache.hits, 2)
+
+        # another day is searched
+        responses.append({'took': 1, 'hits': {'total': 0, 'hits': []}})
+        df.filter(df.day == 'tue').collect()
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+        # text fields are matched by their tokens on the cluster
+        responses.append({'took': 1, 'hits': {'total': 1, 'hits': hits[:1]}})
+        self.assertEqual(len(df.filter((df.day == 'mon') & (df.bio == 'piano')).collect()), 1)
+        self.assertEqual(mock_urlopen.call_count, 4)
+
+
+class TestRollupCache(unittest.TestCase):
+    def test_divides(self):
+        self.assertTrue(_divides('1m', '1h'))
+        self.assertTrue(_divides('15m', '1h'))
+        self.assertFalse(_divides('7m', '1h'))
+        self.assertTrue(_divides('hour', 'day'))
+        self.assertTrue(_divides('6h', 'month'))
+        self.assertTrue(_divides('day', 'week'))
+        self.assertFalse(_divides('week', 'month'))
+        self.assertTrue(_divides('month', 'year'))
+        self.assertFalse(_divides('day', 'hour'))
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_dataframe_rollup(self, mock_urlopen):
+        mapping = {'logs': {'mappings': {'doc': {'properties': {
+            'service': {'type': 'keyword'}, 'host': {'type': 'keyword'}, 'latency': {'type': 'integer'}}}}}}
+
+        def bucket(key, count, total):
+            return {'key': key, 'doc_count': count,
+                    'avg(latency)': {'count': count, 'min': 1, 'max': 9, 'avg': float(total) / count, 'sum': total},
+                    'max(latency)': {'value': 9}}
+
+        def level(name, buckets, values, missing=0):
+            return {name: {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': buckets},
+                    name + '#values': {'value': values}, name + '#missing': {'doc_count': missing}}
+
+        def service(key, hosts, missing=0):
+            count = sum(h['doc_count'] for h in hosts)
+            return dict(level('host', hosts, count - missing, missing), key=key, doc_count=count)
+
+        def result(total, services):
+            return {'took': 1, 'hits': {'total': total, 'hits': []},
+                    'aggregations': level('service', services, total)}
+
+        responses = [mapping, result(6, [service('api', [bucket('h1', 3, 30), bucket('h2', 1, 2)]),
+                                         service('web', [bucket('h1', 2, 4)])])]
+        queries = []
+
+        def urlopen(request):
+            if request.data:
+                queries.append(json.loads(request.data.decode('utf-8')))
+            response = Mock()
+            response.read.return_value = json.dumps(responses.pop(0)).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        cache = RollupCache()
+        df = DataFrame.from_es(url='http://localhost:9200', index='logs', rollup_cache=cache)
+        rows = df.groupby('service', 'host').agg(df.latency.avg, df.latency.max).collect()
+        self.assertEqual([v for v in rows['avg(latency)'] if v is not None], [10.0, 2.0, 2.0])
+        aggs = queries[0]['aggregations']['service']['aggregations']
+        self.assertEqual(aggs['host#missing'], {'missing': {'field': 'host'}})
+        self.assertEqual(aggs['host']['aggregations']['avg(latency)'], {'stats': {'field': 'latency'}})
+
+        hosts = df.groupby('host').agg(df.latency.avg).collect()
+        self.assertEqual(hosts['doc_count'], [5, 1])
+        self.assertEqual(hosts['avg(latency)'], [34 / 5.0, 2.0])
+        self.assertEqual(df.agg(df.latency.max).collect()['max(latency)'], [9])
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(cache.hits, 2)
+
+        # another filter is searched
+        responses.append({'took': 1, 'hits': {'total': 1, 'hits': []},
+                          'aggregations': level('host', [bucket('h2', 1, 2)], 1)})
+        df.filter(df.service == 'api').groupby('host').agg(df.latency.avg).collect()
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+        # a document without host and another one on two hosts add up, but are not rolled up
+        errors = df.filter(df.latency > 5)
+        responses.append(result(3, [service('api', [bucket('h1', 2, 14), bucket('h2', 1, 6)], missing=1)]))
+        errors.groupby('service', 'host').agg(df.latency.avg).collect()
+        responses.append({'took': 1, 'hits': {'total': 3, 'hits': []},
+                          'aggregations': level('host', [bucket('h1', 2, 14), bucket('h2', 1, 6)], 3)})
+        errors.groupby('host').agg(df.latency.avg).collect()
+        self.assertEqual(mock_urlopen.call_count, 5)
+
+        # distinct counts are neither rewritten as scripts nor cached
+        responses.append({'took': 1, 'hits': {'total': 6, 'hits': []},
+                          'aggregations': {'service': {'buckets': [{'key': 'api', 'doc_count': 4,
+                                                                    'cardinality(host)': {'value': 2}}]}}})
+        df.groupby('service').agg(df.host.cardinality).collect()
+        self.assertEqual(queries[-1]['aggregations']['service']['aggregations'],
+                         {'cardinality(host)': {'cardinality': {'field': 'host'}}})
+        self.assertEqual(cache.hits, 2)
+
+    def test_local_rollup(self):
+        frame = pandas.DataFrame({'service': ['api', 'api', 'web', 'web', 'api'],
+                                  'host': ['h1', 'h2', 'h1', None, 'h1'],
+                                  'latency': [1, 4, 9, 16, 25]})
+        cache = RollupCache()
+        df = DataFrame.from_pandas(frame, rollup_cache=cache)
+        plain = DataFrame.from_pandas(frame)
+
+        self.assertEqual(df.groupby('service').agg(df.latency.avg).to_pandas()['avg(latency)'].tolist(), [10.0, 12.5])
+        self.assertEqual(df.agg(df.latency.avg).collect()['avg(latency)'], [11.0])
+        self.assertEqual(cache.hits, 1)
+
+        # the document without host is missing from the buckets, which are not rolled up
+        df.groupby('service', 'host').agg(df.latency.avg).to_pandas()
+        hosts = df.groupby('host').agg(df.latency.avg).to_pandas()
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(hosts['avg(latency)'].tolist(),
+                         plain.groupby('host').agg(plain.latency.avg).to_pandas()['avg(latency)'].tolist())
+
+    def test_rollup_percentiles(self):
+        frame = pandas.DataFrame({'host': ['h{0}'.format(i % 2) for i in range(200)],
+                                  'latency': [i * i % 97 for i in range(200)]})
+        df = DataFrame.from_pandas(frame, rollup_cache=RollupCache())
+        plain = DataFrame.from_pandas(frame)
+
+        # the answers of the cluster are not changed by the cache
+        self.assertEqual(df.groupby('host').agg(df.latency.percentiles).to_pandas().to_dict(),
+                         plain.groupby('host').agg(plain.latency.percentiles).to_pandas().to_dict())
+        self.assertEqual(df.filter(df.latency > 10).agg(df.latency.percentiles).to_pandas().to_dict(),
+                         plain.filter(plain.latency > 10).agg(plain.latency.percentiles).to_pandas().to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
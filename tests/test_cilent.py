@@ -46,5 +46,14 @@ class TestClients(unittest.TestCase):
         mock_request_headers = mock_urlopen.call_args[0][0].headers
         self.assertEqual(expected_headers, mock_request_headers)
 
+    def test_with_endpoint(self):
+        client = RestClient('http://localhost:9200', 'people/_search').with_endpoint('_search/scroll')
+        self.assertEqual(client._prepare_url(), 'http://localhost:9200/_search/scroll')
+        client = RestClient('http://host:9200/v2/_search').with_endpoint('_search/scroll')
+        self.assertEqual(client._prepare_url(), 'http://host:9200/v2/_search/scroll')
+        client = RestClient('http://host:9200/es/').with_endpoint('people/_count')
+        self.assertEqual(client._prepare_url(), 'http://host:9200/es/people/_count')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,23 @@
 # -*- coding: UTF-8 -*-
 import unittest
 from mock import patch, Mock
+from six.moves import urllib
+import io
 import json
+import os
+import warnings
+import shutil
+import tempfile
+from pandasticsearch.client import RestClient
 from pandasticsearch.dataframe import DataFrame, Column
 from pandasticsearch.operators import *
+from pandasticsearch.types import Row, RowSet
+from pandasticsearch.errors import DataFrameException, ServerDefinedException
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 @patch('pandasticsearch.client.urllib.request.urlopen')
@@ -152,6 +166,669 @@ class TestDataFrame(unittest.TestCase):
                                                  'avg(a)': {'avg': {'field': 'a'}}}}
                                      }}}})
 
+    def test_sample(self):
+        df = create_df_from_es()
+        self.assertEqual(df.filter(df.a > 2).sample(n=5, seed=1).to_dict(),
+                         {'query': {'function_score': {
+                             'query': {'filtered': {'filter': {'range': {'a': {'gt': 2}}}}},
+                             'random_score': {'seed': 1},
+                             'boost_mode': 'replace'}},
+                          'size': 5})
+        self.assertEqual(df.sample(fraction=0.25).to_dict(),
+                         {'query': {'function_score': {'query': {'match_all': {}},
+                                                       'random_score': {},
+                                                       'boost_mode': 'replace'}},
+                          'min_score': 0.75,
+                          'size': 20})
+
+    def test_sample_agg(self):
+        df = create_df_from_es()
+        self.assertEqual(df.sample(n=100).groupby(df.a).agg(MetricAggregator('b', 'avg')).to_dict(),
+                         {'query': {'function_score': {'query': {'match_all': {}},
+                                                       'random_score': {},
+                                                       'boost_mode': 'replace'}},
+                          'aggregations': {'_sample': {
+                              'sampler': {'shard_size': 100},
+                              'aggregations': {'a': {'terms': {'field': 'a', 'size': 20},
+                                                     'aggregations': {'avg(b)': {'avg': {'field': 'b'}}}}}}},
+                          'size': 0})
+        self.assertEqual(df.sample(fraction=0.1, seed=7).agg(MetricAggregator('b', 'sum')).to_dict(),
+                         {'aggregations': {'_sample': {
+                             'random_sampler': {'probability': 0.1, 'seed': 7},
+                             'aggregations': {'sum(b)': {'sum': {'field': 'b'}}}}},
+                          'size': 0})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_collect(self, mock_urlopen):
+        df = create_df_from_es()
+        response = Mock()
+        response.read.return_value = json.dumps({
+            'took': 1,
+            'hits': {'hits': [{'_source': {'a': 1, 'b': 2}}, {'_source': {'a': 3}}]}
+        }).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        rows = df.collect()
+        self.assertTrue(isinstance(rows, RowSet))
+        self.assertEqual(rows['a'], [1, 3])
+        self.assertEqual(rows, [Row(a=1, b=2), Row(a=3, b=None)])
+
+    @patch('pandasticsearch.dataframe.sys.stdout')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_show(self, mock_urlopen, mock_stdout):
+        df = create_df_from_es()
+        response = Mock()
+        response.read.return_value = json.dumps({
+            'took': 3,
+            'hits': {'hits': [{'_source': {'a': 1}}, {'_source': {'a': 2}}]}
+        }).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        df.select('a').show(2)
+        body = json.loads(mock_urlopen.call_args[0][0].data.decode('utf-8'))
+        self.assertEqual(body, {'_source': {'excludes': [], 'includes': ['a']}, 'size': 2})
+        output = ''.join(c[0][0] for c in mock_stdout.write.call_args_list)
+        self.assertEqual(output, '+---+\n| a |\n+---+\n| 1 |\n| 2 |\n+---+\ntime: 3ms\n')
+
+    @patch('pandasticsearch.dataframe.sys.stdout')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_show_scroll(self, mock_urlopen, mock_stdout):
+        df = create_df_from_es()
+        pages = [{'took': 1, '_scroll_id': 's1', 'hits': {'hits': [{'_source': {'a': i}} for i in range(1000)]}}
+                 for _ in range(11)]
+        responses = []
+        for page in pages + [{}]:
+            response = Mock()
+            response.read.return_value = json.dumps(page).encode('utf-8')
+            responses.append(response)
+        mock_urlopen.side_effect = responses
+
+        df.show(10500)
+        requests = [c[0][0] for c in mock_urlopen.call_args_list]
+        self.assertEqual(len(requests), 12)
+        self.assertTrue(requests[0].full_url.endswith('xxx/_search?scroll=1m'))
+        self.assertEqual(json.loads(requests[0].data.decode('utf-8'))['size'], 1000)
+        self.assertTrue(requests[1].full_url.endswith('_search/scroll'))
+        self.assertEqual(requests[-1].get_method(), 'DELETE')
+        output = ''.join(c[0][0] for c in mock_stdout.write.call_args_list)
+        self.assertEqual(output.count('\n'), 10500 + 5)
+        self.assertTrue(output.endswith('time: 11ms\n'))
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_count(self, mock_urlopen):
+        df = create_df_from_es()
+        response = Mock()
+        response.read.return_value = json.dumps({'count': 42}).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        self.assertEqual(df.filter(df.a > 2).limit(5).count(), 42)
+        request = mock_urlopen.call_args[0][0]
+        self.assertTrue(request.full_url.endswith('xxx/_count'))
+        self.assertEqual(json.loads(request.data.decode('utf-8')),
+                         {'query': {'filtered': {'filter': {'range': {'a': {'gt': 2}}}}}})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_count_endpoint_in_url(self, mock_urlopen):
+        mapping = {'v2': {'mappings': {'doc_type': {'properties': {'a': {'type': 'integer'}}}}}}
+        df = DataFrame(client=RestClient('http://localhost:9200/v2/_search'), mapping=mapping, index='v2')
+        response = Mock()
+        response.read.return_value = json.dumps({'count': 42}).encode('utf-8')
+        mock_urlopen.return_value = response
+        self.assertEqual(df.count(), 42)
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url, 'http://localhost:9200/v2/_count')
+
+        # no index to count on, the documents are counted by a search
+        df = DataFrame(client=RestClient('http://localhost:9200/es/'), mapping=mapping, index='v2')
+        response.read.return_value = json.dumps({'took': 1, 'hits': {'total': 7, 'hits': []}}).encode('utf-8')
+        self.assertEqual(df.count(), 7)
+        request = mock_urlopen.call_args[0][0]
+        self.assertEqual(request.full_url, 'http://localhost:9200/es/')
+        self.assertEqual(json.loads(request.data.decode('utf-8')), {'size': 0})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_count_approximate(self, mock_urlopen):
+        df = create_df_from_es()
+        df._compat = 7
+        response = Mock()
+        response.read.return_value = json.dumps(
+            {'took': 1, 'hits': {'total': {'value': 100, 'relation': 'gte'}, 'hits': []}}).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        self.assertEqual(df.count(approximate=True, threshold=100), 100)
+        request = mock_urlopen.call_args[0][0]
+        self.assertTrue(request.full_url.endswith('xxx/_search'))
+        self.assertEqual(json.loads(request.data.decode('utf-8')), {'size': 0, 'track_total_hits': 100})
+
+    def test_count_grouped(self):
+        df = create_df_from_es()
+        self.assertEqual(df.groupby(df.a).count().to_dict(),
+                         {'aggregations': {'a': {'terms': {'field': 'a', 'size': 20}}}, 'size': 0})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_head(self, mock_urlopen):
+        df = create_df_from_es()
+        response = Mock()
+        response.read.return_value = json.dumps({
+            'took': 1,
+            'hits': {'hits': [{'_score': None, '_source': {'a': 3}}, {'_score': None, '_source': {'a': 4}}]}
+        }).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        rows = df.filter(df.a > 2).select('a').head(2)
+        self.assertEqual(rows, [Row(a=3), Row(a=4)])
+        self.assertEqual(json.loads(mock_urlopen.call_args[0][0].data.decode('utf-8')),
+                         {'query': {'filtered': {'filter': {'range': {'a': {'gt': 2}}}}},
+                          '_source': {'excludes': [], 'includes': ['a']},
+                          'sort': ['_doc'],
+                          'terminate_after': 2,
+                          'size': 2})
+
+        df._compat = 7
+        df.sort(df.a.asc).take(2)
+        self.assertEqual(json.loads(mock_urlopen.call_args[0][0].data.decode('utf-8')),
+                         {'_source': {'excludes': [], 'includes': ['a', 'b']},
+                          'sort': [{'a': {'order': 'asc'}}],
+                          'track_total_hits': False,
+                          'size': 2})
+
+    @unittest.skipIf(pyarrow is None, 'requires pyarrow')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_arrow(self, mock_urlopen):
+        df = create_df_from_es()
+        response = Mock()
+        response.read.return_value = json.dumps({
+            'took': 1,
+            'hits': {'hits': [{'_id': '1', '_source': {'a': 1}}, {'_id': '2', '_source': {'a': 2, 'b': 3}}]}
+        }).encode('utf-8')
+        mock_urlopen.return_value = response
+
+        table = df.to_arrow()
+        self.assertEqual(table.schema, pyarrow.schema([('a', pyarrow.int32()), ('b', pyarrow.int32())]))
+        self.assertEqual(table.to_pydict(), {'a': [1, 2], 'b': [None, 3]})
+
+    @unittest.skipIf(pyarrow is None, 'requires pyarrow')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_iter_arrow_batches(self, mock_urlopen):
+        df = create_df_from_es()
+        pages = [{'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {'a': 1}}, {'_source': {'a': 2}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {'a': 3, 'b': 4}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': []}},
+                 {}]
+        responses = []
+        for page in pages:
+            response = Mock()
+            response.read.return_value = json.dumps(page).encode('utf-8')
+            responses.append(response)
+        mock_urlopen.side_effect = responses
+
+        batches = list(df.select('a').iter_arrow_batches(batch_size=2))
+        self.assertEqual([b.num_rows for b in batches], [2, 1])
+        self.assertEqual(batches[0].schema, pyarrow.schema([('a', pyarrow.int32())]))
+        self.assertEqual(batches[1].to_pydict(), {'a': [3]})
+        self.assertEqual(json.loads(mock_urlopen.call_args_list[0][0][0].data.decode('utf-8'))['size'], 2)
+        self.assertEqual(mock_urlopen.call_args_list[-1][0][0].get_method(), 'DELETE')
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_pandas_flatten(self, mock_urlopen):
+        response = Mock()
+        response.read.return_value = json.dumps(
+            {'index': {'mappings': {'doc_type': {'properties': {
+                'a': {'type': 'integer'},
+                'o': {'properties': {'x': {'type': 'integer'}, 'y': {'properties': {'z': {'type': 'keyword'}}}}}}}}}}
+        ).encode('utf-8')
+        mock_urlopen.return_value = response
+        df = DataFrame.from_es(url='http://localhost:9200', index='xxx')
+        self.assertEqual(DataFrame._get_field_paths(df.schema), ['a', 'o.x', 'o.y.z'])
+
+        response.read.return_value = json.dumps({
+            'took': 1,
+            'hits': {'hits': [{'_source': {'a': 1, 'o': {'x': 2, 'y': [{'z': 'p'}, {'z': 'q'}]}}}]}
+        }).encode('utf-8')
+        pdf = df.select('o').to_pandas(flatten=True, arrays='explode')
+        self.assertEqual(list(pdf.columns), ['o.x', 'o.y.z'])
+        self.assertEqual(pdf['o.y.z'].tolist(), ['p', 'q'])
+        self.assertEqual(df.collect(flatten=True)['o.y.z'], [['p', 'q']])
+
+        # derived columns come in the fields of the hits
+        response.read.return_value = json.dumps({'took': 1, 'hits': {'hits': [
+            {'_source': {'o': {'x': 2}}, 'fields': {'c': [4]}},
+            {'_source': {'o': {'x': 3}}, 'fields': {'c': [6]}}]}}).encode('utf-8')
+        derived = df.with_column('c', "doc['o.x'].value * 2").select('o', 'c')
+        pdf = derived.to_pandas(flatten=True)
+        self.assertEqual(list(pdf.columns), ['o.x', 'o.y.z', 'c'])
+        self.assertEqual(pdf['c'].tolist(), [4, 6])
+        self.assertEqual(derived.collect(flatten=True, arrays='first')['c'], [4, 6])
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_fanout(self, mock_urlopen):
+        mapping = {"i1": {"mappings": {"doc_type": {"properties": {"a": {"type": "integer"}}}}},
+                   "i2": {"mappings": {"doc_type": {"properties": {"a": {"type": "integer"}}}}}}
+        results = {
+            'i1': {'took': 1, 'hits': {'hits': [{'_source': {'a': 1}, 'sort': [1]},
+                                                {'_source': {'a': 4}, 'sort': [4]}]}},
+            'i2': {'took': 1, 'hits': {'hits': [{'_source': {'a': 2}, 'sort': [2]}]}},
+        }
+
+        def urlopen(request):
+            url = request.full_url[len('http://localhost:9200/'):]
+            if url == 'i3/_search':
+                raise urllib.error.HTTPError(request.full_url, 500, 'error', {}, io.BytesIO(b'{"error": "boom"}'))
+            response = Mock()
+            if url.endswith('/_search'):
+                body = results[url.split('/')[0]]
+            else:
+                body = mapping
+            response.read.return_value = json.dumps(body).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        df = DataFrame.from_es(url='http://localhost:9200', index=['i1', 'i2', 'i3'])
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url, 'http://localhost:9200/i1,i2,i3')
+
+        sorted_df = df.sort(df.a.asc).limit(2)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            rows = sorted_df.collect()
+        self.assertEqual(rows['a'], [1, 2])
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(list(sorted_df.failures), ['i3'])
+        self.assertTrue(isinstance(sorted_df.failures['i3'], ServerDefinedException))
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_time_based_indexes(self, mock_urlopen):
+        mapping = {"logs-2016.11.29": {"mappings": {"doc": {"properties": {"ts": {"type": "date"}}}}}}
+        response = Mock()
+        response.read.return_value = json.dumps(mapping).encode('utf-8')
+        mock_urlopen.return_value = response
+        df = DataFrame.from_es(url='http://localhost:9200', index='logs-{yyyy.MM.dd}', time_field='ts')
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url, 'http://localhost:9200/logs-*')
+
+        response.read.return_value = json.dumps({'took': 1, 'hits': {'hits': []}}).encode('utf-8')
+        df.filter((df.ts >= '2016-11-28T12:00:00Z') & (df.ts < '2016-11-30')).collect()
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url,
+                         'http://localhost:9200/logs-2016.11.28,logs-2016.11.29,logs-2016.11.30/_search'
+                         '?ignore_unavailable=true')
+
+        df.filter(df.ts < '2016-11-30').collect()
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url,
+                         'http://localhost:9200/logs-*/_search?ignore_unavailable=true')
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_routing(self, mock_urlopen):
+        mapping = {"events": {"mappings": {"doc": {"properties": {"tenant": {"type": "keyword"},
+                                                                  "a": {"type": "integer"}}}}}}
+        response = Mock()
+        response.read.return_value = json.dumps(mapping).encode('utf-8')
+        mock_urlopen.return_value = response
+        df = DataFrame.from_es(url='http://localhost:9200', index='events', routing_field='tenant', preference='s1')
+
+        response.read.return_value = json.dumps({'took': 1, 'hits': {'hits': []}}).encode('utf-8')
+        df.filter((df.tenant == 'x') & (df.a > 1)).collect()
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url,
+                         'http://localhost:9200/events/_search?routing=x&preference=s1')
+
+        df.filter(df.tenant.isin(['y', 'x', 'z']) & df.tenant.isin(['x', 'y'])).collect()
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url,
+                         'http://localhost:9200/events/_search?routing=x%2Cy&preference=s1')
+
+        df.filter((df.tenant == 'x') | (df.a > 1)).collect()
+        self.assertEqual(mock_urlopen.call_args[0][0].full_url,
+                         'http://localhost:9200/events/_search?preference=s1')
+
+        response.read.return_value = json.dumps(mapping).encode('utf-8')
+        df = DataFrame.from_es(url='http://localhost:9200', index='events', preference=True)
+        self.assertEqual(df.filter(df.a > 1)._search_params(), df.limit(3)._search_params())
+
+    @patch('pandasticsearch.dataframe._max_terms', 2)
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_isin_chunks(self, mock_urlopen):
+        df = create_df_from_es()
+        requests = []
+
+        # the document 'd2' holds values of two chunks
+        docs = {'d1': [1], 'd2': [2, 3], 'd4': [4], 'd5': [5]}
+
+        def matches(clause, values):
+            if 'terms' in clause:
+                return bool(set(clause['terms']['a']) & set(values))
+            return matches(clause['bool']['must'][0], values) and \
+                not any(matches(c, values) for c in clause['bool']['must_not'])
+
+        def urlopen(request):
+            body = json.loads(request.data.decode('utf-8'))
+            requests.append((request.full_url, body))
+            clause = body['query']['filtered']['filter']['bool']['must'][0]
+            response = Mock()
+            if request.full_url.endswith('_count'):
+                result = {'count': len([d for d, v in docs.items() if matches(clause, v)])}
+            else:
+                values = clause['terms']['a']
+                # the document 'd3' matches two chunks
+                hits = [{'_index': 'xxx', '_id': 'd%d' % (3 if v == 5 else v), '_source': {'a': v}, 'sort': [v]}
+                        for v in sorted(values)]
+                result = {'took': 1, 'hits': {'hits': hits}}
+            response.read.return_value = json.dumps(result).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        chunked = df.filter(df.a.isin([5, 1, 4, 2, 3, 1]) & (df.b > 0))
+        rows = chunked.sort(df.a.asc).limit(4).collect()
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(sorted(body['query']['filtered']['filter']['bool']['must'][0]['terms']['a']
+                                for _, body in requests), [[3], [4, 2], [5, 1]])
+        self.assertEqual(rows['a'], [1, 2, 3, 4])
+
+        del requests[:]
+        self.assertEqual(chunked.count(), 4)
+        self.assertEqual(len(requests), 3)
+        chunks = [body['query']['filtered']['filter']['bool']['must'][0] for _, body in requests]
+        self.assertIn({'bool': {'must': [{'terms': {'a': [3]}}],
+                                'must_not': [{'terms': {'a': [5, 1]}}, {'terms': {'a': [4, 2]}}]}}, chunks)
+
+        self.assertEqual(df.filter(Column('_id').isin(['x', 'y'])).to_dict()['query'],
+                         {'filtered': {'filter': {'ids': {'values': ['x', 'y']}}}})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_join(self, mock_urlopen):
+        def create(index, props):
+            mapping = {index: {"mappings": {"doc": {"properties": dict((p, {"type": "keyword"}) for p in props)}}}}
+            return DataFrame(client=RestClient('http://localhost:9200', index + '/_search'), mapping=mapping)
+
+        orders = create('orders', ['id', 'amount', 'x'])
+        customers = create('customers', ['id', 'name', 'x'])
+        docs = {'orders': [{'id': 1, 'amount': 10, 'x': 'o1'}, {'id': 3, 'amount': 30, 'x': 'o2'},
+                           {'id': 1, 'amount': 11, 'x': 'o3'}, {'id': 4, 'amount': 40, 'x': 'o4'}],
+                'customers': [{'id': 1, 'name': 'Alice', 'x': 'c1'}, {'id': 2, 'name': 'Bob', 'x': 'c2'},
+                              {'id': 3, 'name': 'Leo', 'x': 'c3'}]}
+        searches = []
+
+        def urlopen(request):
+            url = request.full_url[len('http://localhost:9200/'):]
+            index = url.split('/')[0]
+            response = Mock()
+            if url.endswith('/_count'):
+                result = {'count': len(docs[index])}
+            elif '/_search?' in url:
+                searches.append((index, json.loads(request.data.decode('utf-8'))))
+                hits = [{'_source': d} for d in docs[index]]
+                result = {'took': 1, '_scroll_id': 's', 'hits': {'hits': hits}}
+            else:
+                result = {'took': 1, '_scroll_id': 's', 'hits': {'hits': []}}
+            response.read.return_value = json.dumps(result).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        joined = orders.join(customers, on='id')
+        self.assertEqual(list(joined.columns), ['amount', 'id', 'x_x', 'name', 'x_y'])
+        self.assertEqual(sorted(joined.values.tolist()),
+                         [[10, 1, 'o1', 'Alice', 'c1'], [11, 1, 'o3', 'Alice', 'c1'], [30, 3, 'o2', 'Leo', 'c3']])
+        # the customers are fetched first, and only their ids are searched for in the orders
+        self.assertEqual([index for index, _ in searches], ['customers', 'orders'])
+        self.assertEqual(searches[1][1]['query'], {'filtered': {'filter': {'terms': {'id': [1, 2, 3]}}}})
+
+        del searches[:]
+        joined = orders.join(customers.select('id', 'name'), on='id', how='outer')
+        self.assertEqual(list(joined.columns), ['amount', 'id', 'x', 'name'])
+        self.assertEqual(len(joined), 5)
+        self.assertEqual(joined[joined.id == 2]['name'].tolist(), ['Bob'])
+        self.assertEqual(joined[joined.id == 4]['amount'].tolist(), [40])
+        self.assertTrue('query' not in searches[1][1])
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_value_counts(self, mock_urlopen):
+        df = create_df_from_es()
+        values = {'a': [({'a': 1}, 1), ({'a': 2}, 3), ({'a': 3}, 1)],
+                  'b': [({'b': 7}, 5)]}
+        bodies = []
+
+        def urlopen(request):
+            body = json.loads(request.data.decode('utf-8'))
+            bodies.append(body)
+            aggregations = {}
+            for name, agg in body['aggregations'].items():
+                composite = agg['composite']
+                col = list(composite['sources'][0].keys())[0]
+                after = composite.get('after', {}).get(col, 0)
+                page = [b for b in values[col] if b[0][col] > after][:composite['size']]
+                aggregations[name] = {'buckets': [{'key': key, 'doc_count': n} for key, n in page]}
+            response = Mock()
+            response.read.return_value = json.dumps({'took': 1, 'aggregations': aggregations}).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        counts = df.filter(df.b > 1).value_counts(df.a, batch_size=2)
+        self.assertEqual(counts.to_dict(), {2: 3, 1: 1, 3: 1})
+        self.assertEqual(list(counts.index), [2, 1, 3])
+        self.assertEqual(counts.index.name, 'a')
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(bodies[0]['query'], {'filtered': {'filter': {'range': {'b': {'gt': 1}}}}})
+        self.assertEqual(bodies[1]['aggregations']['_values']['composite']['after'], {'a': 2})
+
+        del bodies[:]
+        self.assertEqual(df.a.distinct(batch_size=2), [1, 2, 3])
+
+        del bodies[:]
+        counts = df.value_counts('a', 'b', separate=True, batch_size=1)
+        self.assertEqual(list(counts), ['a', 'b'])
+        self.assertEqual(counts['b'].to_dict(), {7: 5})
+        self.assertEqual(counts['a'].to_dict(), {2: 3, 1: 1, 3: 1})
+        # the columns are paged through in the same requests until exhausted
+        self.assertEqual([sorted(body['aggregations']) for body in bodies],
+                         [['_values_0', '_values_1'], ['_values_0', '_values_1'], ['_values_0'], ['_values_0']])
+
+        self.assertRaises(DataFrameException, Column('a').distinct)
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_describe(self, mock_urlopen):
+        mapping = {"people": {"mappings": {"doc": {"properties": {
+            "age": {"type": "integer"}, "born": {"type": "date"}, "name": {"type": "keyword"}}}}}}
+        df = DataFrame(client=RestClient('http://localhost:9200', 'people/_search'), mapping=mapping)
+        results = {
+            'cardinality(age)': {'value': 3},
+            'extended_stats(age)': {'count': 3, 'min': 11.0, 'max': 13.0, 'avg': 12.0, 'sum': 36.0,
+                                    'variance': 2.0 / 3, 'std_deviation': 0.816},
+            'percentiles(age)': {'values': {'25.0': 11.5, '50.0': 12.0, '75.0': 12.5}},
+            'cardinality(born)': {'value': 2},
+            'extended_stats(born)': {'count': 2, 'min': 0, 'max': 86400000, 'avg': 43200000,
+                                     'variance': 86400000.0 ** 2 / 2, 'std_deviation': 61094025.9},
+            'percentiles(born)': {'values': [{'key': 25.0, 'value': 0}, {'key': 50.0, 'value': 43200000},
+                                             {'key': 75.0, 'value': 86400000}]},
+            'cardinality(name)': {'value': 2},
+            'value_count(name)': {'value': 3},
+        }
+
+        def urlopen(request):
+            body = json.loads(request.data.decode('utf-8'))
+            response = Mock()
+            response.read.return_value = json.dumps(
+                {'took': 1, 'aggregations': dict((k, results[k]) for k in body['aggregations'])}).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        described = df.describe()
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertEqual(list(described.columns), ['age', 'born'])
+        self.assertEqual(list(described.index), ['count', 'unique', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+        self.assertEqual(described['age'].tolist(), [3, 3, 12.0, 1.0, 11.0, 11.5, 12.0, 12.5, 13.0])
+        self.assertEqual(str(described['born']['max']), '1970-01-02 00:00:00+00:00')
+        self.assertEqual(str(described['born']['std']), '1 days 00:00:00')
+
+        described = df.describe(['name'], percentiles=[0.5])
+        self.assertEqual(described['name'].tolist()[:2], [3, 2])
+        self.assertEqual(list(described.index), ['count', 'unique', 'mean', 'std', 'min', '50%', 'max'])
+
+    def test_collapse(self):
+        df = create_df_from_es()
+        self.assertEqual(df.latest_by(df.a, 'b').limit(100).to_dict(),
+                         {'size': 100, 'sort': [{'b': {'order': 'desc'}}], 'collapse': {'field': 'a'}})
+        self.assertEqual(df.sort(df.b.asc).collapse('a').to_dict()['collapse'], {'field': 'a'})
+        self.assertRaises(DataFrameException, lambda: list(df.collapse('a').iter_pages()))
+
+        self.assertEqual(df.groupby('a').latest_by('b', 'b').to_dict()['aggregations'],
+                         {'a': {'terms': {'field': 'a', 'size': 20},
+                                'aggregations': {'b': {'terms': {'field': 'b', 'size': 20},
+                                                       'aggregations': {'top_hits(b)': {'top_hits': {
+                                                           'size': 1, 'sort': [{'b': {'order': 'desc'}}]}}}}}}})
+        self.assertEqual(df.groupby('a').latest_by('a', 'b').to_dict()['aggregations'],
+                         {'a': {'terms': {'field': 'a', 'size': 20},
+                                'aggregations': {'top_hits(a)': {'top_hits': {
+                                    'size': 1, 'sort': [{'b': {'order': 'desc'}}]}}}}})
+        self.assertRaises(DataFrameException, df.groupby('a').agg(df.b.max).latest_by, 'b', 'b')
+
+    def test_with_column(self):
+        df = create_df_from_es().with_column('c', "doc['a'].value * 2")
+        self.assertEqual(df.columns, ['a', 'b', 'c'])
+        self.assertEqual(df.select('a', 'c').to_dict(),
+                         {'size': 20, '_source': {'includes': ['a'], 'excludes': []},
+                          'script_fields': {'c': {'script': {'inline': "doc['a'].value * 2"}}}})
+        self.assertEqual(df.groupby('c').count().to_dict()['aggregations'],
+                         {'c': {'terms': {'script': {'inline': "doc['a'].value * 2"}, 'size': 20}}})
+
+        df = df.with_column('d', "emit(doc['b'].value)", type='long', runtime=True)
+        query = df.filter(df.d > 1).select('d').to_dict()
+        self.assertEqual(query['runtime_mappings'],
+                         {'d': {'type': 'long', 'script': {'inline': "emit(doc['b'].value)"}}})
+        self.assertEqual(query['fields'], ['d'])
+        self.assertEqual(query['_source'], False)
+        self.assertEqual(df.groupby('d').count().to_dict()['aggregations'],
+                         {'d': {'terms': {'field': 'd', 'size': 20}}})
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_runtime_column_requests(self, mock_urlopen):
+        df = create_df_from_es()
+        df._compat = 7
+        df = df.with_column('d', "emit(doc['b'].value)", type='long', runtime=True)
+        df = df.filter(df.d > 1)
+        runtime = {'d': {'type': 'long', 'script': {'source': "emit(doc['b'].value)"}}}
+        results = {'cardinality(d)': {'value': 2},
+                   'extended_stats(d)': {'count': 2, 'min': 2.0, 'max': 4.0, 'avg': 3.0, 'variance': 1.0},
+                   'percentiles(d)': {'values': {'50.0': 3.0}},
+                   '_values': {'buckets': [{'key': {'d': 2}, 'doc_count': 1}, {'key': {'d': 4}, 'doc_count': 1}]}}
+
+        def urlopen(request):
+            body = json.loads(request.data.decode('utf-8'))
+            response = Mock()
+            aggregations = dict((k, results[k]) for k in body.get('aggregations', {}))
+            response.read.return_value = json.dumps(
+                {'took': 1, 'hits': {'total': {'value': 2}, 'hits': []}, 'aggregations': aggregations}).encode('utf-8')
+            return response
+
+        mock_urlopen.side_effect = urlopen
+        self.assertEqual(df.count(), 2)
+        request = mock_urlopen.call_args[0][0]
+        self.assertTrue(request.full_url.endswith('xxx/_search'))
+        self.assertEqual(json.loads(request.data.decode('utf-8')),
+                         {'query': {'filtered': {'filter': {'range': {'d': {'gt': 1}}}}}, 'runtime_mappings': runtime,
+                          'size': 0, 'track_total_hits': True})
+
+        described = df.describe(['d'], percentiles=[0.5])
+        self.assertEqual(described['d'].tolist()[:3], [2, 2, 3.0])
+        self.assertEqual(json.loads(mock_urlopen.call_args[0][0].data.decode('utf-8'))['runtime_mappings'], runtime)
+
+        self.assertEqual(df.value_counts('d').to_dict(), {2: 1, 4: 1})
+        self.assertEqual(json.loads(mock_urlopen.call_args[0][0].data.decode('utf-8'))['runtime_mappings'], runtime)
+
+
+class TestDataFrameExport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _mock_pages(self, mock_urlopen):
+        pages = [{'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {'a': 1, 'b': [1, 2]}},
+                                                                  {'_source': {'a': 2}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {'a': 3, 'b': 4}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': []}},
+                 {}]
+        responses = []
+        for page in pages:
+            response = Mock()
+            response.read.return_value = json.dumps(page).encode('utf-8')
+            responses.append(response)
+        mock_urlopen.side_effect = responses
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_iter_pages_prefetch(self, mock_urlopen):
+        df = create_df_from_es()
+        self._mock_pages(mock_urlopen)
+        pages = list(df.iter_pages(batch_size=2, prefetch=2))
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual(pages[1].result, [{'a': 3, 'b': 4}])
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_iter_pages_prefetch_close(self, mock_urlopen):
+        df = create_df_from_es()
+        self._mock_pages(mock_urlopen)
+        pages = df.iter_pages(batch_size=2, prefetch=1)
+        self.assertEqual(len(next(pages)), 2)
+        pages.close()
+        self.assertEqual(mock_urlopen.call_args[0][0].get_method(), 'DELETE')
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_csv(self, mock_urlopen):
+        df = create_df_from_es()
+        self._mock_pages(mock_urlopen)
+        path = os.path.join(self.dir, 'out.csv')
+        df.to_csv(path, batch_size=2)
+        with open(path) as f:
+            self.assertEqual(f.read().splitlines(), ['a,b', '1,"[1, 2]"', '2,', '3,4'])
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_ndjson(self, mock_urlopen):
+        df = create_df_from_es()
+        self._mock_pages(mock_urlopen)
+        path = os.path.join(self.dir, 'out.json')
+        df.limit(2).to_ndjson(path, batch_size=2)
+        with open(path) as f:
+            self.assertEqual([json.loads(l) for l in f], [{'a': 1, 'b': [1, 2]}, {'a': 2}])
+        self.assertEqual(mock_urlopen.call_args[0][0].get_method(), 'DELETE')
+
+    @unittest.skipIf(pyarrow is None, 'requires pyarrow')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_parquet(self, mock_urlopen):
+        import pyarrow.parquet
+        df = create_df_from_es()
+        self._mock_pages(mock_urlopen)
+        path = os.path.join(self.dir, 'out.parquet')
+        df.select('a').to_parquet(path, batch_size=2)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.num_row_groups, 2)
+        self.assertEqual(parquet.read().to_pydict(), {'a': [1, 2, 3]})
+
+    @unittest.skipIf(pyarrow is None, 'requires pyarrow')
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_to_parquet_schema(self, mock_urlopen):
+        import pyarrow.parquet
+        mapping = {'logs': {'mappings': {'doc': {'properties': {
+            'ts': {'type': 'date'}, 'day': {'type': 'date', 'format': 'yyyy/MM/dd'},
+            'user': {'properties': {'name': {'type': 'keyword'}, 'age': {'type': 'integer'}}},
+            'geo': {'type': 'geo_point'}}}}}}
+        df = DataFrame(client=RestClient('http://localhost:9200', 'logs/_search'), mapping=mapping)
+        pages = [{'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {'ts': 1480392360000}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': [{'_source': {
+                     'ts': '2016-11-29T05:06:00+01:00', 'day': '2016/11/29', 'user': {'name': 'a', 'age': 3},
+                     'geo': {'lat': 1.5, 'lon': 2}}}]}},
+                 {'took': 1, '_scroll_id': 's', 'hits': {'hits': []}},
+                 {}]
+        responses = []
+        for page in pages:
+            response = Mock()
+            response.read.return_value = json.dumps(page).encode('utf-8')
+            responses.append(response)
+        mock_urlopen.side_effect = responses
+
+        # the first page holds neither object nor custom date, whose types are not inferred from it
+        path = os.path.join(self.dir, 'out.parquet')
+        df.to_parquet(path, batch_size=1)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.schema.field('ts').type, pyarrow.timestamp('ms', tz='UTC'))
+        self.assertEqual(table.schema.field('day').type, pyarrow.string())
+        self.assertEqual(table.column('user').to_pylist(), [None, {'age': 3, 'name': 'a'}])
+        self.assertEqual(table.column('geo').to_pylist(), [None, '{"lat": 1.5, "lon": 2}'])
+        self.assertEqual(table.column('ts').to_pylist()[0], table.column('ts').to_pylist()[1])
+
 
 if __name__ == '__main__':
     unittest.main()
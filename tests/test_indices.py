@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+import datetime
+import unittest
+
+from pandasticsearch.indices import IndexPattern, parse_date, time_bounds
+from pandasticsearch.operators import *
+
+
+class TestIndices(unittest.TestCase):
+    def test_index_pattern(self):
+        pattern = IndexPattern('logs-{yyyy.MM.dd}')
+        self.assertEqual(pattern.wildcard, 'logs-*')
+        self.assertEqual(pattern.indexes(datetime.datetime(2016, 11, 29, 12), datetime.datetime(2016, 12, 1)),
+                         ['logs-2016.11.29', 'logs-2016.11.30', 'logs-2016.12.01'])
+
+        monthly = IndexPattern('metrics-{yyyy.MM}-v1')
+        self.assertEqual(monthly.wildcard, 'metrics-*-v1')
+        self.assertEqual(monthly.indexes(datetime.datetime(2016, 11, 30), datetime.datetime(2017, 1, 2)),
+                         ['metrics-2016.11-v1', 'metrics-2016.12-v1', 'metrics-2017.01-v1'])
+
+        self.assertRaises(ValueError, IndexPattern, 'logs')
+
+    def test_parse_date(self):
+        now = datetime.datetime(2016, 11, 29, 4, 6)
+        self.assertEqual(parse_date('2016-11-29T04:06:00Z'), now)
+        self.assertEqual(parse_date('2016-11-29T05:06:00+01:00'), now)
+        self.assertEqual(parse_date('2016-11-29'), datetime.datetime(2016, 11, 29))
+        self.assertEqual(parse_date(datetime.date(2016, 11, 29)), datetime.datetime(2016, 11, 29))
+        self.assertEqual(parse_date(1480392360000), now)
+        self.assertEqual(parse_date('now-1d/d', now), datetime.datetime(2016, 11, 28))
+        self.assertEqual(parse_date('now-1M', now), datetime.datetime(2016, 10, 29, 4, 6))
+        self.assertEqual(parse_date('now/d', now, round_up=True),
+                         datetime.datetime(2016, 11, 29, 23, 59, 59, 999999))
+        self.assertIsNone(parse_date('yesterday'))
+
+    def test_time_bounds(self):
+        f = (Greater('ts', '2016-11-28') & Less('ts', '2016-11-30') & GreaterEqual('ts', '2016-11-29')).build()
+        self.assertEqual(time_bounds(f, 'ts'), (datetime.datetime(2016, 11, 29), datetime.datetime(2016, 11, 30)))
+
+        f = (Greater('ts', '2016-11-28') | Less('ts', '2016-11-30')).build()
+        self.assertEqual(time_bounds(f, 'ts'), (None, None))
+
+    def test_prune(self):
+        pattern = IndexPattern('logs-{yyyy.MM.dd}')
+        now = datetime.datetime(2016, 11, 30, 10)
+        f = (GreaterEqual('ts', 'now-1d/d') & Equal('level', 'error')).build()
+        self.assertEqual(pattern.prune(f, 'ts', now), 'logs-2016.11.29,logs-2016.11.30')
+        self.assertEqual(pattern.prune(Less('ts', 'now').build(), 'ts', now), 'logs-*')
+        self.assertEqual(pattern.prune(None, 'ts', now), 'logs-*')
+        # a year of daily indexes
+        self.assertEqual(pattern.prune(GreaterEqual('ts', 'now-1y').build(), 'ts', now), 'logs-*')
+        self.assertEqual(pattern.prune((Greater('ts', 'now') & Less('ts', 'now-1d')).build(), 'ts', now), 'logs-*')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+import time
+import unittest
+
+from pandasticsearch.iterators import BackgroundIterator, map_concurrently
+
+
+class TestIterators(unittest.TestCase):
+    def test_background_iterator(self):
+        it = BackgroundIterator(iter(range(10)), max_items=2)
+        self.assertEqual(list(it), list(range(10)))
+
+    def test_background_iterator_max_bytes(self):
+        it = BackgroundIterator(iter(['aa', 'bb', 'cc']), max_bytes=3)
+        self.assertEqual(next(it), 'aa')
+        time.sleep(0.05)
+        # 'bb' is buffered while 'cc' waits, as both would exceed 3 bytes
+        self.assertEqual(it._bytes, 2)
+        self.assertEqual(list(it), ['bb', 'cc'])
+
+    def test_background_iterator_error(self):
+        def items():
+            yield 1
+            raise ValueError('boom')
+
+        it = BackgroundIterator(items())
+        self.assertEqual(next(it), 1)
+        self.assertRaises(ValueError, next, it)
+
+    def test_background_iterator_close(self):
+        closed = []
+
+        def items():
+            try:
+                for x in range(100):
+                    yield x
+            finally:
+                closed.append(True)
+
+        it = BackgroundIterator(items(), max_items=1)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertEqual(closed, [True])
+        self.assertRaises(StopIteration, next, it)
+
+    def test_map_concurrently(self):
+        def fn(x):
+            if x == 2:
+                raise ValueError(x)
+            return x * 10
+
+        results = map_concurrently(fn, [1, 2, 3], max_workers=2)
+        self.assertEqual([r for r, _ in results], [10, None, 30])
+        self.assertEqual([e is None for _, e in results], [True, False, True])
+        self.assertTrue(isinstance(results[1][1][1], ValueError))
+
+
+if __name__ == '__main__':
+    unittest.main()
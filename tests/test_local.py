@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+import unittest
+
+from pandasticsearch.dataframe import DataFrame
+from pandasticsearch.errors import ServerDefinedException
+from pandasticsearch.local import LocalClient
+from pandasticsearch.operators import *
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+def create_df_from_pandas(compat=2):
+    frame = pandas.DataFrame({'name': ['Alice', 'Bob', 'Leo', 'Eve'],
+                              'age': [12, 11, 13, None],
+                              'gender': ['F', 'M', 'M', 'F'],
+                              'tags': [['a', 'b'], ['b'], [], ['c']],
+                              'ts': ['2016-11-28T01:00:00', '2016-11-28T05:00:00',
+                                     '2016-11-29T00:00:00', '2016-12-02T00:00:00']},
+                             index=['a', 'b', 'l', 'e'])
+    mapping = {'name': {'type': 'keyword'}, 'age': {'type': 'integer'}, 'gender': {'type': 'keyword'},
+               'tags': {'type': 'keyword'}, 'ts': {'type': 'date'}}
+    return DataFrame.from_pandas(frame, mapping, index='people', compat=compat)
+
+
+@unittest.skipIf(pandas is None, 'requires pandas')
+class TestLocalClient(unittest.TestCase):
+    def test_mapping(self):
+        frame = pandas.DataFrame({'a': [1], 'b': [1.5], 'c': ['x'], 'd': [True],
+                                  'e': pandas.to_datetime(['2016-11-28']), 'f': [['x', 'y']]})
+        properties = LocalClient(frame, endpoint='local').get()['local']['mappings']['_doc']['properties']
+        self.assertEqual(dict((k, v['type']) for k, v in properties.items()),
+                         {'a': 'long', 'b': 'double', 'c': 'keyword', 'd': 'boolean', 'e': 'date', 'f': 'keyword'})
+
+        df = create_df_from_pandas()
+        self.assertEqual(df.columns, ['age', 'gender', 'name', 'tags', 'ts'])
+        self.assertEqual(df.index, 'people/_doc')
+
+    def test_filter(self):
+        for compat in (2, 5, 7):
+            df = create_df_from_pandas(compat)
+
+            def names(frame):
+                return sorted(frame.select('name').to_pandas()['name'])
+
+            self.assertEqual(names(df.filter(df.age > 11)), ['Alice', 'Leo'])
+            self.assertEqual(names(df.filter(df.tags == 'b')), ['Alice', 'Bob'])
+            self.assertEqual(names(df.filter((df.age > 11) | (df.name == 'Eve'))), ['Alice', 'Eve', 'Leo'])
+            self.assertEqual(names(df.filter((df.age > 11) & ~(df.name == 'Leo'))), ['Alice'])
+            self.assertEqual(names(df.filter(df.name.isin(['Bob', 'Eve']))), ['Bob', 'Eve'])
+            self.assertEqual(names(df.filter(df.name.like('A*'))), ['Alice'])
+            self.assertEqual(names(df.filter(df.name.rlike('B.b|L.*'))), ['Bob', 'Leo'])
+            self.assertEqual(names(df.filter(df.name.startswith('E'))), ['Eve'])
+            self.assertEqual(names(df.filter(df.age.notnull)), ['Alice', 'Bob', 'Leo'])
+            self.assertEqual(names(df.filter(df.ts >= '2016-11-29')), ['Eve', 'Leo'])
+            self.assertEqual(df.filter(df.ts <= 'now-100y/d').count(), 0)
+            self.assertEqual(names(df.filter(IsIn('_id', ['a', 'e']))), ['Alice', 'Eve'])
+            self.assertEqual(df.filter(df.age < 13).count(), 2)
+
+        self.assertRaises(ServerDefinedException, df.filter(ScriptFilter('true')).collect)
+
+    def test_select(self):
+        df = create_df_from_pandas()
+        rows = df.sort(df.age.desc).select('name', 'age').limit(2).collect()
+        self.assertEqual([(row['name'], row['age']) for row in rows], [('Leo', 13), ('Alice', 12)])
+        self.assertEqual(rows[0]['_id'], 'l')
+        self.assertFalse('tags' in rows[0])
+
+        rows = df.sort(df.tags.asc).collect()
+        self.assertEqual(rows['name'], ['Alice', 'Bob', 'Eve', 'Leo'])
+
+        rows = df.latest_by('gender', 'ts').collect()
+        self.assertEqual(rows['name'], ['Eve', 'Leo'])
+
+    def test_scroll(self):
+        df = create_df_from_pandas()
+        pages = list(df.sort(df.ts.asc).iter_pages(batch_size=3))
+        self.assertEqual([len(page) for page in pages], [3, 1])
+        self.assertEqual(pages[1].result[0]['name'], 'Eve')
+        self.assertEqual(df._client._scrolls, {})
+
+        tail = df.tail('ts', since='2016-11-28T04:00:00')
+        self.assertEqual(tail.fetch()['name'], ['Bob', 'Leo', 'Eve'])
+        self.assertEqual(len(tail.fetch()), 0)
+
+    def test_aggregation(self):
+        df = create_df_from_pandas()
+        self.assertEqual(df.groupby(df.tags).count().to_pandas()['doc_count'].to_dict(),
+                         {('b',): 2, ('a',): 1, ('c',): 1})
+        agg = df.groupby(df.name).agg(df.age.max, df.age.avg).to_pandas()
+        self.assertEqual(agg['max(age)'].tolist()[:2], [12, 11])
+        self.assertEqual(list(agg.index)[-1], ('Leo',))
+        row = df.agg(df.age.sum, df.name.value_count, df.tags.cardinality).collect()[0]
+        self.assertEqual((row['sum(age)'], row['value_count(name)'], row['cardinality(tags)']), (36, 4, 3))
+        self.assertEqual(df.agg(df.age.stats).collect()[0]['avg'], 12)
+
+        ranges = df.groupby(df.age.ranges([0, 12, 20])).count().to_pandas()['doc_count']
+        self.assertEqual(ranges.tolist(), [1, 2])
+
+        days = df.groupby(df.ts.date_interval('day', format='yyyy-MM-dd')).count().to_pandas()['doc_count']
+        self.assertEqual(list(days.index), [('2016-11-28',), ('2016-11-29',), ('2016-11-30',),
+                                            ('2016-12-01',), ('2016-12-02',)])
+        self.assertEqual(days.tolist(), [2, 1, 0, 0, 1])
+
+        self.assertEqual(df.value_counts('tags', batch_size=2).to_dict(), {'b': 2, 'a': 1, 'c': 1})
+
+        described = df.describe(['age'], percentiles=(0.5,))
+        self.assertEqual(described['age'].tolist(), [3, 3, 12.0, 1.0, 11.0, 12.0, 13.0])
+
+    def test_bucket_aggregation(self):
+        client = create_df_from_pandas()._client
+        terms = client.post({'size': 0, 'aggs': {'x': {
+            'terms': {'field': 'tags', 'size': 2, 'order': {'age': 'desc'}},
+            'aggs': {'age': {'avg': {'field': 'age'}}, 'names': {'terms': {'field': 'name'}}}}}})
+        buckets = terms['aggregations']['x']['buckets']
+        self.assertEqual([(b['key'], b['age']['value']) for b in buckets], [('a', 12.0), ('b', 11.5)])
+        self.assertEqual([n['key'] for n in buckets[1]['names']['buckets']], ['Alice', 'Bob'])
+        self.assertEqual(terms['aggregations']['x']['sum_other_doc_count'], 1)
+
+        for interval, keys in [('week', ['2016-11-28']), ('month', ['2016-11-01', '2016-12-01']),
+                               ('quarter', ['2016-10-01']), ('2d', ['2016-11-27', '2016-11-29', '2016-12-01'])]:
+            dates = client.post({'size': 0, 'aggs': {'x': {'date_histogram': {
+                'field': 'ts', 'interval': interval, 'format': 'yyyy-MM-dd', 'min_doc_count': 1}}}})
+            self.assertEqual([b['key_as_string'] for b in dates['aggregations']['x']['buckets']], keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
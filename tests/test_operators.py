@@ -179,6 +179,20 @@ class TestOperators(unittest.TestCase):
                     }]
             })
 
+    def test_conjuncts(self):
+        f = (GreaterEqual('a', 2) & Less('a', 5) & (Less('b', 3) | Equal('c', 4))) & ~Equal('d', 1)
+        self.assertEqual(list(conjuncts(f.build())),
+                         [{'range': {'a': {'gte': 2}}}, {'range': {'a': {'lt': 5}}}])
+        self.assertEqual(list(conjuncts(Equal('c', 4).build())), [{'term': {'c': 4}}])
+
+    def test_substitute(self):
+        f = (IsIn('a', [1, 2, 3]) & Equal('b', 1)).build()
+        clause = list(conjuncts(f))[0]
+        self.assertEqual(substitute(f, clause, IsIn('a', [1]).build()),
+                         {'bool': {'must': [{'terms': {'a': [1]}}, {'term': {'b': 1}}]}})
+        self.assertEqual(f, {'bool': {'must': [{'terms': {'a': [1, 2, 3]}}, {'term': {'b': 1}}]}})
+        self.assertEqual(IsIn('_id', ['x']).build(), {'ids': {'values': ['x']}})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,14 @@
 # -*- coding: UTF-8 -*-
 import unittest
 
+from pandasticsearch.errors import ParseResultException
 from pandasticsearch.queries import Select, Agg
+from pandasticsearch.sketches import HyperLogLog
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 def create_hits():
@@ -43,6 +50,68 @@ class TestQueries(unittest.TestCase):
         self.assertIsNotNone(select.result)
         self.assertEqual(len(select.result[0]), 2)
 
+    def test_select_columns(self):
+        select = Select.from_dict({
+            'hits': {
+                'hits': [
+                    {'_id': '1', '_source': {'a': 1, 'b': 1}},
+                    {'_id': '2', '_source': {'a': 2}},
+                    {'_id': '3', '_source': {'b': 3, 'c': 3}},
+                ]
+            },
+            'took': 1
+        })
+        self.assertEqual(len(select), 3)
+        self.assertEqual(dict(select.columns), {'_id': ['1', '2', '3'],
+                                                'a': [1, 2, None],
+                                                'b': [1, None, 3],
+                                                'c': [None, None, 3]})
+        self.assertEqual(select.result[1], {'_id': '2', 'a': 2})
+        self.assertEqual(select.to_pandas()['c'].tolist()[2], 3)
+
+    @unittest.skipIf(pyarrow is None, 'requires pyarrow')
+    def test_select_to_arrow(self):
+        select = Select.from_dict({
+            'hits': {'hits': [{'_source': {'a': 1, 'd': 1480392360000, 's': 'x'}},
+                              {'_source': {'a': 2.0, 's': 'y'}}]},
+            'took': 1
+        })
+        table = select.to_arrow({'a': 'long', 'd': 'date', 's': 'keyword'})
+        self.assertEqual(table.column_names, ['a', 'd', 's'])
+        self.assertEqual(table.schema.field('a').type, pyarrow.int64())
+        self.assertEqual(table.schema.field('d').type, pyarrow.timestamp('ms', tz='UTC'))
+        self.assertEqual(table.column('a').to_pylist(), [1, 2])
+        self.assertEqual(table.column('s').to_pylist(), ['x', 'y'])
+
+    def test_select_flatten(self):
+        select = Select.from_dict({
+            'hits': {'hits': [
+                {'_id': '1', '_source': {'user': {'name': 'a', 'tags': ['x', 'y']},
+                                         'items': [{'sku': 1}, {'sku': 2}]}},
+                {'_id': '2', '_source': {'user': {'name': 'b'}, 'user.age': 3}},
+            ]},
+            'took': 1
+        })
+        paths = ['items.sku', 'user.age', 'user.name', 'user.tags']
+
+        rows = select.flatten(paths)
+        self.assertEqual(rows.columns, ['_id'] + paths)
+        self.assertEqual(rows['items.sku'], [[1, 2], None])
+        self.assertEqual(rows['user.age'], [None, 3])
+        self.assertEqual(rows['user.tags'], [['x', 'y'], None])
+
+        rows = select.flatten(paths, arrays='first')
+        self.assertEqual(rows['items.sku'], [1, None])
+        self.assertEqual(rows['user.tags'], ['x', None])
+
+        rows = select.flatten(paths, arrays='explode')
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows['_id'], ['1', '1', '1', '1', '2'])
+        self.assertEqual(rows['items.sku'], [1, 1, 2, 2, None])
+        self.assertEqual(rows['user.tags'], ['x', 'y', 'x', 'y', None])
+
+        self.assertRaises(ValueError, select.flatten, paths, 'bad')
+
     def test_agg_buckets(self):
         agg = Agg()
         agg._result_dict = {
@@ -191,6 +260,140 @@ class TestQueries(unittest.TestCase):
                                      ('b', 'x'),
                                      ('b', 'y')])
 
+    def test_agg_sampler(self):
+        agg = Agg.from_dict({
+            'took': 1,
+            'aggregations': {
+                '_sample': {
+                    'doc_count': 100,
+                    'agg_key': {
+                        'buckets': [
+                            {'key': 'a', 'f1': {'value': 1}, 'doc_count': 60},
+                            {'key': 'b', 'f1': {'value': 2}, 'doc_count': 40},
+                        ]
+                    }
+                }
+            }
+        })
+        self.assertEqual(agg.result, [{'f1': 1, 'doc_count': 60}, {'f1': 2, 'doc_count': 40}])
+        self.assertEqual(agg.index, [('a',), ('b',)])
+
+        agg = Agg.from_dict({'took': 1, 'aggregations': {'_sample': {'doc_count': 100, 'f1': {'value': 3}}}})
+        self.assertEqual(agg.result, [{'f1': 3, 'doc_count': 100}])
+
+    def test_select_merge(self):
+        r1 = {'took': 2, 'hits': {'hits': [{'_source': {'a': 5}, 'sort': [5]},
+                                          {'_source': {'a': 3}, 'sort': [3]},
+                                          {'_source': {}, 'sort': [None]}]}}
+        r2 = {'took': 4, 'hits': {'hits': [{'_source': {'a': 4}, 'sort': [4]},
+                                          {'_source': {'a': 1}, 'sort': [1]}]}}
+        select = Select.merge([r1, r2], [{'a': {'order': 'desc'}}], 4)
+        self.assertEqual(select.columns['a'], [5, 4, 3, 1])
+        self.assertEqual(select.millis_taken, 4)
+
+        select = Select.merge([r1, r2])
+        self.assertEqual(len(select), 5)
+
+    def test_agg_merge(self):
+        aggregations = {'g': {'terms': {'field': 'g', 'size': 2},
+                              'aggregations': {'avg(x)': {'avg': {'field': 'x'}},
+                                               'max(x)': {'max': {'field': 'x'}},
+                                               'sum(x)': {'sum': {'field': 'x'}}}}}
+        self.assertEqual(Agg.mergeable(aggregations)['g']['aggregations']['avg(x)'], {'stats': {'field': 'x'}})
+        self.assertEqual(aggregations['g']['aggregations']['avg(x)'], {'avg': {'field': 'x'}})
+
+        def bucket(key, count, total, mx):
+            return {'key': key, 'doc_count': count,
+                    'avg(x)': {'count': count, 'sum': total, 'min': 0, 'max': mx, 'avg': float(total) / count},
+                    'max(x)': {'value': mx},
+                    'sum(x)': {'value': total}}
+
+        r1 = {'took': 1, 'aggregations': {'g': {'buckets': [bucket('a', 2, 10, 6), bucket('b', 1, 3, 3)]}}}
+        r2 = {'took': 1, 'aggregations': {'g': {'buckets': [bucket('b', 3, 9, 4), bucket('c', 1, 1, 1)]}}}
+        agg = Agg.merge([r1, r2], aggregations)
+        self.assertEqual(agg.index, [('b',), ('a',)])
+        self.assertEqual(agg.result, [{'doc_count': 4, 'avg(x)': 3.0, 'max(x)': 4, 'sum(x)': 12},
+                                      {'doc_count': 2, 'avg(x)': 5.0, 'max(x)': 6, 'sum(x)': 10}])
+
+    def test_agg_merge_unsupported(self):
+        aggregations = {'cardinality(x)': {'cardinality': {'field': 'x'}}}
+        r = {'took': 1, 'aggregations': {'cardinality(x)': {'value': 3}}}
+        self.assertRaises(ParseResultException, Agg.merge, [r, r], aggregations)
+
+    def test_agg_merge_sketches(self):
+        aggregations = {'cardinality(x)': {'cardinality': {'field': 'x'}},
+                        'percentiles(y)': {'percentiles': {'field': 'y', 'percents': [50]}}}
+        mergeable = Agg.mergeable(aggregations)
+        self.assertEqual(sorted(mergeable), ['cardinality(x)', 'percentiles(y)', 'percentiles(y)#count'])
+        self.assertEqual(mergeable['cardinality(x)']['scripted_metric']['params'], {'field': 'x'})
+        self.assertTrue(50 in mergeable['percentiles(y)']['percentiles']['percents'])
+        self.assertEqual(mergeable['percentiles(y)#count'], {'value_count': {'field': 'y'}})
+
+        def result(values, low, high):
+            percentiles = dict((str(float(p)), low + (high - low) * p / 100.0) for p in (0, 25, 50, 75, 100))
+            return {'took': 1, 'aggregations': {
+                'cardinality(x)': {'value': HyperLogLog.from_values(values).registers},
+                'percentiles(y)': {'values': percentiles},
+                'percentiles(y)#count': {'value': 100}}}
+
+        results = [result(['a', 'b'], 0, 100), result(['b', 'c'], 100, 200)]
+        agg = Agg.merge(results, {'cardinality(x)': aggregations['cardinality(x)']})
+        self.assertEqual(agg.result, [{'cardinality(x)': 3}])
+        agg = Agg.merge(results, {'percentiles(y)': aggregations['percentiles(y)']})
+        self.assertEqual(list(agg.result[0]), ['50.0'])
+        self.assertTrue(abs(agg.result[0]['50.0'] - 100) < 5)
+
+    def test_agg_top_hits(self):
+        def top(device, ts):
+            return {'hits': {'hits': [{'_id': device + str(ts), '_source': {'device': device, 'ts': ts},
+                                       'sort': [ts]}]}}
+
+        aggregations = {'device': {'terms': {'field': 'device', 'size': 20},
+                                   'aggregations': {'top_hits(device)': {'top_hits': {
+                                       'size': 1, 'sort': [{'ts': {'order': 'desc'}}]}}}}}
+        r1 = {'took': 1, 'aggregations': {'device': {'buckets': [
+            {'key': 'a', 'doc_count': 3, 'top_hits(device)': top('a', 5)},
+            {'key': 'b', 'doc_count': 1, 'top_hits(device)': top('b', 2)}]}}}
+        r2 = {'took': 1, 'aggregations': {'device': {'buckets': [
+            {'key': 'a', 'doc_count': 1, 'top_hits(device)': top('a', 7)}]}}}
+
+        agg = Agg.from_dict(r1)
+        self.assertEqual(agg.index, [('a',), ('b',)])
+        self.assertEqual(agg.result, [{'doc_count': 3, 'device': 'a', 'ts': 5},
+                                      {'doc_count': 1, 'device': 'b', 'ts': 2}])
+
+        agg = Agg.merge([r1, r2], aggregations)
+        self.assertEqual(agg.result, [{'doc_count': 4, 'device': 'a', 'ts': 7},
+                                      {'doc_count': 1, 'device': 'b', 'ts': 2}])
+
+    def test_select_merge_collapse(self):
+        def hit(device, ts):
+            return {'_index': 'i', '_id': device + str(ts), '_source': {'device': device, 'ts': ts},
+                    'fields': {'device': [device]}, 'sort': [ts]}
+
+        r1 = {'took': 1, 'hits': {'hits': [hit('a', 9), hit('b', 4)]}}
+        r2 = {'took': 1, 'hits': {'hits': [hit('b', 8), hit('c', 6), hit('a', 1)]}}
+        select = Select.merge([r1, r2], [{'ts': {'order': 'desc'}}], 20, collapse='device')
+        self.assertEqual([(row['device'], row['ts']) for row in select.result], [('a', 9), ('b', 8), ('c', 6)])
+
+    def test_select_script_fields(self):
+        select = Select.from_dict({'took': 1, 'hits': {'hits': [
+            {'_source': {'a': 1}, 'fields': {'c': [2]}},
+            {'_source': {'a': 2}, 'fields': {'c': [4, 5]}}]}})
+        self.assertEqual(select.result, [{'a': 1, 'c': [2]}, {'a': 2, 'c': [4, 5]}])
+        self.assertEqual(select.columns['c'], [[2], [4, 5]])
+
+        select = Select.from_dict({'took': 1, 'hits': {'hits': [
+            {'_source': {'a': 1}, 'fields': {'c': [2]}},
+            {'_source': {'a': 2}, 'fields': {'c': []}}]}})
+        self.assertEqual(select.columns['c'], [2, None])
+
+        # the collapse key is returned in both sections
+        select = Select.from_dict({'took': 1, 'hits': {'hits': [
+            {'_source': {'a': 1}, 'fields': {'a': [1]}},
+            {'_source': {'a': 2}, 'fields': {'a': [2]}}]}})
+        self.assertEqual(select.columns['a'], [1, 2])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+import unittest
+
+from pandasticsearch.sketches import HyperLogLog, TDigest, _hash
+
+
+class TestSketches(unittest.TestCase):
+    def test_hash(self):
+        # the Java hash codes mixed by the MurmurHash3 finalizer
+        self.assertEqual(_hash(''), 0)
+        self.assertEqual(_hash(97), _hash('97'))
+        self.assertEqual(_hash(True), _hash('true'))
+        self.assertNotEqual(_hash('a'), _hash('b'))
+
+    def test_hyperloglog(self):
+        hll = HyperLogLog.from_values(['a', 'b', ['a', 'c'], None])
+        self.assertEqual(hll.cardinality(), 3)
+
+        left = HyperLogLog.from_values(range(0, 30000))
+        right = HyperLogLog.from_values(range(20000, 50000))
+        estimate = left.merge(right).cardinality()
+        self.assertTrue(abs(estimate - 50000) < 50000 * 0.05, estimate)
+
+        same = HyperLogLog.from_registers(left.registers)
+        self.assertEqual(same.precision, 12)
+        self.assertEqual(same.cardinality(), left.cardinality())
+        self.assertRaises(ValueError, left.merge, HyperLogLog(10))
+
+    def test_hyperloglog_scripted_metric(self):
+        body = HyperLogLog.scripted_metric('x', precision=10)['scripted_metric']
+        self.assertEqual(body['params'], {'field': 'x'})
+        self.assertEqual(body['init_script'], 'state.registers = new int[1024];')
+        body = HyperLogLog.scripted_metric('x', compat=5)['scripted_metric']
+        self.assertEqual(body['combine_script'], 'return params._agg.registers;')
+
+    def test_tdigest(self):
+        digest = TDigest.from_values(range(1, 101)).merge(TDigest.from_values(range(101, 201)))
+        self.assertEqual(digest.count, 200)
+        self.assertEqual(digest.percentile(50), 100.5)
+        self.assertEqual(digest.percentile(0), 1)
+        self.assertEqual(digest.percentile(100), 200)
+        self.assertEqual(TDigest().quantile(0.5), None)
+
+        digest = TDigest.from_values(x % 1000 for x in range(20000))
+        self.assertTrue(abs(digest.quantile(0.9) - 900) < 10)
+
+    def test_tdigest_from_percentiles(self):
+        low = TDigest.from_percentiles({'0.0': 0, '50.0': 50, '100.0': 100}, 100)
+        high = TDigest.from_percentiles([{'key': 0.0, 'value': 100}, {'key': 100.0, 'value': 200}], 100)
+        merged = low.merge(high)
+        self.assertEqual(merged.count, 200)
+        self.assertTrue(abs(merged.percentile(50) - 100) < 5)
+        self.assertEqual(merged.percentile(100), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
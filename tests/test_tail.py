@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+import json
+import unittest
+
+from mock import patch, Mock
+
+from pandasticsearch.client import RestClient
+from pandasticsearch.dataframe import DataFrame
+from pandasticsearch.operators import conjuncts
+
+
+class TestTail(unittest.TestCase):
+    def setUp(self):
+        mapping = {"logs": {"mappings": {"doc": {"properties": {"ts": {"type": "long"},
+                                                                "msg": {"type": "keyword"}}}}}}
+        self.df = DataFrame(client=RestClient('http://localhost:9200', 'logs/_search'), mapping=mapping)
+        self.docs = [('d1', 1, 'a'), ('d2', 2, 'b'), ('d3', 2, 'c')]
+        self.bodies = []
+
+    def urlopen(self, request):
+        response = Mock()
+        result = {}
+        if request.full_url.endswith('_search/scroll'):
+            result = {'took': 1, '_scroll_id': 's', 'hits': {'hits': []}}
+        elif request.get_method() == 'POST':
+            body = json.loads(request.data.decode('utf-8'))
+            self.bodies.append(body)
+            ranges = [c['range']['ts'] for c in conjuncts(body['query']['filtered']['filter']) if 'range' in c]
+            since = max([r['gte'] for r in ranges if 'gte' in r] or [0])
+            until = min([r['lt'] for r in ranges if 'lt' in r] or [100])
+            hits = [{'_id': _id, '_source': {'ts': ts, 'msg': msg}, 'sort': [ts]}
+                    for _id, ts, msg in sorted(self.docs, key=lambda d: d[1]) if since <= ts < until]
+            result = {'took': 1, '_scroll_id': 's', 'hits': {'hits': hits}}
+        response.read.return_value = json.dumps(result).encode('utf-8')
+        return response
+
+    @patch('pandasticsearch.client.urllib.request.urlopen')
+    def test_fetch(self, mock_urlopen):
+        mock_urlopen.side_effect = self.urlopen
+        tail = self.df.filter(self.df.msg != 'z').tail('ts')
+
+        self.assertEqual(tail.fetch()['msg'], ['a', 'b', 'c'])
+        self.assertEqual(tail.watermark, [2])
+        self.assertEqual(self.bodies[0]['sort'], [{'ts': {'order': 'asc'}}])
+        self.assertEqual(self.bodies[0]['query']['filtered']['filter']['bool']['must'][1],
+                         {'exists': {'field': 'ts'}})
+
+        self.assertEqual(len(tail.fetch()), 0)
+        self.docs.extend([('d4', 2, 'd'), ('d5', 3, 'e')])
+        self.assertEqual(tail.fetch()['msg'], ['d', 'e'])
+        self.assertEqual(self.bodies[-1]['query']['filtered']['filter']['bool']['must'][1],
+                         {'range': {'ts': {'gte': 2}}})
+
+        self.docs.append(('d6', 4, 'f'))
+        batches = list(tail.follow(interval=0, max_polls=3))
+        self.assertEqual([rows['msg'] for rows in batches], [['f']])
+
+        mapping = {"logs": {"mappings": {"doc": {"properties": {"ts": {"type": "date", "format": "yyyy/MM/dd"}}}}}}
+        tail = DataFrame(client=RestClient('http://localhost:9200', 'logs/_search'), mapping=mapping).tail('ts')
+        tail.fetch()
+        self.assertEqual(tail._query()[1]['query']['filtered']['filter'],
+                         {'range': {'ts': {'gte': 4, 'format': 'epoch_millis'}}})
+
+        pdf = self.df.tail('ts', since=2).append_to(self.df.filter(self.df.ts < 2).to_pandas())
+        self.assertEqual(pdf['msg'].tolist(), ['a', 'b', 'c', 'd', 'e', 'f'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@
 import unittest
 
 from pandasticsearch.operators import *
-from pandasticsearch.types import Row, Column
+import collections
+
+from pandasticsearch.types import Row, RowSet, Column
 
 
 class TestSchema(unittest.TestCase):
@@ -14,6 +16,30 @@ class TestSchema(unittest.TestCase):
         self.assertEqual(row['b'], '你好,世界')
         self.assertEqual(row.as_dict(), {'a': 1, 'b': '你好,世界'})
 
+    def test_rowset(self):
+        rows = RowSet(collections.OrderedDict([('a', [1, 2, 3]), ('b', ['x', None, 'z'])]))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows.columns, ['a', 'b'])
+        self.assertEqual(rows['a'], [1, 2, 3])
+        self.assertEqual(rows[0], Row(a=1, b='x'))
+        self.assertEqual(rows[-1].as_dict(), {'a': 3, 'b': 'z'})
+        self.assertEqual(rows[1:], [Row(a=2, b=None), Row(a=3, b='z')])
+        self.assertEqual(len(rows[1:]), 2)
+        self.assertEqual(list(rows), [Row(a=1, b='x'), Row(a=2, b=None), Row(a=3, b='z')])
+        self.assertRaises(IndexError, lambda: rows[3])
+        self.assertRaises(KeyError, lambda: rows['c'])
+
+    def test_rowset_from_dicts(self):
+        rows = RowSet.from_dicts([{'a': 1}, {'b': 2}])
+        self.assertEqual(rows.columns, ['a', 'b'])
+        self.assertEqual(rows['b'], [None, 2])
+
+    def test_rowset_to_pandas(self):
+        rows = RowSet(collections.OrderedDict([('a', [1, 2]), ('b', ['x', 'y'])]))
+        pdf = rows[1:].to_pandas()
+        self.assertEqual(list(pdf.columns), ['a', 'b'])
+        self.assertEqual(pdf['b'].tolist(), ['y'])
+
     def test_column(self):
         col = Column('b')
         self._assert_equal_filter(col > 2, Greater('b', 2))